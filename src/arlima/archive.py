@@ -0,0 +1,171 @@
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Generator
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from arlima.fm import ARCHIVE
+
+SCHEMA = pa.schema(
+    [
+        ("link", pa.string()),
+        ("fetched_at", pa.timestamp("us", tz="UTC")),
+        ("status", pa.int32()),
+        ("digest", pa.string()),
+        ("content", pa.binary()),
+    ]
+)
+
+# Raw bytes buffered before each row group is compressed and written
+ROW_GROUP_BYTES = 32 * 2**20
+
+
+class ArchiveWriter:
+    """Append the pages downloaded by one crawl to a zstd-compressed Parquet
+    file, safe to call from several threads.
+
+    The file is written under a temporary name and only takes its own when
+    the writer is closed, so that readers never see a crawl half-written. A
+    crawl that fails inside the writer's `with` block leaves no file.
+
+    Args:
+        path (Path): The crawl's Parquet file.
+        row_group_bytes (int, optional): Raw bytes buffered before each row
+            group is written. Defaults to ROW_GROUP_BYTES.
+    """
+
+    def __init__(self, path: Path, row_group_bytes: int = ROW_GROUP_BYTES) -> None:
+        self.path = path
+        self.tmp = path.with_suffix(".parquet.tmp")
+        self.row_group_bytes = row_group_bytes
+        self.writer = pq.ParquetWriter(self.tmp, SCHEMA, compression="zstd")
+        self.rows = []
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def add(self, link: str, status: int, content: bytes) -> None:
+        row = (
+            link,
+            time.time_ns() // 1000,
+            status,
+            hashlib.sha256(content).hexdigest(),
+            content,
+        )
+        with self.lock:
+            self.rows.append(row)
+            self.size += len(content)
+            if self.size >= self.row_group_bytes:
+                self.flush()
+
+    def flush(self) -> None:
+        if self.rows:
+            columns = [list(column) for column in zip(*self.rows)]
+            self.writer.write_table(pa.Table.from_arrays(columns, schema=SCHEMA))
+            self.rows = []
+            self.size = 0
+
+    def close(self) -> None:
+        with self.lock:
+            self.flush()
+            self.writer.close()
+        os.replace(self.tmp, self.path)
+
+    def abort(self) -> None:
+        """Close the writer and drop what it wrote."""
+
+        with self.lock:
+            self.writer.close()
+        self.tmp.unlink(missing_ok=True)
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class PageArchive:
+    """The raw pages of past crawls, one zstd-compressed Parquet file per
+    crawl, from which the tables can be rebuilt without going to the network.
+
+    Examples:
+        >>> import tempfile
+        >>> archive = PageArchive(Path(tempfile.mkdtemp()))
+        >>> with archive.writer("first") as writer:
+        ...     writer.add("a.html", 200, b"<html>old</html>")
+        ...     writer.add("b.html", 200, b"<html>b</html>")
+        >>> with archive.writer("second") as writer:
+        ...     writer.add("a.html", 200, b"<html>new</html>")
+        ...     writer.add("c.html", 404, b"")
+        >>> sorted(archive.pages())
+        [('a.html', b'<html>new</html>'), ('b.html', b'<html>b</html>')]
+
+    Args:
+        root (Path, optional): Directory of the archive. Defaults to ARCHIVE.
+    """
+
+    def __init__(self, root: Path = ARCHIVE) -> None:
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def writer(self, run_id: str) -> ArchiveWriter:
+        return ArchiveWriter(self.root.joinpath(run_id + ".parquet"))
+
+    def files(self) -> list[str]:
+        return sorted(str(path) for path in self.root.glob("*.parquet"))
+
+    def latest(self, conn: duckdb.DuckDBPyConnection) -> duckdb.DuckDBPyRelation:
+        """The most recent successful download of each page."""
+
+        conn.execute(
+            "CREATE OR REPLACE TEMP TABLE latest AS "
+            "SELECT link, max(fetched_at) AS fetched_at "
+            "FROM read_parquet(?) WHERE status IN (200, 304) GROUP BY link",
+            [self.files()],
+        )
+        # The small table of the latest fetch times is the join's build side,
+        # so the pages' contents stream through without being held at once
+        return conn.sql(
+            "SELECT a.link, a.content "
+            "FROM read_parquet(?) a "
+            "SEMI JOIN latest l ON a.link = l.link AND a.fetched_at = l.fetched_at "
+            "WHERE a.status IN (200, 304)",
+            params=[self.files()],
+        )
+
+    def count(self) -> int:
+        if not self.files():
+            return 0
+        with duckdb.connect() as conn:
+            return conn.execute(
+                "SELECT count(DISTINCT link) FROM read_parquet(?) "
+                "WHERE status IN (200, 304)",
+                [self.files()],
+            ).fetchone()[0]
+
+    def pages(self, batch_size: int = 256) -> Generator[tuple[str, bytes], None, None]:
+        """Stream the latest content of each archived page, `batch_size` pages
+        at a time.
+
+        Yields:
+            Generator[tuple[str, bytes], None, None]: The page's URL and its
+                raw content.
+        """
+
+        if not self.files():
+            return
+        with duckdb.connect() as conn:
+            reader = self.latest(conn).fetch_arrow_reader(batch_size)
+            for batch in reader:
+                yield from zip(
+                    batch.column("link").to_pylist(),
+                    batch.column("content").to_pylist(),
+                )
@@ -0,0 +1,163 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from arlima.fm import CACHE
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    digest: str
+    status: int
+    fetched_at: float
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+class ResponseCache:
+    """Content-addressed store of downloaded pages.
+
+    Each URL's entry (validators and fetch time) is a small JSON file under
+    `entries/`, and points by SHA-256 to its gzipped body under `objects/`, so
+    pages with identical content are stored once.
+
+    Examples:
+        >>> cache = ResponseCache(root=Path(tempfile.mkdtemp()))
+        >>> url = "https://www.arlima.net/a.html"
+        >>> entry = cache.put(url, b"<html/>", {"ETag": '"1"'})
+        >>> cache.read(cache.get(url))
+        b'<html/>'
+        >>> cache.validators(entry)
+        {'If-None-Match': '"1"'}
+
+    Args:
+        root (Path, optional): Directory of the cache. Defaults to CACHE.
+        max_age (float | None, optional): Seconds during which a cached page is
+            used without asking the server whether it changed. Defaults to None,
+            always revalidating.
+        offline (bool, optional): Never go to the network; pages missing from
+            the cache are treated as failed downloads. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        root: Path = CACHE,
+        max_age: float | None = None,
+        offline: bool = False,
+    ) -> None:
+        self.root = root
+        self.max_age = max_age
+        self.offline = offline
+        self.entries_dir = root.joinpath("entries")
+        self.objects_dir = root.joinpath("objects")
+        self.entries_dir.mkdir(parents=True, exist_ok=True)
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _write(path: Path, data: bytes) -> None:
+        # Write then rename, so concurrent readers never see a partial file
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _entry_path(self, url: str) -> Path:
+        key = hashlib.sha1(url.encode()).hexdigest()
+        return self.entries_dir.joinpath(key[:2], key + ".json")
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects_dir.joinpath(digest[:2], digest + ".gz")
+
+    def get(self, url: str) -> CacheEntry | None:
+        path = self._entry_path(url)
+        try:
+            return CacheEntry(**json.loads(path.read_bytes()))
+        except FileNotFoundError:
+            return
+
+    def read(self, entry: CacheEntry) -> bytes:
+        return gzip.decompress(self._object_path(entry.digest).read_bytes())
+
+    def put(
+        self, url: str, content: bytes, headers: dict, status: int = 200
+    ) -> CacheEntry:
+        digest = hashlib.sha256(content).hexdigest()
+        object_path = self._object_path(digest)
+        if not object_path.exists():
+            self._write(object_path, gzip.compress(content))
+        entry = CacheEntry(
+            url=url,
+            digest=digest,
+            status=status,
+            fetched_at=time.time(),
+            etag=headers.get("ETag"),
+            last_modified=headers.get("Last-Modified"),
+        )
+        self.save(entry)
+        return entry
+
+    def save(self, entry: CacheEntry) -> None:
+        self._write(self._entry_path(entry.url), json.dumps(asdict(entry)).encode())
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        if self.max_age is None:
+            return False
+        return time.time() - entry.fetched_at < self.max_age
+
+    def lookup(self, url: str) -> tuple[CacheEntry | None, bytes | None]:
+        """Find a URL's entry, and its content if it can be used without
+        asking the server.
+
+        Args:
+            url (str): The page's URL.
+
+        Returns:
+            tuple[CacheEntry | None, bytes | None]: The entry, if cached, and
+                the content, if fresh or offline.
+        """
+
+        entry = self.get(url)
+        if entry and (self.offline or self.is_fresh(entry)):
+            return entry, self.read(entry)
+        return entry, None
+
+    @staticmethod
+    def validators(entry: CacheEntry | None) -> dict:
+        """Headers making a GET conditional on the page having changed."""
+
+        headers = {}
+        if entry:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def update(
+        self,
+        url: str,
+        entry: CacheEntry | None,
+        status: int,
+        headers: dict,
+        content: bytes,
+    ) -> bytes:
+        """Record a response and return the page's content.
+
+        A 304 refreshes the entry's fetch time and returns the cached content;
+        a 200 stores the new content.
+        """
+
+        if status == 304 and entry:
+            entry.fetched_at = time.time()
+            self.save(entry)
+            return self.read(entry)
+        if status == 200:
+            self.put(url, content, headers, status)
+        return content
@@ -0,0 +1,241 @@
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Generator
+
+import duckdb
+
+from arlima.fm import DB
+from arlima.records import PageRecord, WitnessRecord
+
+# The catalogue's lookups, prepared once on each connection of the pool
+QUERIES = {
+    "page": "SELECT * FROM pages WHERE link = $1",
+    "page_by_permalink": """
+        SELECT * FROM pages
+        WHERE arlima_permalink = $1 OR jonas_permalink = $1
+        ORDER BY link
+        LIMIT 1
+        """,
+    "witnesses": "SELECT * FROM manuscripts WHERE page = $1 ORDER BY idno",
+    "repository_pages": """
+        SELECT * FROM pages
+        WHERE link IN (
+            SELECT page FROM manuscripts
+            WHERE repository = $1 AND ($2 IS NULL OR settlement = $2)
+        )
+        ORDER BY link
+        """,
+    "works_between": """
+        SELECT * FROM pages
+        WHERE year_earliest <= $2 AND coalesce(year_latest, year_earliest) >= $1
+        ORDER BY year_earliest, link
+        """,
+}
+
+
+def sql_literal(value: str | int | None) -> str:
+    """Write a parameter of a prepared query as a SQL literal, since DuckDB
+    does not bind parameters to EXECUTE.
+
+    Examples:
+        >>> sql_literal("Bibliothèque de l'Arsenal")
+        "'Bibliothèque de l''Arsenal'"
+        >>> sql_literal(1400), sql_literal(None)
+        ('1400', 'NULL')
+    """
+
+    if value is None:
+        return "NULL"
+    if isinstance(value, int):
+        return str(int(value))
+    return "'{}'".format(str(value).replace("'", "''"))
+
+
+class ArlimaCatalog:
+    """Read the scraped catalogue through a pool of connections and a cache of
+    results.
+
+    Each connection of the pool prepares QUERIES once, so that a lookup only
+    binds and runs its plan. Results are kept in an LRU cache, emptied when
+    the database file or its write-ahead log changes, so that lookups never
+    outlive a crawl, refresh or reparse.
+
+    While open, the read-only pool holds DuckDB's lock on the database, so
+    that only writes through its own connection can happen. Other processes
+    write once the catalogue is closed: its next lookup reopens the pool,
+    and finds the cache emptied if the database changed meanwhile.
+
+    Examples:
+        >>> conn = duckdb.connect()
+        >>> from arlima.schema import migrate
+        >>> _ = migrate(conn)
+        >>> _ = conn.execute(
+        ...     "INSERT INTO pages (link, simple_title, year_earliest, year_latest) "
+        ...     "VALUES ('a.html', 'Abuzé en court', 1400, 1500)"
+        ... )
+        >>> catalog = ArlimaCatalog(conn=conn)
+        >>> catalog.page("a.html").simple_title
+        'Abuzé en court'
+        >>> [page.link for page in catalog.works_between(1450, 1460)]
+        ['a.html']
+        >>> catalog.page("a.html") is catalog.page("a.html")
+        True
+
+    Args:
+        db (Path, optional): The database, opened read-only unless `conn` is
+            given. Defaults to DB.
+        conn (duckdb.DuckDBPyConnection | None, optional): An open connection
+            to the database, whose cursors make the pool. Defaults to None.
+        pool_size (int, optional): Most connections open at once, and so most
+            lookups run at once. Defaults to 4.
+        cache_size (int, optional): Results kept in the cache. Defaults to
+            4096.
+    """
+
+    def __init__(
+        self,
+        db: Path = DB,
+        conn: duckdb.DuckDBPyConnection | None = None,
+        pool_size: int = 4,
+        cache_size: int = 4096,
+    ) -> None:
+        # A connection opened here is closed, and reopened, with the pool
+        self.owned = conn is None
+        self.conn = conn or duckdb.connect(str(db), read_only=True)
+        (path,) = self.conn.execute(
+            "SELECT path FROM duckdb_databases() WHERE database_name = current_database()"
+        ).fetchone()
+        self.db = Path(path) if path else None
+        self.pool_size = pool_size
+        self.pool = queue.LifoQueue()
+        self.opened = 0
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.stamp = self.version()
+
+    def version(self) -> tuple:
+        """What changes when the database is written to: the size and time of
+        its file and write-ahead log."""
+
+        if self.db is None:
+            # An in-memory database only changes through its connection,
+            # whose writers call `invalidate`
+            return ()
+        stamp = []
+        for path in (self.db, self.db.with_name(self.db.name + ".wal")):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(stamp)
+
+    @contextmanager
+    def connection(self) -> Generator[duckdb.DuckDBPyConnection, None, None]:
+        """Borrow a connection of the pool, opening it if the pool is not
+        full, else waiting for one to come back."""
+
+        try:
+            cursor = self.pool.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                create = self.opened < self.pool_size
+                if create:
+                    self.opened += 1
+                    if self.conn is None:
+                        self.conn = duckdb.connect(str(self.db), read_only=True)
+            if create:
+                cursor = self.conn.cursor()
+                for name, sql in QUERIES.items():
+                    cursor.execute("PREPARE {} AS {}".format(name, sql))
+            else:
+                cursor = self.pool.get()
+        try:
+            yield cursor
+        finally:
+            self.pool.put(cursor)
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.cache.clear()
+
+    def query(self, name: str, record: type, *params: str | int | None) -> tuple:
+        """Run one of QUERIES, or find its result in the cache.
+
+        Args:
+            name (str): The query.
+            record (type): The NamedTuple of the result's rows.
+            params (str | int | None): The query's parameters.
+
+        Returns:
+            tuple: The result's rows, as records.
+        """
+
+        stamp = self.version()
+        key = (name, params)
+        with self.lock:
+            if stamp != self.stamp:
+                self.cache.clear()
+                self.stamp = stamp
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return self.cache[key]
+            self.misses += 1
+        with self.connection() as cursor:
+            rows = tuple(
+                record(*row)
+                for row in cursor.execute(
+                    "EXECUTE {}({})".format(
+                        name, ", ".join(sql_literal(p) for p in params)
+                    )
+                ).fetchall()
+            )
+        with self.lock:
+            self.cache[key] = rows
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return rows
+
+    def page(self, link: str) -> PageRecord | None:
+        rows = self.query("page", PageRecord, link)
+        return rows[0] if rows else None
+
+    def page_by_permalink(self, permalink: str) -> PageRecord | None:
+        """The page of an Arlima or Jonas permalink."""
+
+        rows = self.query("page_by_permalink", PageRecord, permalink)
+        return rows[0] if rows else None
+
+    def witnesses(self, link: str) -> list[WitnessRecord]:
+        return list(self.query("witnesses", WitnessRecord, link))
+
+    def repository_pages(
+        self, repository: str, settlement: str | None = None
+    ) -> list[PageRecord]:
+        """The texts of which a repository, of a given city if any, holds a
+        witness."""
+
+        return list(self.query("repository_pages", PageRecord, repository, settlement))
+
+    def works_between(self, start: int, end: int) -> list[PageRecord]:
+        """The texts whose dates overlap the years from `start` to `end`."""
+
+        return list(self.query("works_between", PageRecord, start, end))
+
+    def close(self) -> None:
+        """Close the pool, releasing the database to writers until the next
+        lookup."""
+
+        while not self.pool.empty():
+            self.pool.get_nowait().close()
+        self.opened = 0
+        if self.owned and self.conn is not None:
+            self.conn.close()
+            self.conn = None
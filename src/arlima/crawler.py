@@ -0,0 +1,226 @@
+import asyncio
+import queue
+import threading
+import time
+from typing import AsyncGenerator, Generator, Iterable
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from arlima.archive import ArchiveWriter
+from arlima.cache import ResponseCache
+from arlima.metrics import CrawlMetrics
+
+# Statuses worth trying again: throttling and server-side failures
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_DONE = object()
+
+
+class TokenBucket:
+    """Allow on average `rate` requests per second, in bursts of `capacity`."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def retry_delay(attempt: int, backoff: float, retry_after: str | None = None) -> float:
+    """Seconds to wait before the next attempt.
+
+    Examples:
+        >>> retry_delay(attempt=0, backoff=0.5)
+        0.5
+        >>> retry_delay(attempt=3, backoff=0.5)
+        4.0
+        >>> retry_delay(attempt=3, backoff=0.5, retry_after="2")
+        2.0
+
+    Args:
+        attempt (int): Number of attempts already failed, minus one.
+        backoff (float): Base delay of the exponential backoff.
+        retry_after (str | None, optional): The server's Retry-After header.
+
+    Returns:
+        float: The delay in seconds.
+    """
+
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return backoff * 2**attempt
+
+
+class AsyncScraper:
+    """Download pages with asyncio, at most `concurrency` at a time and, if a
+    `rate` is given, at most `rate` requests per second to any one host.
+    Given a `cache`, pages are only downloaded again when they changed, and
+    given an `archive`, their raw content is kept. At most `window` pages are
+    downloading or waiting to be consumed at once."""
+
+    def __init__(
+        self,
+        concurrency: int = 16,
+        rate: float | None = None,
+        retries: int = 5,
+        backoff: float = 0.5,
+        timeout: float = 60,
+        cache: ResponseCache | None = None,
+        window: int = 128,
+        metrics: CrawlMetrics | None = None,
+        archive: ArchiveWriter | None = None,
+    ) -> None:
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cache = cache
+        self.window = max(window, concurrency)
+        self.metrics = metrics or CrawlMetrics()
+        self.archive = archive
+        self.buckets = {}
+
+    def bucket(self, link: str) -> TokenBucket | None:
+        if self.rate:
+            host = urlsplit(link).netloc
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(rate=self.rate)
+            return self.buckets[host]
+
+    async def fetch(
+        self,
+        session: aiohttp.ClientSession,
+        semaphore: asyncio.Semaphore,
+        link: str,
+    ) -> tuple[str, bytes | None]:
+        entry = None
+        if self.cache:
+            entry, content = self.cache.lookup(link)
+            if content is not None or self.cache.offline:
+                if content is not None:
+                    self.metrics.count("cache_hits")
+                    if self.archive:
+                        self.archive.add(link, entry.status, content)
+                return link, content
+        headers = ResponseCache.validators(entry)
+        bucket = self.bucket(link)
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            if attempt:
+                self.metrics.count("retries")
+            async with semaphore:
+                if bucket:
+                    await bucket.acquire()
+                start = time.perf_counter()
+                try:
+                    async with session.get(link, headers=headers) as response:
+                        if (
+                            response.status not in RETRY_STATUSES
+                            or attempt == self.retries
+                        ):
+                            content = await response.read()
+                            self.metrics.observe(
+                                "download", time.perf_counter() - start
+                            )
+                            self.metrics.count("bytes_downloaded", len(content))
+                            if response.status == 304:
+                                self.metrics.count("not_modified")
+                            if self.cache:
+                                content = self.cache.update(
+                                    link,
+                                    entry,
+                                    response.status,
+                                    response.headers,
+                                    content,
+                                )
+                            if self.archive:
+                                self.archive.add(link, response.status, content)
+                            # An error page, once retries run out, is no page,
+                            # recorded by the crawl as a DownloadException
+                            if response.status not in (200, 304):
+                                return link, None
+                            return link, content
+                        retry_after = response.headers.get("Retry-After")
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    if attempt == self.retries:
+                        return link, None
+            # Back off without holding a slot of the semaphore
+            await asyncio.sleep(retry_delay(attempt, self.backoff, retry_after))
+
+    async def crawl(
+        self, links: Iterable[str]
+    ) -> AsyncGenerator[tuple[str, bytes | None], None]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout
+        ) as session:
+            pending = set()
+            for link in links:
+                while len(pending) >= self.window:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        yield task.result()
+                pending.add(asyncio.create_task(self.fetch(session, semaphore, link)))
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+
+    def __call__(
+        self, links: Iterable[str]
+    ) -> Generator[tuple[str, bytes | None], None, None]:
+        """Run the crawl on an event loop in a background thread and yield each
+        (link, content) pair as soon as it is downloaded."""
+
+        results = queue.Queue(maxsize=self.window)
+
+        async def produce():
+            async for result in self.crawl(links):
+                # Wait for the consumer without blocking the event loop
+                while True:
+                    try:
+                        results.put_nowait(result)
+                        break
+                    except queue.Full:
+                        await asyncio.sleep(0.01)
+
+        def run():
+            try:
+                asyncio.run(produce())
+            except BaseException as e:
+                results.put(e)
+            finally:
+                results.put(_DONE)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        while (result := results.get()) is not _DONE:
+            if isinstance(result, BaseException):
+                raise result
+            yield result
+        thread.join()
@@ -1,4 +1,9 @@
+import logging
 import re
+from functools import lru_cache
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
 
 CenturyMap = (
     ("I", 0),
@@ -18,10 +23,12 @@ CenturyMap = (
     ("XV", 1400),
     ("XVI", 1500),
     ("XVII", 1600),
-    ("XVII", 1700),
+    ("XVIII", 1700),
     ("XIX", 1800),
 )
 
+Centuries = dict(CenturyMap)
+
 
 class DateParser:
     century = re.compile(r"([IVX]+)e\s|([IVX]+)\s|([IVX]+)$")
@@ -29,8 +36,11 @@ class DateParser:
     last_half = re.compile(r"seconde moitié du ([IVX]+)[e\s$]", re.IGNORECASE)
     before = re.compile(r"avant[\sle]+([XVI1-9]+)", re.IGNORECASE)
 
-    def __init__(self) -> None:
-        pass
+    def __init__(self, maxsize: int | None = 4096) -> None:
+        # Arlima's date descriptions repeat a lot, so remember the last ones
+        self._parse = lru_cache(maxsize=maxsize)(self.parse_or_skip)
+        # Descriptions that could not be parsed, each counted once while cached
+        self.failures = 0
 
     @staticmethod
     def convert_century(num: str) -> int:
@@ -39,6 +49,8 @@ class DateParser:
         Examples:
             >>> DateParser.convert_century("XVI")
             1500
+            >>> DateParser.convert_century("XVIII")
+            1700
 
         Args:
             num (str): Roman numeral century.
@@ -46,9 +58,7 @@ class DateParser:
         Returns:
             int: Year integer.
         """
-        for s, i in CenturyMap:
-            if s == num:
-                return i
+        return Centuries.get(num)
 
     @classmethod
     def find_centuries(cls, s: str) -> list[int]:
@@ -128,25 +138,110 @@ class DateParser:
             list: Ordered list of earliest and latest date.
         """
 
+        return list(self._parse(date_string))
+
+    def bounds(self, date_string: str | None) -> tuple[int | None, int | None]:
+        """Earliest and latest year of a date description, as stored in the
+        pages table.
+
+        Examples:
+            >>> DateParser().bounds("XIVe siècle")
+            (1300, 1400)
+            >>> DateParser().bounds("1462")
+            (1462, None)
+            >>> DateParser().bounds(None)
+            (None, None)
+
+        Args:
+            date_string (str | None): String describing date information.
+
+        Returns:
+            tuple[int | None, int | None]: The earliest year, if any date was
+                found, and the latest, if it differs from the earliest.
+        """
+
+        if not date_string:
+            return None, None
+        date_range = self._parse(date_string)
+        earliest = date_range[0] if len(date_range) > 0 else None
+        latest = date_range[-1] if len(date_range) > 1 else None
+        return earliest, latest
+
+    def parse_many(
+        self, date_strings: Iterable[str | None]
+    ) -> list[tuple[int | None, int | None]]:
+        """Earliest and latest years of many date descriptions.
+
+        Examples:
+            >>> p = DateParser()
+            >>> p.parse_many(["XVe siècle", "Avant 1462", "XVe siècle"])
+            [(1400, 1500), (1400, 1462), (1400, 1500)]
+            >>> p.cache_info()
+            CacheInfo(hits=1, misses=2, maxsize=4096, currsize=2)
+
+        Args:
+            date_strings (Iterable[str | None]): Strings describing dates.
+
+        Returns:
+            list[tuple[int | None, int | None]]: Bounds of each string, as
+                returned by `bounds`.
+        """
+
+        return [self.bounds(date_string) for date_string in date_strings]
+
+    def cache_info(self):
+        """Hits, misses and size of the cache of parsed descriptions."""
+
+        return self._parse.cache_info()
+
+    def parse_or_skip(self, date_string: str) -> tuple:
+        """Parse a description, or log and count it if it cannot be, so that
+        one odd description does not abort a whole batch.
+
+        Examples:
+            >>> p = DateParser()
+            >>> p.parse_or_skip("Avant 1462"), p.failures
+            ((1400, 1462), 0)
+
+        Returns:
+            tuple: Ordered earliest and latest date, empty if the description
+                could not be parsed.
+        """
+
+        try:
+            return self.parse(date_string)
+        except (TypeError, ValueError):
+            # A numeral missing from CenturyMap, such as XX, has no year
+            self.failures += 1
+            logger.warning("Could not parse the date description %r", date_string)
+            return ()
+
+    def parse(self, date_string: str) -> tuple:
+        """Extract earliest and latest date from string, without the cache.
+
+        Args:
+            date_string (str): String describing date information.
+
+        Returns:
+            tuple: Ordered earliest and latest date.
+        """
+
         end = None
         start = None
 
         # If the description orients the range by the start of half a century
-        if self.first_half.match(date_string):
-            s = self.first_half.match(date_string).group(1)
-            start = self.convert_century(s)
+        if match := self.first_half.match(date_string):
+            start = self.convert_century(match.group(1))
             end = start + 50
 
         # If the description orients the range by the end of half a century
-        elif self.last_half.match(date_string):
-            s = self.last_half.match(date_string).group(1)
-            s = self.convert_century(s)
-            end = s + 100
+        elif match := self.last_half.match(date_string):
+            end = self.convert_century(match.group(1)) + 100
             start = end - 50
 
         # If the description orients the range by its end point
-        elif self.before.match(date_string):
-            s = self.before.match(date_string).group(1)
+        elif match := self.before.match(date_string):
+            s = match.group(1)
             try:
                 end = int(s)
                 start = int(s[:2] + "00")
@@ -155,7 +250,7 @@ class DateParser:
                 start = end - 100
 
         # If the description is a single or list of dates
-        elif not end or not start:
+        else:
             # Try parsing roman numeral centuries
             centuries = self.find_centuries(date_string)
             # Try parsing years
@@ -164,11 +259,7 @@ class DateParser:
             # If only one roman numeral was found, describe the century
             if len(centuries) == 1 and len(years) == 0:
                 start = centuries[0]
-                try:
-                    end = start + 100
-                except Exception as e:
-                    print(centuries, years, date_string)
-                    raise e
+                end = start + 100
             # Otherwise, combine the parsed times and find the earliest and latest
             else:
                 all_time_points = centuries + years
@@ -176,4 +267,4 @@ class DateParser:
                     start = min(all_time_points)
                     end = max(all_time_points)
 
-        return sorted(set([start, end]))
+        return tuple(sorted(set([start, end])))
@@ -0,0 +1,103 @@
+import logging
+import logging.handlers
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Generator, NamedTuple
+
+import duckdb
+
+from arlima.exceptions import PageError
+from arlima.schema import migrate
+
+
+class ErrorRecord(NamedTuple):
+    """A problem met while scraping a page, as stored in `scrape_errors`.
+
+    Attributes:
+        link (str | None): The page's URL.
+        stage (str): The step of parsing that found it.
+        field (str | None): The page's field concerned, if any.
+        entry (str | None): The raw value at fault, if any.
+        error (str): The name of the exception.
+    """
+
+    link: str | None
+    stage: str
+    field: str | None
+    entry: str | None
+    error: str
+
+
+def error_record(error: BaseException, link: str | None = None) -> ErrorRecord:
+    """Describe an exception, logged by `Page` or raised while parsing.
+
+    Examples:
+        >>> from arlima.exceptions import DateParsingException
+        >>> error_record(DateParsingException(link="a.html", entry="Vers 12.."))
+        ErrorRecord(link='a.html', stage='date_parsing', field='date_description', entry='Vers 12..', error='DateParsingException')
+        >>> error_record(ValueError("bad markup"), link="b.html")
+        ErrorRecord(link='b.html', stage='parse', field=None, entry='bad markup', error='ValueError')
+    """
+
+    if isinstance(error, PageError):
+        return ErrorRecord(
+            error.link, error.stage, error.field, error.entry, type(error).__name__
+        )
+    return ErrorRecord(link, "parse", None, str(error) or None, type(error).__name__)
+
+
+class ErrorQueueHandler(logging.handlers.QueueHandler):
+    """Put the exceptions logged by the current thread on a queue, as
+    `ErrorRecord`s, without formatting them or touching a file."""
+
+    def __init__(self, records: queue.SimpleQueue) -> None:
+        super().__init__(records)
+        thread = threading.get_ident()
+        self.addFilter(lambda record: record.thread == thread)
+
+    def prepare(self, record: logging.LogRecord) -> ErrorRecord | None:
+        if isinstance(record.msg, BaseException):
+            return error_record(record.msg)
+
+    def enqueue(self, record: ErrorRecord | None) -> None:
+        if record is not None:
+            self.queue.put_nowait(record)
+
+
+@contextmanager
+def collect_errors(
+    logger: str = "arlima.page",
+) -> Generator[list[ErrorRecord], None, None]:
+    """Gather the exceptions logged inside the block, by the current thread.
+
+    Examples:
+        >>> from arlima.exceptions import DateException
+        >>> with collect_errors() as errors:
+        ...     logging.getLogger("arlima.page").critical(DateException("a.html"))
+        >>> [(e.link, e.error) for e in errors]
+        [('a.html', 'DateException')]
+
+    Args:
+        logger (str, optional): Name of the logger. Defaults to "arlima.page".
+
+    Yields:
+        list[ErrorRecord]: The errors, filled in when the block exits.
+    """
+
+    records = queue.SimpleQueue()
+    handler = ErrorQueueHandler(records)
+    log = logging.getLogger(logger)
+    log.addHandler(handler)
+    errors = []
+    try:
+        yield errors
+    finally:
+        log.removeHandler(handler)
+        while not records.empty():
+            errors.append(records.get_nowait())
+
+
+def setup_errors_table(conn: duckdb.DuckDBPyConnection) -> None:
+    # Errors accumulate across runs, told apart by their run id
+    migrate(conn)
@@ -1,28 +1,72 @@
-class BiblioException(Exception):
+class PageError(Exception):
+    """A problem found in a page, logged rather than raised so that parsing
+    goes on, and stored in the `scrape_errors` table.
+
+    Attributes:
+        stage (str): The step of parsing that found it.
+        link (str): The page's URL.
+        field (str | None): The page's field concerned, if any.
+        entry (str | None): The raw value at fault, if any.
+    """
+
+    stage = "parse"
+
+    def __init__(
+        self,
+        message: str,
+        link: str,
+        field: str | None = None,
+        entry: str | None = None,
+    ) -> None:
+        self.link = link
+        self.field = field
+        self.entry = entry
+        super().__init__(message)
+
+
+class BiblioException(PageError):
+    stage = "bibliography"
+
     def __init__(self, link: str) -> None:
         message = f"Find bib table\t{link}\tNo bib table"
-        super().__init__(message)
+        super().__init__(message, link)
 
 
-class BiblioContentException(Exception):
+class BiblioContentException(PageError):
+    stage = "bibliography"
+
     def __init__(self, link: str, entry: str) -> None:
         message = f"Bib table row\t{link}\t{entry}"
-        super().__init__(message)
+        super().__init__(message, link, field=entry)
 
 
-class DateException(Exception):
+class DateException(PageError):
+    stage = "date"
+
     def __init__(self, link: str) -> None:
         message = f"Date description\t{link}\tNo date description"
-        super().__init__(message)
+        super().__init__(message, link, field="date_description")
+
 
+class DateParsingException(PageError):
+    stage = "date_parsing"
 
-class DateParsingException(Exception):
     def __init__(self, link: str, entry: str) -> None:
         message = f"Date parsing\t{link}\t{entry}"
-        super().__init__(message)
+        super().__init__(message, link, field="date_description", entry=entry)
+
 
+class SimpleTitleException(PageError):
+    stage = "title"
 
-class SimpleTitleException(Exception):
     def __init__(self, link: str) -> None:
         message = f"Simple title\t{link}\tNothing in <h2>"
-        super().__init__(message)
+        super().__init__(message, link, field="simple_title")
+
+
+class DownloadException(PageError):
+    stage = "download"
+
+    def __init__(self, link: str) -> None:
+        message = f"Download\t{link}\tNo content"
+        super().__init__(message, link)
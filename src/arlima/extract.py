@@ -0,0 +1,243 @@
+from dataclasses import dataclass, field
+
+from lxml import etree, html
+
+# Every element the extractor looks at; the sweep skips all other tags in C.
+TAGS = ("h2", "h3", "a", "b", "div", "span", "table", "td", "ol")
+
+HTML_PARSER = html.HTMLParser()
+
+
+@dataclass
+class PageData:
+    """Everything the scraper needs from an Arlima page, collected in one pass."""
+
+    is_text: bool = False
+    has_bib_table: bool = False
+    permalinks: list = field(default_factory=list)
+    cells: dict = field(default_factory=dict)
+    title: str | None = None
+    mss: etree._Element | None = None
+
+
+def text_of(elem: etree._Element) -> str:
+    """Return all the text inside an element, like bs4's `Tag.text`.
+
+    Examples:
+        >>> text_of(html.fragment_fromstring("<p>Roman <i>de la</i> Rose</p>"))
+        'Roman de la Rose'
+
+    Args:
+        elem (etree._Element): The element.
+
+    Returns:
+        str: Concatenated text of the element's subtree, without its tail.
+    """
+
+    return etree.tostring(elem, method="text", encoding=str, with_tail=False)
+
+
+def string_of(elem: etree._Element) -> str | None:
+    """Return an element's sole string, like bs4's `Tag.string`.
+
+    Examples:
+        >>> string_of(html.fragment_fromstring("<h3>Versions</h3>"))
+        'Versions'
+        >>> string_of(html.fragment_fromstring("<h3><a>Versions</a></h3>"))
+        'Versions'
+        >>> string_of(html.fragment_fromstring("<h3>Les <a>Versions</a></h3>"))
+
+    Args:
+        elem (etree._Element): The element.
+
+    Returns:
+        str | None: The string if the element holds exactly one, else None.
+    """
+
+    if len(elem) == 0:
+        return elem.text
+    if len(elem) == 1 and not elem.text and not elem[0].tail:
+        return string_of(elem[0])
+
+
+def parse_html(content: bytes | str) -> etree._Element:
+    # Arlima serves UTF-8; decoding up front spares lxml from guessing the
+    # encoding of pages that do not declare it.
+    if isinstance(content, bytes):
+        try:
+            content = content.decode("utf-8")
+        except UnicodeDecodeError:
+            pass
+    return html.document_fromstring(content, parser=HTML_PARSER)
+
+
+def extract_page(content: bytes | str) -> PageData:
+    """Collect the classification signals, permalinks, bibliography cells,
+    title and manuscript list of an Arlima page in a single tree walk.
+
+    Examples:
+        >>> data = extract_page(
+        ...     '<h2>Abuzé en court</h2><table class="desc">'
+        ...     '<tr><td class="cont date">XVe siècle</td></tr></table>'
+        ... )
+        >>> data.is_text, data.title, data.cells
+        (True, 'Abuzé en court', {'date': 'XVe siècle'})
+        >>> extract_page('<h3><a id="bio"></a>Biographie</h3>').is_text
+        False
+
+    Args:
+        content (bytes | str): The page's HTML.
+
+    Returns:
+        PageData: The page's extracted data.
+    """
+
+    root = parse_html(content)
+
+    first_h3 = None
+    author = False
+    non_text_anchor = False
+    work_marker = False
+    perma_div = None
+    permalinks = []
+    bib_div = None
+    table = None
+    bib_div_table = None
+    cells = {}
+    title = None
+    mss_marker = None
+    mss_marker_from_span = False
+    ols = []
+
+    for position, elem in enumerate(root.iter(*TAGS)):
+        tag = elem.tag
+        if tag == "a":
+            id_ = elem.get("id")
+            if id_ == "bio":
+                if first_h3 is not None and any(
+                    h3 is first_h3 for h3 in elem.iterancestors("h3")
+                ):
+                    author = True
+            elif id_ == "oeu" or id_ == "aut":
+                non_text_anchor = True
+            elif not work_marker and string_of(elem) == "Version A":
+                work_marker = True
+            if perma_div is not None and any(
+                div is perma_div for div in elem.iterancestors("div")
+            ):
+                href = elem.get("href")
+                if href is not None:
+                    permalinks.append(href)
+        elif tag == "td":
+            classes = elem.get("class", "").split()
+            if len(classes) == 2 and classes[0] == "cont":
+                owner = next(elem.iterancestors("table"), None)
+                if owner is not None:
+                    cells.setdefault(owner, {}).setdefault(classes[1], elem)
+        elif tag == "div":
+            id_ = elem.get("id")
+            if id_ == "fete":
+                non_text_anchor = True
+            elif id_ == "versions":
+                work_marker = True
+            elif id_ == "permalien" and perma_div is None:
+                perma_div = elem
+            if bib_div is None and "bib" in elem.get("class", "").split():
+                bib_div = elem
+        elif tag == "table":
+            if "desc" in elem.get("class", "").split():
+                if table is None:
+                    table = elem
+                if (
+                    bib_div is not None
+                    and bib_div_table is None
+                    and any(div is bib_div for div in elem.iterancestors("div"))
+                ):
+                    bib_div_table = elem
+        elif tag == "ol":
+            ols.append((position, elem))
+        elif tag == "h2":
+            if title is None:
+                title = text_of(elem)
+        elif tag == "h3":
+            if first_h3 is None:
+                first_h3 = elem
+            if not work_marker and string_of(elem) == "Versions":
+                work_marker = True
+        elif tag == "span":
+            if (
+                not mss_marker_from_span
+                and elem.get("id") == "mss"
+                and string_of(elem) == "Manuscrits"
+            ):
+                mss_marker = (position, elem)
+                mss_marker_from_span = True
+        elif tag == "b":
+            text = string_of(elem)
+            if text == "Généralités":
+                work_marker = True
+            elif text == "Manuscrits" and mss_marker is None:
+                mss_marker = (position, elem)
+
+    # The bibliography table nests in <div class="bib"> when there is one
+    bib_table = bib_div_table if bib_div is not None else table
+
+    data = PageData(
+        is_text=not (author or non_text_anchor or (bib_table is None and work_marker)),
+        has_bib_table=bib_table is not None,
+        title=title,
+    )
+    if not data.is_text:
+        return data
+
+    data.permalinks = permalinks
+    if bib_table is not None:
+        data.cells = {key: text_of(td) for key, td in cells.get(bib_table, {}).items()}
+    if mss_marker is not None:
+        data.mss = find_next_ol(mss_marker, ols)
+    return data
+
+
+def find_next_ol(
+    marker: tuple[int, etree._Element], ols: list[tuple[int, etree._Element]]
+) -> etree._Element | None:
+    # Same as bs4's `marker.parent.find_next("ol")`: the first <ol> inside the
+    # marker's parent, otherwise the first one after the marker.
+    position, elem = marker
+    parent = elem.getparent()
+    if parent is not None:
+        for ol in parent.iterdescendants("ol"):
+            return ol
+    for ol_position, ol in ols:
+        if ol_position > position:
+            return ol
+
+
+def extract_index(content: bytes | str, letter: str) -> list[tuple[str, str]]:
+    """Collect the (title, href) pairs listed under a letter's heading of an
+    index page.
+
+    Examples:
+        >>> extract_index(
+        ...     '<div><h3>A</h3><a href="/a1.html"> Abuzé </a>'
+        ...     '<a href="/a2.html">Aiol</a></div>',
+        ...     "a",
+        ... )
+        [('Abuzé', '/a1.html'), ('Aiol', '/a2.html')]
+        >>> extract_index("<div><h3>B</h3></div>", "a")
+
+    Args:
+        content (bytes | str): The index page's HTML.
+        letter (str): The page's letter.
+
+    Returns:
+        list[tuple[str, str]] | None: The links in the heading's parent, or
+            None if the page has no such heading.
+    """
+
+    root = parse_html(content)
+    for h3 in root.iter("h3"):
+        if string_of(h3) == letter.upper():
+            return [
+                (text_of(a).strip(), a.get("href")) for a in h3.getparent().iter("a")
+            ]
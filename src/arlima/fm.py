@@ -7,6 +7,32 @@ TMP.mkdir(exist_ok=True)
 DB = Path(__file__).parent.joinpath("arlima.db")
 
 
+CACHE = Path(__file__).parent.joinpath("cache")
+
+
+ARCHIVE = Path(__file__).parent.joinpath("archive")
+
+
+SHARDS = Path(__file__).parent.joinpath("shards")
+
+
+SHELFMARKS = Path(__file__).parent.joinpath("shelfmarks")
+
+
+TITLES = Path(__file__).parent.joinpath("titles")
+
+
+DATES = Path(__file__).parent.joinpath("dates.parquet")
+
+
+def modified(db: Path) -> float:
+    """When the database last changed, counting the writes DuckDB still holds
+    in its write-ahead log beside it."""
+
+    wal = db.with_name(db.name + ".wal")
+    return max(path.stat().st_mtime for path in (db, wal) if path.exists())
+
+
 def clean():
     for file in TMP.iterdir():
         file.unlink()
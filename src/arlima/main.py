@@ -1,19 +1,404 @@
+from pathlib import Path
+
 import click
 import duckdb
 
-from arlima.fm import DB
+from arlima.archive import PageArchive
+from arlima.cache import ResponseCache
+from arlima.fm import DB, SHARDS
+from arlima.metrics import CrawlMetrics, print_summary
+from arlima.redate import redate_pages
 from arlima.request_index import request_index
-from arlima.request_pages import request_pages
+from arlima.refresh import refresh_pages
+from arlima.reparse import reparse_pages
+from arlima.request_pages import CrawlOptions, request_pages
+from arlima.schema import TARGETS, cluster, migrate
+from arlima.shards import merge_shards, parse_shard, shard_path
+
+# The linker, and splink with it, are only imported by the commands using them
 
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.option("--restart", default=False, is_flag=True, show_default=True)
-def main(restart: bool):
-    conn = duckdb.connect(str(DB))
+@click.option(
+    "--fetch-workers",
+    type=int,
+    default=None,
+    help="Threads downloading pages, or concurrent requests with the async engine.",
+)
+@click.option(
+    "--parse-workers",
+    type=int,
+    default=None,
+    help="Processes parsing pages. [default: number of CPUs]",
+)
+@click.option(
+    "--window",
+    type=int,
+    default=128,
+    show_default=True,
+    help="Pages held at once by each stage of the crawl, bounding its memory.",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(["threads", "async"]),
+    default="threads",
+    show_default=True,
+    help="How to download pages.",
+)
+@click.option(
+    "--rate",
+    type=float,
+    default=None,
+    help="Maximum requests per second to arlima.net (async engine only).",
+)
+@click.option(
+    "--max-age",
+    type=float,
+    default=None,
+    help="Seconds during which a cached page is reused without revalidating it.",
+)
+@click.option(
+    "--offline",
+    default=False,
+    is_flag=True,
+    help="Rebuild the tables from the cache alone, without any request.",
+)
+@click.option(
+    "--no-cache",
+    default=False,
+    is_flag=True,
+    help="Neither read nor write the local response cache.",
+)
+@click.option(
+    "--incremental",
+    default=False,
+    is_flag=True,
+    help="Only scrape new or changed pages and drop removed ones.",
+)
+@click.option(
+    "--resume",
+    default=False,
+    is_flag=True,
+    help="Finish an interrupted crawl, only scraping the pages it left pending.",
+)
+@click.option(
+    "--shard",
+    default=None,
+    help="Only scrape shard i of N, counted from 0, into its own database "
+    "under arlima/shards, to be merged with the merge command.",
+)
+@click.option(
+    "--archive",
+    default=False,
+    is_flag=True,
+    help="Keep the raw pages in the archive, to rebuild the tables with reparse.",
+)
+@click.option(
+    "--metrics-file",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Also write the crawl's metrics to this file, in Prometheus' text "
+    "format if it ends in .prom, else as JSON.",
+)
+@click.pass_context
+def main(
+    ctx: click.Context,
+    restart: bool,
+    fetch_workers: int | None,
+    parse_workers: int | None,
+    window: int,
+    engine: str,
+    rate: float | None,
+    max_age: float | None,
+    offline: bool,
+    no_cache: bool,
+    incremental: bool,
+    resume: bool,
+    shard: str | None,
+    archive: bool,
+    metrics_file: Path | None,
+):
+    # The options only concern the crawl, run when no subcommand is given
+    if ctx.invoked_subcommand is not None:
+        return
+
+    if offline and no_cache:
+        raise click.UsageError("--offline needs the cache.")
+    if shard is not None:
+        if incremental:
+            raise click.UsageError("--incremental does not apply to a shard.")
+        try:
+            shard = parse_shard(shard)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+    cache = None if no_cache else ResponseCache(max_age=max_age, offline=offline)
+    options = CrawlOptions(
+        fetch_workers=fetch_workers,
+        parse_workers=parse_workers,
+        engine=engine,
+        rate=rate,
+        cache=cache,
+        archive=PageArchive() if archive else None,
+        window=window,
+        metrics=CrawlMetrics(),
+    )
+
+    conn = duckdb.connect(str(shard_path(*shard) if shard else DB))
     tables = [tup[0] for tup in conn.execute("show tables;").fetchall()]
-    if restart or ("arlima_index" not in tables or "pages" not in tables):
-        request_index(conn=conn)
-        request_pages(conn=conn)
+    missing = "arlima_index" not in tables or "pages" not in tables
+    if resume:
+        # The table exists in any migrated database, crawled or not
+        if (
+            "crawl_state" not in tables
+            or not conn.table("crawl_state").count("*").fetchone()[0]
+        ):
+            raise click.UsageError("There is no crawl to resume.")
+        request_pages(conn=conn, options=options, resume=True)
+    elif incremental and not (restart or missing):
+        refresh_pages(conn=conn, options=options)
+    elif restart or offline or missing or shard:
+        failed = request_index(conn=conn, cache=cache, workers=fetch_workers)
+        # Without a previous index, the pages of a failed letter would be
+        # silently left out of the crawl
+        if failed and missing:
+            raise click.ClickException(
+                "Could not crawl the index of letters {}, try again.".format(
+                    ", ".join(failed)
+                )
+            )
+        request_pages(conn=conn, options=options, shard=shard)
+    else:
+        return
+
+    report_metrics(conn, options, metrics_file)
+
+
+def report_metrics(
+    conn: duckdb.DuckDBPyConnection, options: CrawlOptions, metrics_file: Path | None
+) -> None:
+    options.metrics.write(conn, run_id=options.run_id)
+    print_summary(options.metrics)
+    if metrics_file:
+        if metrics_file.suffix == ".prom":
+            metrics_file.write_text(options.metrics.to_prometheus())
+        else:
+            metrics_file.write_text(options.metrics.to_json())
+
+
+@main.command()
+@click.option(
+    "--parse-workers",
+    type=int,
+    default=None,
+    help="Processes parsing pages. [default: number of CPUs]",
+)
+@click.option(
+    "--window",
+    type=int,
+    default=128,
+    show_default=True,
+    help="Pages held at once by each stage of the parsing, bounding its memory.",
+)
+@click.option(
+    "--metrics-file",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Also write the metrics to this file, as with the crawl.",
+)
+def reparse(parse_workers: int | None, window: int, metrics_file: Path | None):
+    """Rebuild the pages and manuscripts tables from the archived pages."""
+
+    archive = PageArchive()
+    if not archive.files():
+        raise click.UsageError("The archive is empty, crawl with --archive first.")
+    options = CrawlOptions(
+        parse_workers=parse_workers, window=window, metrics=CrawlMetrics()
+    )
+    conn = duckdb.connect(str(DB))
+    parsed = reparse_pages(conn, archive, options)
+    report_metrics(conn, options, metrics_file)
+    print("Reparsed {} pages.".format(parsed))
+
+
+@main.command()
+@click.argument(
+    "shards", nargs=-1, type=click.Path(exists=True, dir_okay=False, path_type=Path)
+)
+def merge(shards: tuple[Path]):
+    """Combine the databases of the SHARDS, by default all those under
+    arlima/shards, into the canonical database."""
+
+    shards = list(shards) or sorted(SHARDS.glob("shard-*.db"))
+    if not shards:
+        raise click.UsageError("There are no shards to merge.")
+    conn = duckdb.connect(str(DB))
+    try:
+        pages = merge_shards(conn, shards)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    print("Merged {} pages from {} shards.".format(pages, len(shards)))
+    (failed,) = conn.execute(
+        "SELECT count(*) FROM crawl_state WHERE status = 'failed'"
+    ).fetchone()
+    if failed:
+        print("{} links could not be scraped, retry them with --resume.".format(failed))
+
+
+@main.command()
+def redate():
+    """Recompute the pages' years from their date descriptions."""
+
+    conn = duckdb.connect(str(DB))
+    changed = redate_pages(conn)
+    print("Updated the years of {} pages.".format(changed))
+
+
+@main.command("cluster")
+def cluster_tables():
+    """Sort the rows of the tables by their keys, which crawls append in the
+    order they scrape them, to speed up the lookups of pages."""
+
+    conn = duckdb.connect(str(DB))
+    migrate(conn)
+    cluster(conn, "pages", "manuscripts", "page_hashes", "crawl_state")
+    print("Sorted the tables.")
+
+
+@main.command()
+@click.argument("source", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "--top-k",
+    type=int,
+    default=5,
+    show_default=True,
+    help="Candidates kept for each witness.",
+)
+@click.option(
+    "--no-splink",
+    default=False,
+    is_flag=True,
+    help="Rank candidates by shelfmark similarity alone, without a splink model.",
+)
+@click.option(
+    "--max-pairs",
+    type=float,
+    default=1e6,
+    show_default=True,
+    help="Random pairs sampled to train the splink model.",
+)
+def match(source: Path, top_k: int, no_splink: bool, max_pairs: float):
+    """Link the witnesses of a CSV or Parquet SOURCE to the manuscripts."""
+
+    from linker.match import match_witnesses
+
+    conn = duckdb.connect(str(DB))
+    try:
+        rows = match_witnesses(
+            conn, source, top_k=top_k, use_splink=not no_splink, max_pairs=max_pairs
+        )
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    print("Wrote {} candidate matches.".format(rows))
+
+
+@main.command()
+@click.argument("shelfmark")
+@click.option("--settlement", default=None, help="City of the manuscript.")
+@click.option("--repository", default=None, help="Library of the manuscript.")
+@click.option(
+    "--limit",
+    type=int,
+    default=10,
+    show_default=True,
+    help="Fuzzy matches shown when no shelfmark matches exactly.",
+)
+def lookup(shelfmark: str, settlement: str | None, repository: str | None, limit: int):
+    """Find the texts whose witnesses include the manuscript SHELFMARK."""
+
+    from linker.shelfmarks import shelfmark_index
+
+    conn = duckdb.connect(str(DB), read_only=True)
+    index = shelfmark_index(conn, DB)
+    for match in index.lookup(
+        shelfmark, settlement=settlement, repository=repository, limit=limit
+    ):
+        print(
+            "{:.0f}\t{}\t{}, {}, {}".format(
+                match.score,
+                match.page,
+                match.settlement,
+                match.repository,
+                ", ".join(part for part in (match.collection, match.idno) if part),
+            )
+        )
+
+
+@main.command("batch-match")
+@click.argument("source", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+@click.option(
+    "--target",
+    type=click.Choice(sorted(TARGETS)),
+    default="simple_titles",
+    show_default=True,
+    help="Column matched against.",
+)
+@click.option(
+    "--column",
+    default="query",
+    show_default=True,
+    help="Column of the queries in a CSV or Parquet SOURCE.",
+)
+@click.option("--top-k", type=int, default=5, show_default=True)
+@click.option(
+    "--cutoff",
+    type=float,
+    default=80,
+    show_default=True,
+    help="Lowest score kept, from 0 to 100.",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=-1,
+    show_default=True,
+    help="Scoring threads, -1 for all cores.",
+)
+@click.option(
+    "--table",
+    default="batch_matches",
+    show_default=True,
+    help="Table replaced by the matches.",
+)
+def batch_match_command(
+    source: Path,
+    target: str,
+    column: str,
+    top_k: int,
+    cutoff: float,
+    workers: int,
+    table: str,
+):
+    """Match the queries of SOURCE, a text file with one per line or a CSV or
+    Parquet file, against titles or shelfmarks."""
+
+    from linker.batch import batch_match, load_queries
+
+    conn = duckdb.connect(str(DB))
+    try:
+        queries = load_queries(conn, source, column=column)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    report = batch_match(
+        conn,
+        queries,
+        target=target,
+        table=table,
+        top_k=top_k,
+        cutoff=cutoff,
+        workers=workers,
+    )
+    print(report)
 
 
 if __name__ == "__main__":
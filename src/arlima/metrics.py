@@ -0,0 +1,236 @@
+import json
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Generator
+
+import duckdb
+from rich.console import Console
+from rich.table import Table
+
+# Upper bounds, in seconds, of the latency histograms' buckets
+BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    math.inf,
+)
+
+
+@dataclass
+class Histogram:
+    """Distribution of a stage's latencies over fixed buckets.
+
+    Examples:
+        >>> histogram = Histogram()
+        >>> for seconds in (0.002, 0.003, 0.2, 0.3):
+        ...     histogram.observe(seconds)
+        >>> histogram.count, round(histogram.total, 3)
+        (4, 0.505)
+        >>> histogram.quantile(0.5)
+        0.005
+    """
+
+    counts: list = field(default_factory=lambda: [0] * len(BUCKETS))
+    count: int = 0
+    total: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile."""
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank and seen:
+                return bound
+        return math.nan
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else math.nan
+
+
+class CrawlMetrics:
+    """Timings and counters of a crawl, safe to update from several threads.
+
+    Latencies are recorded by stage, "download", "parse", "witnesses" and
+    "insert"; counters include bytes downloaded, retries, pages that are not
+    texts and, under "error:<name>", the exceptions raised or logged while
+    parsing.
+
+    Examples:
+        >>> metrics = CrawlMetrics()
+        >>> with metrics.timer("download"):
+        ...     pass
+        >>> metrics.count("bytes_downloaded", 2048)
+        >>> metrics.histograms["download"].count, metrics.counters["bytes_downloaded"]
+        (1, 2048)
+    """
+
+    def __init__(self) -> None:
+        self.histograms = {}
+        self.counters = Counter()
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram()
+            self.histograms[stage].observe(seconds)
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self.lock:
+            self.counters[name] += n
+
+    @contextmanager
+    def timer(self, stage: str) -> Generator[None, None, None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def summary(self) -> list[tuple]:
+        """Rows of the run summary: stage, count, total and mean seconds, and
+        50th, 95th and 99th percentiles."""
+
+        rows = []
+        for stage, histogram in sorted(self.histograms.items()):
+            rows.append(
+                (
+                    stage,
+                    histogram.count,
+                    histogram.total,
+                    histogram.mean,
+                    histogram.quantile(0.5),
+                    histogram.quantile(0.95),
+                    histogram.quantile(0.99),
+                )
+            )
+        return rows
+
+    def write(self, conn: duckdb.DuckDBPyConnection, run_id: str) -> None:
+        """Append the run's metrics to the `crawl_metrics` table, one row per
+        stage or counter."""
+
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_metrics (
+                run_id VARCHAR, started TIMESTAMP, name VARCHAR, kind VARCHAR,
+                count BIGINT, total DOUBLE, p50 DOUBLE, p95 DOUBLE, p99 DOUBLE
+            )""")
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self.started))
+        rows = [
+            # Quantiles beyond the last finite bucket are unknown
+            (run_id, started, stage, "latency", count, total)
+            + tuple(q if math.isfinite(q) else None for q in quantiles)
+            for stage, count, total, _, *quantiles in self.summary()
+        ]
+        rows += [
+            (run_id, started, name, "counter", value, None, None, None, None)
+            for name, value in sorted(self.counters.items())
+        ]
+        if rows:
+            conn.executemany(
+                "INSERT INTO crawl_metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "started": self.started,
+                "counters": dict(self.counters),
+                "histograms": {
+                    stage: {
+                        "buckets": [
+                            [str(bound), count]
+                            for bound, count in zip(BUCKETS, histogram.counts)
+                        ],
+                        "count": histogram.count,
+                        "sum": histogram.total,
+                    }
+                    for stage, histogram in self.histograms.items()
+                },
+            },
+            indent=2,
+        )
+
+    def to_prometheus(self) -> str:
+        """The metrics in Prometheus' text exposition format.
+
+        Examples:
+            >>> metrics = CrawlMetrics()
+            >>> metrics.count("retries", 3)
+            >>> metrics.count("error:DateException")
+            >>> print(metrics.to_prometheus())
+            # TYPE arlima_crawl_retries_total counter
+            arlima_crawl_retries_total 3
+            # TYPE arlima_crawl_errors_total counter
+            arlima_crawl_errors_total{type="DateException"} 1
+            <BLANKLINE>
+        """
+
+        lines = []
+        errors = []
+        for name, value in sorted(self.counters.items()):
+            if name.startswith("error:"):
+                errors.append((name.partition(":")[2], value))
+                continue
+            metric = "arlima_crawl_{}_total".format(name)
+            lines.append("# TYPE {} counter".format(metric))
+            lines.append("{} {}".format(metric, value))
+        if errors:
+            lines.append("# TYPE arlima_crawl_errors_total counter")
+            for error, value in errors:
+                lines.append(
+                    'arlima_crawl_errors_total{{type="{}"}} {}'.format(error, value)
+                )
+        for stage, histogram in sorted(self.histograms.items()):
+            metric = "arlima_crawl_{}_seconds".format(stage)
+            lines.append("# TYPE {} histogram".format(metric))
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                le = "+Inf" if math.isinf(bound) else repr(bound)
+                lines.append('{}_bucket{{le="{}"}} {}'.format(metric, le, cumulative))
+            lines.append("{}_sum {}".format(metric, histogram.total))
+            lines.append("{}_count {}".format(metric, histogram.count))
+        return "\n".join(lines) + "\n"
+
+
+def print_summary(metrics: CrawlMetrics) -> None:
+    """Print the run's latencies by stage and its counters as tables."""
+
+    latencies = Table(title="Crawl latencies (seconds)")
+    for column in ("stage", "count", "total", "mean", "p50", "p95", "p99"):
+        latencies.add_column(column, justify="left" if column == "stage" else "right")
+    for stage, count, *seconds in metrics.summary():
+        latencies.add_row(stage, str(count), *("{:.4f}".format(s) for s in seconds))
+    counters = Table(title="Crawl counters")
+    counters.add_column("counter")
+    counters.add_column("value", justify="right")
+    for name, value in sorted(metrics.counters.items()):
+        counters.add_row(name, "{:,}".format(value))
+    console = Console()
+    console.print(latencies)
+    console.print(counters)
@@ -0,0 +1,90 @@
+import re
+import unicodedata
+
+import duckdb
+import pyarrow as pa
+from duckdb.typing import VARCHAR
+
+# Runs of anything but letters and digits, underscores included
+SEPARATORS = re.compile(r"[\W_]+")
+
+# Length of the n-grams of the fuzzy indexes
+N = 3
+
+
+def normalise(text: str | None) -> str | None:
+    """Fold a place, library or shelfmark name for comparison: accents
+    stripped, case folded and punctuation turned into single spaces.
+
+    Examples:
+        >>> normalise("Bibliothèque nationale de France")
+        'bibliotheque nationale de france'
+        >>> normalise("  fr. 1555, f. 1r-12v ")
+        'fr 1555 f 1r 12v'
+        >>> normalise("--")
+
+    Args:
+        text (str | None): The name.
+
+    Returns:
+        str | None: The normalised name, or None if nothing is left of it.
+    """
+
+    if text is None:
+        return
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    words = SEPARATORS.split(stripped.casefold())
+    return " ".join(word for word in words if word) or None
+
+
+def ngrams(key: str, n: int = N) -> set[str]:
+    """The n-grams of a normalised name, padded so that its ends count.
+
+    Examples:
+        >>> sorted(ngrams("fr 15"))
+        [' 15', ' fr', '15 ', 'fr ', 'r 1']
+    """
+
+    padded = " {} ".format(key)
+    return {padded[i : i + n] for i in range(len(padded) - n + 1)}
+
+
+def normalise_array(values: pa.Array | pa.ChunkedArray) -> pa.Array:
+    """Normalise a column of names, folding each distinct name once.
+
+    Examples:
+        >>> normalise_array(pa.array(["Liège", None, "LIÈGE", "Liège"])).to_pylist()
+        ['liege', None, 'liege', 'liege']
+
+    Args:
+        values (pa.Array | pa.ChunkedArray): The names.
+
+    Returns:
+        pa.Array: The normalised names.
+    """
+
+    if isinstance(values, pa.ChunkedArray):
+        values = values.combine_chunks()
+    encoded = values.dictionary_encode()
+    folded = [normalise(value) for value in encoded.dictionary.to_pylist()]
+    return pa.array(folded, type=pa.string()).take(encoded.indices)
+
+
+def register_normalise(conn: duckdb.DuckDBPyConnection) -> None:
+    """Register `arlima_normalise(VARCHAR)`, the vectorised version of
+    `normalise`.
+
+    Examples:
+        >>> conn = duckdb.connect()
+        >>> register_normalise(conn)
+        >>> conn.execute("SELECT arlima_normalise('Bruxelles, KBR')").fetchone()
+        ('bruxelles kbr',)
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+    """
+
+    conn.create_function(
+        "arlima_normalise", normalise_array, [VARCHAR], VARCHAR, type="arrow"
+    )
@@ -1,22 +1,17 @@
 import logging
 from dataclasses import dataclass
-
-import bs4
-from bs4 import BeautifulSoup
+from functools import cached_property
 
 from arlima.date_parser import DateParser
 from arlima.exceptions import *
-from arlima.fm import TMP
+from arlima.extract import extract_page
+from arlima.records import PageRecord
 
+# The pages' problems are logged as exceptions, which `collect_errors` gathers
+# while parsing; outside of it they are dropped
 logger = logging.getLogger(__name__)
-logging.basicConfig(
-    filename=TMP.joinpath("page_errors.log"),
-    filemode="w",
-    encoding="utf-8",
-    level=logging.CRITICAL,
-    format="%(asctime)s:%(message)s",
-    datefmt="%m/%d/%Y %I:%M:%S %p",
-)
+logger.addHandler(logging.NullHandler())
+logger.propagate = False
 
 
 @dataclass
@@ -26,111 +21,46 @@ class Page:
     parser: DateParser = DateParser()
 
     def __post_init__(self) -> None:
-        soup = BeautifulSoup(self.content, features="lxml")
-        self._soup = None
-        if self.is_text(soup):
-            self._soup = soup
-        self.link = self.link
-
-        if self._soup:
+        data = extract_page(self.content)
+        self.is_text = data.is_text
+        self.has_bib_table = data.has_bib_table
+        self.title = data.title
+        self.cells = data.cells
+        self.mss = data.mss
+
+        if self.is_text:
             # Permalinks
-            perma_div = self._soup.find("div", attrs={"id": "permalien"})
-            self.permalinks = []
-            if perma_div:
-                for a in perma_div.find_all("a"):
-                    self.permalinks.append(a.get("href"))
+            self.permalinks = data.permalinks
 
             # Bibliography
-            self.biblio_table = self.find_bib_table(soup)
-            if not self.biblio_table:
-                logging.critical(BiblioException(link=self.link))
-
-            # Manuscripts
-            self.mss = self.find_mss_list(soup)
+            if not self.has_bib_table:
+                logger.critical(BiblioException(link=self.link))
 
             # Date description
             self.date_description = self.get_biblio_row("date")
             if not self.date_description:
-                logging.critical(DateException(link=self.link))
-
-    @classmethod
-    def find_mss_list(cls, soup: bs4.element.Tag) -> bs4.element.Tag | None:
-        mss_span = soup.find("span", attrs={"id": "mss"}, string="Manuscrits")
-        if mss_span:
-            return mss_span.parent.find_next("ol")
-        mss_list = soup.find("b", string="Manuscrits")
-        if mss_list:
-            return mss_list.parent.find_next("ol")
-
-    @classmethod
-    def is_text(cls, soup: bs4.element.Tag) -> bool:
-        # Author
-        if soup.find("h3") and soup.find("h3").find("a", attrs={"id": "bio"}):
-            return False
-        elif soup.find("a", attrs={"id": "oeu"}):
-            return False
-        # Feast day / Saint
-        elif soup.find("div", attrs={"id": "fete"}):
-            return False
-        # Concept
-        elif soup.find("a", attrs={"id": "aut"}):
-            return False
-        # Work (currently not supported)
-        elif not cls.find_bib_table(soup) and (
-            soup.find("h3", string="Versions")
-            or soup.find("div", attrs={"id": "versions"})
-            or soup.find("a", string="Version A")
-            or soup.find("b", string="Généralités")
-        ):
-            return False
-        else:
-            return True
-
-    @classmethod
-    def find_bib_table(cls, soup: bs4.element.Tag) -> bs4.element.Tag | None:
-        bib_div = soup.find("div", attrs={"class": "bib"})
-        if bib_div:
-            table = cls.simple_biblio_pos(bib_div)
-        else:
-            table = cls.simple_biblio_pos(soup)
-        return table
-
-    @classmethod
-    def simple_biblio_pos(cls, soup: bs4.element.Tag) -> bs4.element.Tag | None:
-        table = soup.find("table", attrs={"class": "desc"})
-        return table
+                logger.critical(DateException(link=self.link))
 
     def get_biblio_row(self, content_class) -> str | None:
-        if self.biblio_table:
-            elem = self.biblio_table.find(
-                "td", attrs={"class": f"cont {content_class}"}
-            )
-            if elem:
-                return elem.text
+        if self.has_bib_table:
+            if content_class in self.cells:
+                return self.cells[content_class]
             else:
-                logging.critical(
+                logger.critical(
                     BiblioContentException(link=self.link, entry=content_class)
                 )
 
+    def record(self) -> PageRecord | None:
+        if self.is_text:
+            return PageRecord(*(self.__getattribute__(f) for f in self.fields()))
+
     def dict(self) -> dict | None:
-        if self._soup:
-            return {field: self.__getattribute__(field) for field in self.fields()}
+        if self.is_text:
+            return self.record()._asdict()
 
     @classmethod
     def fields(cls) -> list:
-        return [
-            "link",
-            "form",
-            "genre",
-            "arlima_permalink",
-            "jonas_permalink",
-            "simple_title",
-            "canonic_title",
-            "language",
-            "date_description",
-            "date_earliest",
-            "date_latest",
-        ]
+        return list(PageRecord._fields)
 
     @property
     def genre(self) -> str:
@@ -154,11 +84,10 @@ class Page:
 
     @property
     def simple_title(self) -> str:
-        h2 = self._soup.find("h2")
-        if h2:
-            return h2.text
+        if self.title is not None:
+            return self.title
         else:
-            logging.critical(SimpleTitleException(link=self.link))
+            logger.critical(SimpleTitleException(link=self.link))
 
     @property
     def canonic_title(self) -> str:
@@ -168,20 +97,25 @@ class Page:
     def language(self) -> str:
         return self.get_biblio_row("langue")
 
+    @cached_property
+    def date_bounds(self) -> tuple[int | None, int | None]:
+        # Parse the description once for both year columns
+        return self.parser.bounds(self.date_description)
+
     @property
-    def date_earliest(self) -> str:
+    def date_earliest(self) -> int | None:
+        """The first year of the date description, logging a
+        DateParsingException when the description has none."""
+
         if self.date_description:
-            date_range = self.parser(self.date_description)
-            if len(date_range) > 0:
-                return date_range[0]
-            else:
-                logging.critical(
+            earliest = self.date_bounds[0]
+            if earliest is None:
+                logger.critical(
                     DateParsingException(link=self.link, entry=self.date_description)
                 )
+            return earliest
 
     @property
-    def date_latest(self) -> str:
+    def date_latest(self) -> int | None:
         if self.date_description:
-            date_range = self.parser(self.date_description)
-            if len(date_range) > 1:
-                return date_range[-1]
+            return self.date_bounds[1]
@@ -0,0 +1,70 @@
+from typing import NamedTuple
+
+
+class PageRecord(NamedTuple):
+    """A text's row of the pages table, in the table's column order."""
+
+    link: str
+    form: str | None
+    genre: str | None
+    arlima_permalink: str | None
+    jonas_permalink: str | None
+    simple_title: str | None
+    canonic_title: str | None
+    language: str | None
+    date_description: str | None
+    date_earliest: int | None
+    date_latest: int | None
+
+
+class WitnessRecord(NamedTuple):
+    """A witness's row of the manuscripts table, in the table's column order.
+
+    Examples:
+        >>> record = WitnessRecord(
+        ...     page="https://www.arlima.net/ad/abuze_en_court.html",
+        ...     archive_href="https://www.bl.uk",
+        ...     settlement="London",
+        ...     repository="British Library",
+        ...     collection="Royal",
+        ...     idno="20. D. XI, f. 77rc-79ra",
+        ...     shelfmark="royal 20 d xi",
+        ...     folios="77rc-79ra",
+        ...     notes=None,
+        ... )
+        >>> record.repository
+        'British Library'
+        >>> record._asdict()["idno"]
+        '20. D. XI, f. 77rc-79ra'
+    """
+
+    page: str
+    archive_href: str | None
+    settlement: str | None
+    repository: str | None
+    collection: str | None
+    idno: str | None
+    shelfmark: str | None
+    folios: str | None
+    notes: str | None
+
+
+class ParsedPage(NamedTuple):
+    """What the parsing processes send back about a page.
+
+    Attributes:
+        page (PageRecord | None): The page's row, None if it is not a text or
+            could not be parsed.
+        witnesses (list[WitnessRecord]): Its witnesses' rows.
+        is_text (bool | None): Whether the page is a text, None if parsing
+            failed before knowing.
+        timings (dict): Seconds spent in each parsing stage.
+        errors (list[ErrorRecord]): The problems raised or logged while
+            parsing.
+    """
+
+    page: PageRecord | None
+    witnesses: list
+    is_text: bool | None
+    timings: dict
+    errors: list
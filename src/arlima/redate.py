@@ -0,0 +1,107 @@
+import duckdb
+import pyarrow as pa
+from duckdb.typing import BIGINT, VARCHAR
+
+from arlima.date_parser import DateParser
+
+
+def year_bounds(
+    parser: DateParser, descriptions: pa.Array | pa.ChunkedArray
+) -> tuple[pa.Array, pa.Array]:
+    """Earliest and latest years of a column of date descriptions.
+
+    Each distinct description is parsed once, then the results are spread back
+    over the column. A description that cannot be parsed has no years.
+
+    Examples:
+        >>> earliest, latest = year_bounds(
+        ...     DateParser(), pa.array(["XVe siècle", None, "XVe siècle", "1462"])
+        ... )
+        >>> earliest.to_pylist(), latest.to_pylist()
+        ([1400, None, 1400, 1462], [1500, None, 1500, None])
+
+    Args:
+        parser (DateParser): The date parser.
+        descriptions (pa.Array | pa.ChunkedArray): The date descriptions.
+
+    Returns:
+        tuple[pa.Array, pa.Array]: The earliest and latest years.
+    """
+
+    if isinstance(descriptions, pa.ChunkedArray):
+        descriptions = descriptions.combine_chunks()
+    encoded = descriptions.dictionary_encode()
+    bounds = parser.parse_many(encoded.dictionary.to_pylist())
+    earliest = pa.array([b[0] for b in bounds], type=pa.int64())
+    latest = pa.array([b[1] for b in bounds], type=pa.int64())
+    return earliest.take(encoded.indices), latest.take(encoded.indices)
+
+
+def register_date_functions(
+    conn: duckdb.DuckDBPyConnection, parser: DateParser | None = None
+) -> None:
+    """Register `arlima_year_earliest(VARCHAR)` and `arlima_year_latest(VARCHAR)`,
+    vectorised functions deriving the year columns from a date description.
+
+    Examples:
+        >>> conn = duckdb.connect()
+        >>> register_date_functions(conn)
+        >>> conn.execute(
+        ...     "SELECT arlima_year_earliest(d), arlima_year_latest(d) "
+        ...     "FROM (VALUES ('Première moitié du XIVe siècle')) t(d)"
+        ... ).fetchall()
+        [(1300, 1350)]
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+        parser (DateParser | None, optional): The date parser. Defaults to a
+            new one.
+    """
+
+    parser = parser or DateParser()
+
+    def earliest(descriptions: pa.Array) -> pa.Array:
+        return year_bounds(parser, descriptions)[0]
+
+    def latest(descriptions: pa.Array) -> pa.Array:
+        return year_bounds(parser, descriptions)[1]
+
+    for name, function in (
+        ("arlima_year_earliest", earliest),
+        ("arlima_year_latest", latest),
+    ):
+        conn.create_function(name, function, [VARCHAR], BIGINT, type="arrow")
+
+
+def redate_pages(conn: duckdb.DuckDBPyConnection) -> int:
+    """Recompute the year columns of the pages table from its date
+    descriptions, in a single statement.
+
+    Examples:
+        >>> from arlima.schema import migrate
+        >>> conn = duckdb.connect()
+        >>> _ = migrate(conn)
+        >>> _ = conn.execute(
+        ...     "INSERT INTO pages (link, date_description) "
+        ...     "VALUES ('a.html', 'XIVe siècle'), ('b.html', 'Sans date')"
+        ... )
+        >>> redate_pages(conn)
+        1
+        >>> conn.execute("SELECT link, year_earliest FROM pages ORDER BY link").fetchall()
+        [('a.html', 1300), ('b.html', None)]
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+
+    Returns:
+        int: Number of pages whose years changed.
+    """
+
+    register_date_functions(conn)
+    return conn.execute("""
+        UPDATE pages
+        SET year_earliest = arlima_year_earliest(date_description),
+            year_latest = arlima_year_latest(date_description)
+        WHERE year_earliest IS DISTINCT FROM arlima_year_earliest(date_description)
+            OR year_latest IS DISTINCT FROM arlima_year_latest(date_description)
+        """).fetchone()[0]
@@ -0,0 +1,85 @@
+import duckdb
+
+from arlima.request_index import API, request_index
+from arlima.request_pages import (
+    CrawlOptions,
+    get_unique_links,
+    scrape_pages,
+    write_results,
+)
+from arlima.schema import migrate
+
+
+def refresh_pages(
+    conn: duckdb.DuckDBPyConnection,
+    options: CrawlOptions = CrawlOptions(),
+    api: str = API,
+) -> None:
+    """Bring the pages and manuscripts tables up to date with Arlima, only
+    scraping the pages that were added to the index or whose content changed,
+    and deleting those that were removed from it.
+
+    A page that can no longer be downloaded or parsed keeps its rows and its
+    previous digest, so that the next refresh tries it again.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+        options (CrawlOptions, optional): How to download and parse the pages.
+        api (str, optional): URL template of the index pages. Defaults to API.
+    """
+
+    previous = set(get_unique_links(conn))
+    # A letter missing from the crawl keeps its previous entries, so that its
+    # pages are not taken as removed
+    request_index(
+        conn=conn, cache=options.cache, api=api, workers=options.fetch_workers
+    )
+    links = get_unique_links(conn)
+    removed = sorted(previous.difference(links))
+
+    migrate(conn)
+    known = dict(conn.execute("SELECT link, digest FROM page_hashes").fetchall())
+
+    # Stage the pages that are new or changed next to the live tables
+    for table in ("pages", "manuscripts", "page_hashes"):
+        conn.execute(
+            "CREATE OR REPLACE TEMP TABLE new_{0} AS FROM {0} LIMIT 0".format(table)
+        )
+    scraped = write_results(
+        conn,
+        scrape_pages(links, options, known=known),
+        pages="new_pages",
+        manuscripts="new_manuscripts",
+        hashes="new_page_hashes",
+        metrics=options.metrics,
+        errors="scrape_errors",
+        run_id=options.run_id,
+    )
+    stale = scraped + removed
+
+    # Swap the stale rows for the new ones at once, so that readers never see
+    # a page missing
+    conn.begin()
+    try:
+        conn.execute(
+            "CREATE TEMP TABLE stale AS SELECT unnest(?::VARCHAR[]) AS link", [stale]
+        )
+        conn.execute("DELETE FROM manuscripts WHERE page IN (SELECT link FROM stale)")
+        conn.execute("INSERT INTO manuscripts FROM new_manuscripts")
+        # DuckDB rejects a key deleted and inserted again in one transaction,
+        # so the pages scraped again are replaced in place
+        for table in ("pages", "page_hashes"):
+            conn.execute("""
+                DELETE FROM {0}
+                WHERE link IN (SELECT link FROM stale)
+                    AND link NOT IN (SELECT link FROM new_{0})
+                """.format(table))
+            conn.execute("INSERT OR REPLACE INTO {0} FROM new_{0}".format(table))
+        for table in ("pages", "manuscripts", "page_hashes"):
+            conn.execute("DROP TABLE new_{}".format(table))
+        conn.execute("DROP TABLE stale")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print("Refreshed {} pages, removed {}.".format(len(scraped), len(removed)))
@@ -0,0 +1,76 @@
+import duckdb
+
+from arlima.archive import PageArchive
+from arlima.error_log import setup_errors_table
+from arlima.request_pages import (
+    CrawlOptions,
+    get_unique_links,
+    parse_pages,
+    write_results,
+)
+from arlima.schema import migrate, replace_rows
+
+# Tables rebuilt by a reparse, staged as new_{table} until it completes
+STAGED_TABLES = ("pages", "manuscripts", "page_hashes", "crawl_state")
+
+
+def reparse_pages(
+    conn: duckdb.DuckDBPyConnection,
+    archive: PageArchive,
+    options: CrawlOptions = CrawlOptions(),
+) -> int:
+    """Rebuild the pages and manuscripts tables from the archived raw pages,
+    the latest download of each, without any request.
+
+    The archive is streamed through the parsing processes, so that a change
+    to the extraction only costs a parse of the corpus, not a crawl. The pages
+    are parsed next to the live tables, which are only swapped for them once
+    all are, so that an interrupted reparse leaves the previous tables whole.
+
+    The crawl's checkpoints are rebuilt along with the pages: the index's
+    links are "done" if reparsed, "failed" if they could not be parsed and
+    still "pending" if never archived, so that resuming the crawl scrapes the
+    pages the archive lacks.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+        archive (PageArchive): The archive of past crawls.
+        options (CrawlOptions, optional): How to parse the pages.
+
+    Returns:
+        int: The number of pages parsed.
+    """
+
+    migrate(conn)
+    setup_errors_table(conn)
+    for table in STAGED_TABLES:
+        conn.execute(
+            "CREATE OR REPLACE TEMP TABLE new_{0} AS FROM {0} LIMIT 0".format(table)
+        )
+    conn.execute(
+        "INSERT INTO new_crawl_state SELECT unnest(?::VARCHAR[]), 'pending', NULL, NULL",
+        [get_unique_links(conn)],
+    )
+    links = write_results(
+        conn,
+        parse_pages(archive.pages(), options, total=archive.count()),
+        pages="new_pages",
+        manuscripts="new_manuscripts",
+        hashes="new_page_hashes",
+        metrics=options.metrics,
+        errors="scrape_errors",
+        run_id=options.run_id,
+        state="new_crawl_state",
+    )
+
+    # Swap all the tables at once
+    conn.begin()
+    try:
+        for table in STAGED_TABLES:
+            replace_rows(conn, table, "FROM new_{}".format(table))
+            conn.execute("DROP TABLE new_{}".format(table))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(links)
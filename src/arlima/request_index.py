@@ -1,9 +1,9 @@
-import csv
+from concurrent.futures import ThreadPoolExecutor
 from string import ascii_lowercase
+from urllib.parse import urljoin
 
 import duckdb
-import requests
-from bs4 import BeautifulSoup
+import pyarrow as pa
 from rich.progress import (
     BarColumn,
     MofNCompleteColumn,
@@ -12,7 +12,12 @@ from rich.progress import (
     TimeElapsedColumn,
 )
 
-from arlima.fm import TMP
+from arlima.cache import ResponseCache
+from arlima.extract import extract_index
+from arlima.request_pages import Scraper
+from arlima.schema import migrate, replace_rows
+
+API = "https://www.arlima.net/{}.html"
 
 ProgressBar = Progress(
     TextColumn("{task.description}"),
@@ -22,30 +27,120 @@ ProgressBar = Progress(
 )
 
 
-def request_index(conn: duckdb.DuckDBPyConnection):
-    API = "https://www.arlima.net/{}.html"
+def request_letter(
+    scraper: Scraper, api: str, letter: str
+) -> list[tuple[str, str]] | None:
+    """Download a letter's index page and collect its (title, link) pairs.
+
+    Returns:
+        list[tuple[str, str]] | None: The pairs, with absolute links, or None
+            if the page could not be downloaded or lacks the letter's heading.
+    """
+
+    url = api.format(letter)
+    content = scraper.fetch(url)
+    # A missing page comes back empty
+    if not content:
+        return
+    entries = extract_index(content, letter)
+    if entries is None:
+        print("No index heading for letter: ", letter)
+        return
+    return [(title, urljoin(url, href)) for title, href in entries]
+
+
+def request_index(
+    conn: duckdb.DuckDBPyConnection,
+    cache: ResponseCache | None = None,
+    api: str = API,
+    workers: int | None = None,
+) -> list[str]:
+    """Crawl the index pages, one per letter, into the arlima_index table.
+
+    The letters are downloaded concurrently through one pooled session, and
+    their links, each kept once, replace the table's at once. The entries of
+    a letter that could not be downloaded are kept from the previous crawl,
+    so that its pages are neither dropped from a crawl nor taken as removed
+    from Arlima. So are, while any letter fails, the entries of databases
+    older than the letter column, whose letter is not known; once every
+    letter is crawled, those no longer listed are dropped.
 
-    conn.execute("DROP TABLE IF EXISTS arlima_index;")
-    conn.execute("CREATE TABLE arlima_index (title VARCHAR, link VARCHAR);")
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+        cache (ResponseCache | None, optional): Cache of previously downloaded
+            pages. Defaults to None.
+        api (str, optional): URL template of the index pages. Defaults to API.
+        workers (int | None, optional): Number of downloading threads.
+            Defaults to None, ThreadPoolExecutor's default.
 
-    with ProgressBar as p:
+    Returns:
+        list[str]: The letters whose index page could not be downloaded.
+    """
+
+    scraper = Scraper(pool_size=workers, cache=cache)
+    failed = []
+    links = {}
+
+    with ProgressBar as p, ThreadPoolExecutor(workers) as executor:
         t = p.add_task(description="Crawling index", total=len(ascii_lowercase))
-        for letter in ascii_lowercase:
-            temp_file = TMP.joinpath("index_{}.csv".format(letter))
-            api = API.format(letter)
-            response = requests.get(api)
-            soup = BeautifulSoup(response.content, features="lxml")
-            header = soup.find("h3", string=letter.capitalize())
-            with open(temp_file, "w") as f:
-                writer = csv.writer(f)
-                writer.writerow(["title", "link"])
-                for i in header.parent.find_all("a"):
-                    title = i.text.strip()
-                    href = i.get("href")
-                    link = "https://www.arlima.net" + href
-                    writer.writerow([title, link])
-            conn.execute(
-                "INSERT INTO arlima_index SELECT * FROM '{}'".format(temp_file)
-            )
-            temp_file.unlink()
+        # Futures are collected in order of the letters, so that a link listed
+        # under several letters keeps the title of the first one
+        futures = [
+            executor.submit(request_letter, scraper, api, letter)
+            for letter in ascii_lowercase
+        ]
+        for letter, future in zip(ascii_lowercase, futures):
+            entries = future.result()
             p.advance(t)
+            if entries is None:
+                failed.append(letter)
+                continue
+            for title, link in entries:
+                links.setdefault(link, (title, letter))
+
+    index = pa.table(
+        {
+            "title": [title for title, _ in links.values()],
+            "link": list(links),
+            "letter": [letter for _, letter in links.values()],
+        },
+        schema=pa.schema(
+            [("title", pa.string()), ("link", pa.string()), ("letter", pa.string())]
+        ),
+    )
+    migrate(conn)
+    conn.begin()
+    try:
+        conn.register("crawled_index", index)
+        conn.execute(
+            """
+            CREATE OR REPLACE TEMP TABLE kept_index AS
+            SELECT title, link, letter FROM arlima_index
+            WHERE (
+                letter IN (SELECT unnest($failed::VARCHAR[]))
+                OR (letter IS NULL AND len($failed::VARCHAR[]) > 0)
+            )
+                AND link NOT IN (SELECT link FROM crawled_index)
+            """,
+            {"failed": failed},
+        )
+        (kept,) = conn.execute("SELECT count(*) FROM kept_index").fetchone()
+        # Sorted by link, like the table once clustered
+        replace_rows(
+            conn,
+            "arlima_index",
+            "SELECT title, link, letter FROM crawled_index "
+            "UNION ALL FROM kept_index ORDER BY link",
+        )
+        conn.execute("DROP TABLE kept_index")
+        conn.unregister("crawled_index")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if failed:
+        print(
+            "Could not crawl the index of letters {}, kept their {} previous "
+            "links.".format(", ".join(failed), kept)
+        )
+    return failed
@@ -1,8 +1,19 @@
-import csv
-import io
-from concurrent.futures import ThreadPoolExecutor
-from contextlib import contextmanager
-from typing import Generator
+import hashlib
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from typing import Any, Callable, Generator, Iterable
 
 import duckdb
 import requests
@@ -15,34 +26,27 @@ from rich.progress import (
     TimeElapsedColumn,
 )
 
-from arlima.fm import TMP
+from arlima.archive import ArchiveWriter, PageArchive
+from arlima.cache import ResponseCache
+from arlima.crawler import RETRY_STATUSES, AsyncScraper
+from arlima.error_log import collect_errors, error_record, setup_errors_table
+from arlima.exceptions import DownloadException
+from arlima.metrics import CrawlMetrics
 from arlima.page import Page
-from arlima.witness import Witness, yield_witnesses
-
-works_file_path = TMP.joinpath("works.csv")
-witnesses_file_path = TMP.joinpath("witnesses.csv")
-
-
-@contextmanager
-def csv_contexts() -> Generator[tuple[io.TextIOWrapper, io.TextIOWrapper], None, None]:
-    f1 = works_file_path.open(mode="w")
-    f2 = witnesses_file_path.open(mode="w")
-    try:
-        yield f1, f2
-    finally:
-        f1.close()
-        f2.close()
-
-
-def setup_writers(
-    f1: io.TextIOWrapper, f2: io.TextIOWrapper
-) -> tuple[csv.DictWriter, csv.DictWriter]:
-    works = csv.DictWriter(f1, fieldnames=Page.fields())
-    manuscripts = csv.DictWriter(f2, fieldnames=Witness.fields())
-    works.writeheader()
-    manuscripts.writeheader()
-    return works, manuscripts
+from arlima.records import ParsedPage
+from arlima.schema import reset_tables
+from arlima.shards import setup_shard_table, shard_of
+from arlima.witness import parse_witnesses
+from arlima.writer import TableWriter
 
+# The parsing processes start from a fresh interpreter: a fork of the crawl,
+# whose download threads may hold a lock at that moment, could deadlock. The
+# fork server imports the parser once, and forks the processes from there.
+if "forkserver" in multiprocessing.get_all_start_methods():
+    PARSE_CONTEXT = multiprocessing.get_context("forkserver")
+    PARSE_CONTEXT.set_forkserver_preload([__name__])
+else:
+    PARSE_CONTEXT = multiprocessing.get_context("spawn")
 
 ProgressBar = Progress(
     TextColumn("{task.description}"),
@@ -53,83 +57,557 @@ ProgressBar = Progress(
 
 
 def setup_pages_table(conn: duckdb.DuckDBPyConnection) -> None:
-    conn.execute("DROP TABLE IF EXISTS pages;")
-    conn.execute(
-        "CREATE TABLE pages (link VARCHAR, form VARCHAR, genre VARCHAR, arlima_permalink VARCHAR, jonas_permalink VARCHAR, simple_title VARCHAR, canonic_title VARCHAR, language VARCHAR, date_description VARCHAR, year_earliest BIGINT, year_latest BIGINT)"
-    )
+    reset_tables(conn, "pages")
 
 
 def setup_witnesses_table(conn: duckdb.DuckDBPyConnection) -> None:
-    conn.execute("DROP TABLE IF EXISTS manuscripts;")
-    conn.execute(
-        "CREATE TABLE manuscripts (page VARCHAR, archive_href VARCHAR, settlement VARCHAR, repository VARCHAR, collection VARCHAR, idno VARCHAR)"
-    )
+    reset_tables(conn, "manuscripts")
+
+
+def setup_hashes_table(conn: duckdb.DuckDBPyConnection) -> None:
+    reset_tables(conn, "page_hashes")
 
 
 def get_unique_links(conn: duckdb.DuckDBPyConnection) -> list:
-    return [
-        tup[0]
-        for tup in duckdb.table("arlima_index", connection=conn)
-        .aggregate("link")
-        .fetchall()
-    ]
+    # Links are the index's key, so each is there once
+    return [tup[0] for tup in conn.execute("SELECT link FROM arlima_index").fetchall()]
 
 
-def request_pages(conn: duckdb.DuckDBPyConnection):
-    # Set up the database for new tables
-    setup_pages_table(conn)
-    setup_witnesses_table(conn)
-    links = get_unique_links(conn)
+def parse_page(link: str, content: bytes) -> ParsedPage:
+    """Parse a downloaded page into its pages row and manuscripts rows.
+
+    Runs in the parsing processes, so it only returns plain, picklable records
+    and no part of the HTML tree, along with its timings and errors for the
+    crawl's metrics.
+
+    Args:
+        link (str): The page's URL.
+        content (bytes): The page's raw HTML.
+
+    Returns:
+        ParsedPage: The page's row and its witnesses' rows, if it is a text.
+    """
+
+    timings = {}
+    with collect_errors() as errors:
+        try:
+            start = time.perf_counter()
+            page = Page(content=content, link=link)
+            record = page.record()
+            timings["parse"] = time.perf_counter() - start
+            witnesses = []
+            if record is not None and page.mss is not None:
+                start = time.perf_counter()
+                witnesses = parse_witnesses(page.mss, link)
+                timings["witnesses"] = time.perf_counter() - start
+            return ParsedPage(record, witnesses, page.is_text, timings, errors)
+        except Exception as e:
+            timings.setdefault("parse", time.perf_counter() - start)
+            errors.append(error_record(e, link))
+            return ParsedPage(None, [], None, timings, errors)
+
+
+@dataclass
+class CrawlOptions:
+    """How to download and parse the pages.
+
+    Attributes:
+        fetch_workers (int | None): Number of downloading threads, or of
+            concurrent requests for the async engine.
+        parse_workers (int | None): Number of parsing processes.
+        engine (str): "threads" for a pool of requests sessions, "async" for
+            the asyncio crawler.
+        rate (float | None): Maximum requests per second to a host, only
+            enforced by the async engine.
+        cache (ResponseCache | None): Cache of previously downloaded pages.
+        archive (PageArchive | None): Where to keep the raw content of the
+            downloaded pages, for `reparse_pages`.
+        window (int): Maximum number of pages held at once by each stage of
+            the crawl, downloading or parsing, which bounds its memory.
+        metrics (CrawlMetrics | None): Where to record the crawl's timings
+            and counters.
+        run_id (str): Identifies the crawl's rows in `scrape_errors` and
+            `crawl_metrics`.
+    """
+
+    fetch_workers: int | None = None
+    parse_workers: int | None = None
+    engine: str = "threads"
+    rate: float | None = None
+    cache: ResponseCache | None = None
+    archive: PageArchive | None = None
+    window: int = 128
+    metrics: CrawlMetrics | None = None
+    run_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+
+def bounded_map(
+    executor: Executor,
+    fn: Callable,
+    jobs: Iterable[tuple[Any, tuple]],
+    window: int,
+) -> Generator[tuple[Any, Future], None, None]:
+    """Run `fn(*args)` for each `(key, args)` job, with at most `window` jobs
+    submitted and not yet yielded, and yield each `(key, future)` as soon as
+    the job is done, in whatever order they finish.
+
+    Examples:
+        >>> with ThreadPoolExecutor(2) as executor:
+        ...     jobs = ((n, (n, n)) for n in range(5))
+        ...     results = bounded_map(executor, pow, jobs, window=2)
+        ...     sorted((key, future.result()) for key, future in results)
+        [(0, 1), (1, 1), (2, 4), (3, 27), (4, 256)]
+
+    Args:
+        executor (Executor): The pool running the jobs.
+        fn (Callable): The function to run.
+        jobs (Iterable[tuple[Any, tuple]]): Pairs of a key identifying the job
+            and the arguments of `fn`. Pulled lazily, as room frees up.
+        window (int): Maximum number of jobs in flight.
+
+    Yields:
+        Generator[tuple[Any, Future], None, None]: The job's key and its done
+            future.
+    """
+
+    pending = {}
+    for key, args in jobs:
+        while len(pending) >= window:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future
+        pending[executor.submit(fn, *args)] = key
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
+
+
+def download_pages(
+    links: list, options: CrawlOptions
+) -> Generator[tuple[str, bytes | None], None, None]:
+    """Download the pages and yield each (link, content) pair as it arrives.
+
+    Args:
+        links (list): The pages' URLs.
+        options (CrawlOptions): How to download the pages.
+
+    Yields:
+        Generator[tuple[str, bytes | None], None, None]: The page's URL and
+            its raw content, or None if it could not be downloaded.
+    """
+
+    with ExitStack() as stack:
+        archive = None
+        if options.archive:
+            archive = stack.enter_context(options.archive.writer(options.run_id))
+        if options.engine == "async":
+            scraper = AsyncScraper(
+                concurrency=options.fetch_workers or 16,
+                rate=options.rate,
+                cache=options.cache,
+                window=options.window,
+                metrics=options.metrics,
+                archive=archive,
+            )
+            yield from scraper(links)
+        else:
+            scraper = Scraper(
+                pool_size=options.fetch_workers,
+                cache=options.cache,
+                metrics=options.metrics,
+                archive=archive,
+            )
+            with ThreadPoolExecutor(options.fetch_workers) as fetcher:
+                jobs = ((link, (link,)) for link in links)
+                for link, download in bounded_map(
+                    fetcher, scraper.fetch, jobs, options.window
+                ):
+                    yield link, download.result()
+
+
+def scrape_pages(
+    links: list, options: CrawlOptions, known: dict | None = None
+) -> Generator[tuple[str, str | None, ParsedPage], None, None]:
+    """Download and parse the pages, yielding each one's results as they come.
+
+    Args:
+        links (list): The pages' URLs.
+        options (CrawlOptions): How to download and parse the pages.
+        known (dict | None, optional): Content digests of pages scraped
+            before, by link. A page whose content still has the same digest is
+            not parsed again and not yielded. Defaults to None.
+
+    Yields:
+        Generator[tuple[str, str | None, ParsedPage], None, None]: The page's
+            URL, the SHA-256 digest of its content and the result of
+            `parse_page`, failed without a digest if the page could not be
+            downloaded.
+    """
+
+    yield from parse_pages(
+        download_pages(links, options),
+        options,
+        known=known,
+        total=len(links),
+        description="requesting pages",
+    )
+
+
+def parse_pages(
+    contents: Iterable[tuple[str, bytes | None]],
+    options: CrawlOptions,
+    known: dict | None = None,
+    total: int | None = None,
+    description: str = "parsing pages",
+) -> Generator[tuple[str, str | None, ParsedPage], None, None]:
+    """Parse pages in the parsing processes as they come, downloaded or read
+    from the archive, and yield each one's results.
 
-    with csv_contexts() as (f1, f2), ProgressBar as p, ThreadPoolExecutor() as executor:
-        # Set up the CSV writers
-        works, manuscripts = setup_writers(f1, f2)
+    Args:
+        contents (Iterable[tuple[str, bytes | None]]): Each page's URL and raw
+            content, None if it could not be downloaded.
+        options (CrawlOptions): How to parse the pages.
+        known (dict | None, optional): Content digests of pages scraped
+            before, by link, whose pages are skipped if unchanged. Defaults to
+            None.
+        total (int | None, optional): Number of pages, for the progress bar.
+        description (str, optional): Label of the progress bar.
 
+    Yields:
+        Generator[tuple[str, str | None, ParsedPage], None, None]: The page's
+            URL, the SHA-256 digest of its content and the result of
+            `parse_page`. A page that could not be downloaded has no digest
+            and a failed result.
+    """
+
+    known = known or {}
+    metrics = options.metrics or CrawlMetrics()
+    with ProgressBar as p, ProcessPoolExecutor(
+        options.parse_workers, mp_context=PARSE_CONTEXT
+    ) as parser:
         # Set up the progress bar's task
-        t = p.add_task(description="requesting pages", total=len(links))
+        t = p.add_task(description=description, total=total)
+
+        # Pages that could not be downloaded, passed on without parsing
+        failed = []
 
-        # Set up the scraper
-        scraper = Scraper()
+        def downloaded() -> Generator[tuple[tuple, tuple], None, None]:
+            for link, content in contents:
+                if content is None:
+                    metrics.count("failed_downloads")
+                    p.advance(t)
+                    failed.append(link)
+                    continue
+                digest = hashlib.sha256(content).hexdigest()
+                if known.get(link) == digest:
+                    metrics.count("unchanged_pages")
+                    p.advance(t)
+                    continue
+                yield (link, digest), (link, content)
 
-        # Run multi-threaded requests
-        for result in executor.map(scraper, links):
+        # Hand each page, as soon as it is downloaded, to the parsing processes,
+        # and pass on its flat rows as soon as it is parsed
+        for (link, digest), parsed in bounded_map(
+            parser, parse_page, downloaded(), options.window
+        ):
             # Regardless the scraping success, advance the progress bar
             p.advance(t)
+            result = parsed.result()
+            record_parsed(metrics, result)
+            yield link, digest, result
+            while failed:
+                yield failed_download(metrics, failed.pop())
+        while failed:
+            yield failed_download(metrics, failed.pop())
+
 
-            # Ignore incorrectly scraped pages
-            if not result:
-                continue
+def failed_download(metrics: CrawlMetrics, link: str) -> tuple[str, None, ParsedPage]:
+    result = ParsedPage(None, [], None, {}, [error_record(DownloadException(link))])
+    record_parsed(metrics, result)
+    return link, None, result
 
-            # Write the page's results to the works CSV
-            works.writerow(result.dict())
 
-            # Write the page's manuscripts to the manuscripts CSV
-            for mss_row in yield_witnesses(result):
-                manuscripts.writerow(mss_row)
+def record_parsed(metrics: CrawlMetrics, result: ParsedPage) -> None:
+    for stage, seconds in result.timings.items():
+        metrics.observe(stage, seconds)
+    if result.is_text:
+        metrics.count("text_pages")
+        metrics.count("witnesses", len(result.witnesses))
+    elif result.is_text is False:
+        metrics.count("non_text_pages")
+    for error in result.errors:
+        metrics.count("error:" + error.error)
 
-    # Insert into the new tables the scraping results
-    conn.execute("INSERT INTO pages SELECT * FROM '{}'".format(works_file_path))
+
+def setup_state_table(
+    conn: duckdb.DuckDBPyConnection, shard: tuple[int, int] | None = None
+) -> None:
+    """Start a crawl's checkpoints: every link of the index, or of its shard,
+    pending.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+        shard (tuple[int, int] | None, optional): The crawl's shard, i of N,
+            if the index is split between several crawls. Defaults to None.
+    """
+
+    reset_tables(conn, "crawl_state")
+    links = get_unique_links(conn)
+    if shard is not None:
+        index, count = shard
+        links = [link for link in links if shard_of(link, count) == index]
     conn.execute(
-        "INSERT INTO manuscripts SELECT * FROM '{}'".format(witnesses_file_path)
+        "INSERT INTO crawl_state SELECT unnest(?::VARCHAR[]), 'pending', NULL, NULL",
+        [links],
+    )
+
+
+def pending_links(conn: duckdb.DuckDBPyConnection) -> list:
+    """Links of the crawl that have not been checkpointed yet, or that could
+    not be downloaded or parsed and are worth trying again."""
+
+    return [
+        tup[0]
+        for tup in conn.execute(
+            "SELECT link FROM crawl_state WHERE status IN ('pending', 'failed')"
+        ).fetchall()
+    ]
+
+
+def mark_links(
+    conn: duckdb.DuckDBPyConnection,
+    links: list,
+    statuses: list,
+    run_id: str | None,
+    state: str = "crawl_state",
+) -> None:
+    conn.execute(
+        """
+        UPDATE {0} SET status = s.status, run_id = $3, updated = now()
+        FROM (SELECT unnest($1::VARCHAR[]) AS link, unnest($2::VARCHAR[]) AS status) s
+        WHERE {0}.link = s.link
+        """.format(state),
+        [links, statuses, run_id],
+    )
+
+
+def write_results(
+    conn: duckdb.DuckDBPyConnection,
+    results: Generator[tuple[str, str | None, ParsedPage], None, None],
+    pages: str = "pages",
+    manuscripts: str = "manuscripts",
+    hashes: str = "page_hashes",
+    metrics: CrawlMetrics | None = None,
+    errors: str | None = None,
+    run_id: str | None = None,
+    state: str | None = None,
+    checkpoint: int = 500,
+) -> list:
+    """Append the scraped pages to the tables, in batches, as they come.
+
+    Given a `state` table, the rows are committed every `checkpoint` pages,
+    in the same transaction as the pages' links are marked "done", or
+    "failed" if they could not be downloaded or parsed, so that an
+    interrupted crawl only loses the pages since its last checkpoint.
+
+    A failed page keeps no digest, so that the next crawl, or refresh, tries
+    it again.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+        results (Generator): The results of `scrape_pages`.
+        pages (str, optional): Table of the pages. Defaults to "pages".
+        manuscripts (str, optional): Table of the witnesses. Defaults to
+            "manuscripts".
+        hashes (str, optional): Table of the content digests. Defaults to
+            "page_hashes".
+        metrics (CrawlMetrics | None, optional): Where to record the time
+            spent inserting each page's rows.
+        errors (str | None, optional): Table of the parsing errors, not kept
+            if None. Defaults to None.
+        run_id (str | None, optional): The crawl's id in the errors and state
+            tables.
+        state (str | None, optional): Table of the links' statuses, as made by
+            `setup_state_table`. Defaults to None, without checkpoints.
+        checkpoint (int, optional): Pages committed at once. Defaults to 500.
+
+    Returns:
+        list: Links of the pages scraped, not those that failed.
+    """
+
+    metrics = metrics or CrawlMetrics()
+    links = []
+    batch, statuses = [], []
+    with ExitStack() as stack:
+        works = stack.enter_context(TableWriter(conn, pages))
+        witnesses = stack.enter_context(TableWriter(conn, manuscripts))
+        digests = stack.enter_context(TableWriter(conn, hashes))
+        writers = [works, witnesses, digests]
+        problems = None
+        if errors:
+            problems = stack.enter_context(TableWriter(conn, errors))
+            writers.append(problems)
+
+        def commit(more: bool = True) -> None:
+            for writer in writers:
+                writer.flush()
+            mark_links(conn, batch, statuses, run_id, state)
+            conn.commit()
+            batch.clear()
+            statuses.clear()
+            if more:
+                conn.begin()
+
+        if state:
+            conn.begin()
+        try:
+            for link, digest, result in results:
+                with metrics.timer("insert"):
+                    failed = result.is_text is None
+                    if not failed:
+                        links.append(link)
+                        digests.append((link, digest))
+                    if problems is not None:
+                        for error in result.errors:
+                            problems.append((run_id, *error))
+                    if state:
+                        batch.append(link)
+                        statuses.append("failed" if failed else "done")
+
+                    # Write the page's results to the pages table
+                    if result.page is not None:
+                        works.append(result.page)
+
+                    # Write the page's manuscripts to the manuscripts table
+                    for mss_row in result.witnesses:
+                        witnesses.append(mss_row)
+
+                    if len(batch) >= checkpoint:
+                        commit()
+            if state:
+                commit(more=False)
+        except BaseException:
+            # Whatever was not committed is lost with the crawl
+            if state:
+                conn.rollback()
+            raise
+    return links
+
+
+def request_pages(
+    conn: duckdb.DuckDBPyConnection,
+    options: CrawlOptions = CrawlOptions(),
+    resume: bool = False,
+    shard: tuple[int, int] | None = None,
+) -> None:
+    """Scrape the pages of the index into the pages and manuscripts tables,
+    checkpointing the crawl in `crawl_state`.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+        options (CrawlOptions, optional): How to download and parse the pages.
+        resume (bool, optional): Only scrape the links an interrupted crawl
+            left pending, keeping the rows it committed. Defaults to False.
+        shard (tuple[int, int] | None, optional): Only scrape the links of
+            shard i of N, for `merge_shards`. Defaults to None.
+    """
+
+    if not resume:
+        # Set up the database for new tables, dropping the previous crawl's
+        # checkpoints along with its rows
+        reset_tables(conn, "pages", "manuscripts", "page_hashes", "crawl_state")
+        setup_state_table(conn, shard)
+        if shard is not None:
+            setup_shard_table(conn, *shard)
+    setup_errors_table(conn)
+    links = pending_links(conn)
+
+    write_results(
+        conn,
+        scrape_pages(links, options),
+        metrics=options.metrics,
+        errors="scrape_errors",
+        run_id=options.run_id,
+        state="crawl_state",
     )
 
 
 class Scraper:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        pool_size: int | None = None,
+        cache: ResponseCache | None = None,
+        metrics: CrawlMetrics | None = None,
+        archive: ArchiveWriter | None = None,
+        timeout: float = 60,
+        backoff: float = 0.5,
+    ) -> None:
+        # Size the connection pool like ThreadPoolExecutor's default number of
+        # workers, so that threads do not queue for a connection
+        if not pool_size:
+            pool_size = min(32, (os.cpu_count() or 1) + 4)
         session = requests.Session()
-        session.mount(
-            "https://",
-            requests.adapters.HTTPAdapter(
-                max_retries=requests.adapters.Retry(total=5, status_forcelist=[500])
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=pool_size,
+            max_retries=requests.adapters.Retry(
+                total=5, status_forcelist=RETRY_STATUSES, backoff_factor=backoff
             ),
         )
+        # Both schemes, as the local test server and some links use http
+        for prefix in ("http://", "https://"):
+            session.mount(prefix, adapter)
         self.session = session
+        self.cache = cache
+        self.metrics = metrics or CrawlMetrics()
+        self.archive = archive
+        self.timeout = timeout
+
+    def fetch(self, link: str) -> bytes | None:
+        entry = None
+        if self.cache:
+            entry, content = self.cache.lookup(link)
+            if content is not None or self.cache.offline:
+                if content is not None:
+                    self.metrics.count("cache_hits")
+                    if self.archive:
+                        self.archive.add(link, entry.status, content)
+                return content
+        try:
+            with self.metrics.timer("download"):
+                response = self.session.get(
+                    link,
+                    headers=ResponseCache.validators(entry),
+                    timeout=self.timeout,
+                )
+        except Exception:
+            # No content: the crawl records a DownloadException in its stead
+            return
+        retries = getattr(response.raw, "retries", None)
+        if retries is not None and retries.history:
+            self.metrics.count("retries", len(retries.history))
+        self.metrics.count("bytes_downloaded", len(response.content))
+        if response.status_code == 304:
+            self.metrics.count("not_modified")
+        content = response.content
+        if self.cache:
+            content = self.cache.update(
+                link, entry, response.status_code, response.headers, content
+            )
+        if self.archive:
+            self.archive.add(link, response.status_code, content)
+        if response.status_code not in (200, 304):
+            return
+        return content
 
     def __call__(self, link: str) -> Page | None:
+        content = self.fetch(link)
+        if content is None:
+            return
         try:
-            response = self.session.get(link)
-            page = Page(content=response.content, link=link)
-            if page._soup:
-                return page
-        except Exception as e:
-            print("Failed to parse URL: ", link)
+            page = Page(content=content, link=link)
+        except Exception:
+            # The crawl parses with parse_page, which records the error
+            return
+        if page.is_text:
+            return page
@@ -0,0 +1,215 @@
+from typing import Callable, NamedTuple
+
+import duckdb
+
+# The tables as the scraper keeps them, with their keys
+TABLES = {
+    "arlima_index": "title VARCHAR, link VARCHAR PRIMARY KEY, letter VARCHAR",
+    "pages": "link VARCHAR PRIMARY KEY, form VARCHAR, genre VARCHAR, arlima_permalink VARCHAR, jonas_permalink VARCHAR, simple_title VARCHAR, canonic_title VARCHAR, language VARCHAR, date_description VARCHAR, year_earliest BIGINT, year_latest BIGINT",
+    "manuscripts": "page VARCHAR NOT NULL, archive_href VARCHAR, settlement VARCHAR, repository VARCHAR, collection VARCHAR, idno VARCHAR, shelfmark VARCHAR, folios VARCHAR, notes VARCHAR",
+    "page_hashes": "link VARCHAR PRIMARY KEY, digest VARCHAR",
+    "crawl_state": "link VARCHAR PRIMARY KEY, status VARCHAR, run_id VARCHAR, updated TIMESTAMP",
+    "scrape_errors": "run_id VARCHAR, link VARCHAR, stage VARCHAR, field VARCHAR, entry VARCHAR, error VARCHAR",
+}
+
+# Columns the linker matches queries against: table, key column, matched column
+TARGETS = {
+    "simple_titles": ("pages", "link", "simple_title"),
+    "canonic_titles": ("pages", "link", "canonic_title"),
+    "shelfmarks": ("manuscripts", "page", "shelfmark"),
+}
+
+# Columns the rows are sorted by, so that DuckDB's zone maps skip the row
+# groups of other keys
+CLUSTER_KEYS = {
+    "arlima_index": "link",
+    "pages": "link",
+    "manuscripts": "page",
+    "page_hashes": "link",
+    "crawl_state": "link",
+}
+
+# Secondary indexes, only on tables whose indexed columns are never updated
+# in place: DuckDB rejects such updates and skips them in upserts
+INDEXES = {
+    "manuscripts_page": ("manuscripts", "page"),
+    "manuscripts_place": ("manuscripts", "settlement, repository"),
+}
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[duckdb.DuckDBPyConnection], None]
+
+
+def tables(conn: duckdb.DuckDBPyConnection) -> set[str]:
+    return {
+        row[0]
+        for row in conn.execute(
+            "SELECT table_name FROM duckdb_tables() "
+            "WHERE database_name = current_database() AND schema_name = 'main'"
+        ).fetchall()
+    }
+
+
+def create_bare_tables(conn: duckdb.DuckDBPyConnection) -> None:
+    # The tables as the scraper first made them, without any key
+    for table, columns in TABLES.items():
+        columns = columns.replace(" PRIMARY KEY", "").replace(" NOT NULL", "")
+        conn.execute("CREATE TABLE IF NOT EXISTS {} ({})".format(table, columns))
+
+
+def rebuild(conn: duckdb.DuckDBPyConnection, table: str, dedupe: bool = False) -> None:
+    """Rewrite a table with its definition in TABLES, its rows sorted by its
+    CLUSTER_KEYS column, and its indexes.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+        table (str): The table.
+        dedupe (bool, optional): Keep a single row per key, for tables made
+            before they had one. Defaults to False.
+    """
+
+    indexes = [name for name, (owner, _) in INDEXES.items() if owner == table]
+    for name in indexes:
+        conn.execute("DROP INDEX IF EXISTS {}".format(name))
+    key = CLUSTER_KEYS.get(table)
+    select = "SELECT * FROM {}".format(table)
+    if dedupe and "PRIMARY KEY" in TABLES[table]:
+        select += " WHERE {0} IS NOT NULL QUALIFY row_number() OVER (PARTITION BY {0}) = 1".format(
+            key
+        )
+    if key:
+        select += " ORDER BY {}".format(key)
+    conn.execute("CREATE TABLE {}__new ({})".format(table, TABLES[table]))
+    # By name, as older tables may lack the columns added since
+    conn.execute("INSERT INTO {}__new BY NAME {}".format(table, select))
+    conn.execute("DROP TABLE {}".format(table))
+    conn.execute("ALTER TABLE {0}__new RENAME TO {0}".format(table))
+    for name in indexes:
+        conn.execute("CREATE INDEX {} ON {} ({})".format(name, *INDEXES[name]))
+
+
+def key_tables(conn: duckdb.DuckDBPyConnection) -> None:
+    for table in TABLES:
+        rebuild(conn, table, dedupe=True)
+
+
+def add_index_letters(conn: duckdb.DuckDBPyConnection) -> None:
+    # Older entries do not know their letter until the index is crawled again
+    conn.execute("ALTER TABLE arlima_index ADD COLUMN IF NOT EXISTS letter VARCHAR")
+
+
+MIGRATIONS = [
+    Migration(1, "Create the tables", create_bare_tables),
+    Migration(2, "Key, index and sort the tables", key_tables),
+    Migration(3, "Record the letter of each index entry", add_index_letters),
+]
+
+
+def schema_version(conn: duckdb.DuckDBPyConnection) -> int:
+    if "schema_version" not in tables(conn):
+        return 0
+    return conn.execute(
+        "SELECT coalesce(max(version), 0) FROM schema_version"
+    ).fetchone()[0]
+
+
+def migrate(conn: duckdb.DuckDBPyConnection) -> int:
+    """Bring the database's tables to the latest version of the schema, each
+    migration in its own transaction.
+
+    A database made before migrations existed starts from version 1, since
+    its tables are those the first migration creates.
+
+    Examples:
+        >>> conn = duckdb.connect()
+        >>> migrate(conn)
+        3
+        >>> conn.execute(
+        ...     "SELECT constraint_type FROM duckdb_constraints() "
+        ...     "WHERE table_name = 'pages' AND constraint_column_names = ['link']"
+        ... ).fetchall()
+        [('PRIMARY KEY',), ('NOT NULL',)]
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+
+    Returns:
+        int: The schema's version.
+    """
+
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY, description VARCHAR, applied TIMESTAMP)"
+    )
+    version = schema_version(conn)
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+        conn.begin()
+        try:
+            migration.apply(conn)
+            conn.execute(
+                "INSERT INTO schema_version VALUES (?, ?, now())",
+                [migration.version, migration.description],
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = migration.version
+    return version
+
+
+def reset_tables(conn: duckdb.DuckDBPyConnection, *names: str) -> None:
+    """Empty some of the scraper's tables in one transaction, creating them if
+    need be, so that none is left emptied without the others."""
+
+    migrate(conn)
+    conn.begin()
+    try:
+        for table in names:
+            conn.execute("DELETE FROM {}".format(table))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def cluster(conn: duckdb.DuckDBPyConnection, *names: str) -> None:
+    """Sort the rows of tables by their key, after rows were appended in the
+    order they were scraped.
+
+    Rewriting the tables takes a while on a full database, so it is left to
+    the `cluster` command rather than run after each crawl.
+    """
+
+    conn.begin()
+    try:
+        for table in names:
+            rebuild(conn, table)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def replace_rows(conn: duckdb.DuckDBPyConnection, table: str, source: str) -> None:
+    """Make a table's rows those of a query, inside the caller's transaction.
+
+    DuckDB rejects a key deleted and inserted again in one transaction, so
+    keyed rows still present are replaced in place rather than deleted.
+    """
+
+    key = CLUSTER_KEYS.get(table) if "PRIMARY KEY" in TABLES[table] else None
+    if key is None:
+        conn.execute("DELETE FROM {}".format(table))
+        conn.execute("INSERT INTO {} {}".format(table, source))
+        return
+    conn.execute(
+        "DELETE FROM {0} WHERE {1} NOT IN (SELECT {1} FROM ({2}))".format(
+            table, key, source
+        )
+    )
+    conn.execute("INSERT OR REPLACE INTO {} {}".format(table, source))
@@ -0,0 +1,195 @@
+import hashlib
+from pathlib import Path
+
+import duckdb
+
+from arlima.catalog import sql_literal
+from arlima.fm import SHARDS
+from arlima.schema import migrate, replace_rows
+
+# Tables a shard fills, merged into the canonical database
+MERGED_TABLES = ("pages", "manuscripts", "page_hashes", "crawl_state")
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """Read a "i/N" shard specification, i counted from 0.
+
+    Examples:
+        >>> parse_shard("2/4")
+        (2, 4)
+        >>> parse_shard("4/4")
+        Traceback (most recent call last):
+        ...
+        ValueError: Invalid shard 4/4, expected i/N with 0 <= i < N.
+    """
+
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        index, count = -1, 0
+    if not 0 <= index < count:
+        raise ValueError("Invalid shard {}, expected i/N with 0 <= i < N.".format(spec))
+    return index, count
+
+
+def shard_of(link: str, count: int) -> int:
+    """The shard of a link, the same on every machine and run.
+
+    Examples:
+        >>> shard_of("https://www.arlima.net/no/35", 4)
+        2
+    """
+
+    digest = hashlib.sha1(link.encode()).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+def shard_path(index: int, count: int, root: Path = SHARDS) -> Path:
+    root.mkdir(parents=True, exist_ok=True)
+    return root.joinpath("shard-{}-of-{}.db".format(index, count))
+
+
+def setup_shard_table(conn: duckdb.DuckDBPyConnection, index: int, count: int) -> None:
+    conn.execute("CREATE OR REPLACE TABLE shard_info (shard INTEGER, shards INTEGER)")
+    conn.execute("INSERT INTO shard_info VALUES (?, ?)", [index, count])
+
+
+def check_shards(conn: duckdb.DuckDBPyConnection, names: list[str]) -> int:
+    """Make sure the attached shards are all those of one split of one index,
+    and together tried each of its links once.
+
+    Links that failed are let through, for `--resume` to try again once
+    merged, but links still pending mean a shard's crawl is unfinished.
+
+    Raises:
+        ValueError: What is duplicated or missing.
+
+    Returns:
+        int: The number of links that failed.
+    """
+
+    info = conn.execute(
+        " UNION ALL ".join(
+            "SELECT shard, shards FROM {}.shard_info".format(name) for name in names
+        )
+    ).fetchall()
+    counts = {shards for _, shards in info}
+    if len(counts) != 1:
+        raise ValueError("The shards come from different splits: {}.".format(counts))
+    count = counts.pop()
+    found = sorted(shard for shard, _ in info)
+    if found != list(range(count)):
+        missing = sorted(set(range(count)).difference(found))
+        duplicated = sorted({shard for shard in found if found.count(shard) > 1})
+        raise ValueError(
+            "Expected shards 0 to {}, missing {}, duplicated {}.".format(
+                count - 1, missing, duplicated
+            )
+        )
+
+    first = names[0]
+    for name in names[1:]:
+        (differences,) = conn.execute("""
+            SELECT count(*) FROM (
+                (SELECT link FROM {0}.arlima_index EXCEPT SELECT link FROM {1}.arlima_index)
+                UNION ALL
+                (SELECT link FROM {1}.arlima_index EXCEPT SELECT link FROM {0}.arlima_index)
+            )
+            """.format(first, name)).fetchone()
+        if differences:
+            raise ValueError(
+                "The shards crawled different indexes, {} links differ.".format(
+                    differences
+                )
+            )
+
+    states = " UNION ALL ".join(
+        "SELECT link, status FROM {}.crawl_state".format(name) for name in names
+    )
+    duplicated, missing, pending, failed = conn.execute("""
+        WITH states AS ({0}), index AS (SELECT DISTINCT link FROM {1}.arlima_index)
+        SELECT
+            (SELECT count(*) FROM (SELECT link FROM states GROUP BY link HAVING count(*) > 1)),
+            (SELECT count(*) FROM (SELECT link FROM index EXCEPT SELECT link FROM states)),
+            (SELECT count(*) FROM states WHERE status = 'pending'),
+            (SELECT count(*) FROM states WHERE status = 'failed')
+        """.format(states, first)).fetchone()
+    if duplicated or missing or pending:
+        raise ValueError(
+            "{} links were scraped by several shards, {} by none and {} are "
+            "still pending, resume their shard first.".format(
+                duplicated, missing, pending
+            )
+        )
+    pages = " UNION ALL ".join("SELECT link FROM {}.pages".format(n) for n in names)
+    (duplicated,) = conn.execute(
+        "SELECT count(*) FROM (SELECT link FROM ({}) GROUP BY link HAVING count(*) > 1)".format(
+            pages
+        )
+    ).fetchone()
+    if duplicated:
+        raise ValueError("{} pages were scraped by several shards.".format(duplicated))
+    return failed
+
+
+def merge_shards(conn: duckdb.DuckDBPyConnection, paths: list[Path]) -> int:
+    """Replace the tables of the database with those of the shards, once they
+    are checked to cover the index exactly.
+
+    The links the shards failed to scrape stay "failed" in `crawl_state`, so
+    that resuming the merged crawl tries them again. The shards' errors are
+    added to those of earlier runs, once per run.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The canonical database.
+        paths (list[Path]): The shards' databases.
+
+    Raises:
+        ValueError: If the shards do not cover the index exactly.
+
+    Returns:
+        int: The number of pages merged.
+    """
+
+    names = []
+    for position, path in enumerate(paths):
+        name = "shard_{}".format(position)
+        conn.execute("ATTACH {} AS {} (READ_ONLY)".format(sql_literal(str(path)), name))
+        names.append(name)
+    try:
+        check_shards(conn, names)
+        migrate(conn)
+        # Swap all the tables at once
+        conn.begin()
+        try:
+            replace_rows(conn, "arlima_index", "FROM {}.arlima_index".format(names[0]))
+            for table in MERGED_TABLES:
+                replace_rows(
+                    conn,
+                    table,
+                    " UNION ALL ".join(
+                        "FROM {}.{}".format(name, table) for name in names
+                    ),
+                )
+            # Errors accumulate across runs: add those of the shards' runs,
+            # unless an earlier merge already did
+            conn.execute(
+                """
+                INSERT INTO scrape_errors
+                SELECT * FROM ({}) shard_errors
+                ANTI JOIN (SELECT DISTINCT run_id FROM scrape_errors) merged
+                    USING (run_id)
+                """.format(
+                    " UNION ALL ".join(
+                        "FROM {}.scrape_errors".format(name) for name in names
+                    )
+                )
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    finally:
+        for name in names:
+            conn.execute("DETACH {}".format(name))
+    return conn.table("pages").count("*").fetchone()[0]
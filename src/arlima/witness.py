@@ -2,9 +2,12 @@ import re
 from dataclasses import dataclass, field
 from typing import Generator
 
-import bs4
+from lxml import etree, html
 
+from arlima.extract import text_of
+from arlima.normalise import normalise
 from arlima.page import Page
+from arlima.records import WitnessRecord
 
 example = """
 <li>
@@ -14,33 +17,44 @@ example = """
 </li>
 """
 
+# A collection name starts the shelfmark with a word of three letters or more
+COLLECTION = re.compile(r"^[^\d\W]{3,}")
+
+# Text of the link to Arlima's description of the manuscript
+DESCRIPTION = "[⇛ Description]"
+
+# A part of the idno introducing folios or pages, e.g. "f. 77rc-79ra" or "f"
+FOLIO_MARKER = re.compile(r"^(?:ff?|fol|fols|pp?)(?:\.|\b)\s*(.*)$", re.IGNORECASE)
+
+# A part of the idno that is a folio range without marker, e.g. "1r-24v"
+FOLIO_RANGE = re.compile(r"^\d+[rv][a-d]?(?:\s*-\s*\d+[rv]?[a-d]?)?$")
+
+# Parenthesised remarks closing a part, e.g. "17139 (Q)"
+REMARK = re.compile(r"\s*(\([^()]*\))$")
+
 
 @dataclass
 class Witness:
-    li: bs4.element.Tag
+    li: etree._Element
     page: str
     fields: list = field(default_factory=list)
 
     def __dict__(self) -> dict:
-        return {field: self.__getattribute__(field) for field in self.fields()}
+        return self.record()._asdict()
+
+    def record(self) -> WitnessRecord:
+        return parse_witness(self.li, self.page)
 
     @classmethod
     def fields(cls) -> list:
-        return [
-            "page",
-            "archive_href",
-            "settlement",
-            "repository",
-            "collection",
-            "idno",
-        ]
+        return list(WitnessRecord._fields)
 
     @property
     def archive_href(self) -> str:
         """_summary_
 
         Examples:
-        >>> li = bs4.BeautifulSoup(example, features="lxml")
+        >>> li = html.fragment_fromstring(example.strip())
         >>> witness = Witness(li=li, page="www.arlima.com/no/test")
         >>> witness.archive_href
         'https://www.bl.uk'
@@ -49,14 +63,14 @@ class Witness:
             str: _description_
         """
 
-        return self.li.find("a").get("href")
+        return self.first_link().get("href")
 
     @property
     def settlement(self) -> str | None:
         """_summary_
 
         Examples:
-        >>> li = bs4.BeautifulSoup(example, features="lxml")
+        >>> li = html.fragment_fromstring(example.strip())
         >>> witness = Witness(li=li, page="www.arlima.com/no/test")
         >>> witness.settlement
         'London'
@@ -72,7 +86,7 @@ class Witness:
         """_summary_
 
         Examples:
-        >>> li = bs4.BeautifulSoup(example, features="lxml")
+        >>> li = html.fragment_fromstring(example.strip())
         >>> witness = Witness(li=li, page="www.arlima.com/no/test")
         >>> witness.repository
         'British Library'
@@ -88,7 +102,7 @@ class Witness:
         """_summary_
 
         Examples:
-        >>> li = bs4.BeautifulSoup(example, features="lxml")
+        >>> li = html.fragment_fromstring(example.strip())
         >>> witness = Witness(li=li, page="www.arlima.com/no/test")
         >>> witness.collection
         'Royal'
@@ -104,7 +118,7 @@ class Witness:
         """_summary_
 
         Examples:
-        >>> li = bs4.BeautifulSoup(example, features="lxml")
+        >>> li = html.fragment_fromstring(example.strip())
         >>> witness = Witness(li=li, page="www.arlima.com/no/test")
         >>> witness.idno
         '20. D. XI, f. 77rc-79ra'
@@ -115,23 +129,14 @@ class Witness:
 
         return self.get_idno(self.li_text_without_a_text())
 
+    def first_link(self) -> etree._Element:
+        return next(self.li.iter("a"))
+
     def a_link_text(self) -> str:
-        return self.li.find("a").text
+        return text_of(self.first_link())
 
     def li_text_without_a_text(self) -> str:
-        # Remove the <a> element text from the rest of <li>
-        full_li_element_text = self.li.text.strip()
-        text_inside_embedded_a_element = self.a_link_text()
-        text = full_li_element_text.split(text_inside_embedded_a_element)[-1]
-        # Remove the comma that immediately follows the <a> text
-        parts = text.split(",")
-        parts.pop(0)
-        text = ",".join(parts)
-        # Remove the second <a> link in the text
-        text = text.replace("[⇛ Description]", "")
-        text = text.replace("  ", " ")
-        # Remove any trailing white space
-        return text.strip()
+        return residual_text(text_of(self.li), self.a_link_text())
 
     @classmethod
     def get_settlement(cls, a_link_text: str) -> str | None:
@@ -151,9 +156,7 @@ class Witness:
             str | None: _description_
         """
 
-        rep_parts = a_link_text.split(",")
-        if len(rep_parts) > 1:
-            return rep_parts[0]
+        return split_link_text(a_link_text)[0]
 
     @classmethod
     def get_repository(cls, a_link_text: str) -> str:
@@ -176,12 +179,7 @@ class Witness:
             str: _description_
         """
 
-        rep_parts = a_link_text.split(",")
-        if len(rep_parts) > 1:
-            rep_parts.pop(0)
-            return ",".join(rep_parts).strip()
-        else:
-            return a_link_text.strip()
+        return split_link_text(a_link_text)[1]
 
     @classmethod
     def get_collection(cls, li_text_without_a_text: str) -> str | None:
@@ -203,11 +201,7 @@ class Witness:
             str | None: _description_
         """
 
-        resource_parts = li_text_without_a_text.split(",")
-        if len(resource_parts) > 1 and re.match(
-            r"^[^\d\W]{3,}", li_text_without_a_text
-        ):
-            return resource_parts[0].strip()
+        return split_residual(li_text_without_a_text)[0]
 
     @classmethod
     def get_idno(cls, li_text_without_a_text: str) -> str:
@@ -230,19 +224,207 @@ class Witness:
             str: _description_
         """
 
-        resource_parts = li_text_without_a_text.split(",")
-        if len(resource_parts) > 1 and re.match(
-            r"^[^\d\W]{3,}", li_text_without_a_text
-        ):
-            resource_parts.pop(0)
-            return ",".join(resource_parts).strip()
-        else:
-            return li_text_without_a_text.strip()
-
-
-def yield_witnesses(page: Page) -> Generator[dict, None, None]:
-    if page.mss:
-        for li in page.mss.find_all("li"):
-            if li.find("a"):
-                wit = Witness(li=li, page=page.link)
-                yield wit.__dict__()
+        return split_residual(li_text_without_a_text)[1]
+
+
+def residual_text(li_text: str, a_link_text: str) -> str:
+    """Text of a witness's <li> that follows its first link.
+
+    Examples:
+        >>> residual_text(
+        ...     "London, British Library , Royal, 20. D. XI [⇛ Description]",
+        ...     "London, British Library",
+        ... )
+        'Royal, 20. D. XI'
+
+    Args:
+        li_text (str): Whole text of the <li>.
+        a_link_text (str): Text of its first <a>.
+
+    Returns:
+        str: The rest of the text, without the link to Arlima's description.
+    """
+
+    # Remove the <a> element text from the rest of <li>
+    text = li_text.strip()
+    if a_link_text:
+        text = text.rpartition(a_link_text)[2]
+    # Remove the comma that immediately follows the <a> text
+    text = text.partition(",")[2]
+    # Remove the second <a> link in the text
+    text = text.replace(DESCRIPTION, "").replace("  ", " ")
+    # Remove any trailing white space
+    return text.strip()
+
+
+def split_link_text(a_link_text: str) -> tuple[str | None, str]:
+    """Split a witness's link text into settlement and repository.
+
+    Examples:
+        >>> split_link_text("Heiligenkreuz, Stiftsbibliothek, etc.")
+        ('Heiligenkreuz', 'Stiftsbibliothek, etc.')
+        >>> split_link_text("EA2218")
+        (None, 'EA2218')
+
+    Args:
+        a_link_text (str): Text of the witness's first <a>.
+
+    Returns:
+        tuple[str | None, str]: The settlement, if any, and the repository.
+    """
+
+    settlement, comma, repository = a_link_text.partition(",")
+    if comma:
+        return settlement, repository.strip()
+    return None, a_link_text.strip()
+
+
+def split_residual(li_text_without_a_text: str) -> tuple[str | None, str]:
+    """Split the rest of a witness's text into collection and idno.
+
+    Examples:
+        >>> split_residual("Santa Cruz de Coimbra, 69, f. 268v-273v (Q)")
+        ('Santa Cruz de Coimbra', '69, f. 268v-273v (Q)')
+        >>> split_residual("9176-9177, f, 1r-24v, XV, XIV")
+        (None, '9176-9177, f, 1r-24v, XV, XIV')
+
+    Args:
+        li_text_without_a_text (str): Text of the <li> after its first link.
+
+    Returns:
+        tuple[str | None, str]: The collection, if any, and the idno.
+    """
+
+    collection, comma, idno = li_text_without_a_text.partition(",")
+    if comma and COLLECTION.match(li_text_without_a_text):
+        return collection.strip(), idno.strip()
+    return None, li_text_without_a_text.strip()
+
+
+def split_idno(idno: str) -> tuple[str | None, str | None, str | None]:
+    """Split an idno into the shelfmark, the folio range and trailing notes
+    such as the dating.
+
+    Examples:
+        >>> split_idno("20. D. XI, f. 77rc-79ra")
+        ('20. D. XI', '77rc-79ra', None)
+        >>> split_idno("9176-9177, f, 1r-24v, XV, XIV")
+        ('9176-9177', '1r-24v', 'XV, XIV')
+        >>> split_idno("69, f. 268v-273v (Q)")
+        ('69', '268v-273v', '(Q)')
+        >>> split_idno("fr. 1553")
+        ('fr. 1553', None, None)
+
+    Args:
+        idno (str): The witness's idno.
+
+    Returns:
+        tuple[str | None, str | None, str | None]: The shelfmark, folios and
+            notes, each None if missing.
+    """
+
+    parts = [part.strip() for part in idno.split(",")]
+    start = next(
+        (i for i, part in enumerate(parts) if i and FOLIO_MARKER.match(part)), None
+    )
+    if start is None:
+        shelfmark, folios, notes = parts[:1], [], parts[1:]
+    else:
+        shelfmark, notes = parts[:start], parts[start + 1 :]
+        first = FOLIO_MARKER.match(parts[start]).group(1)
+        folios = [first] if first else []
+        # The ranges may follow a stray comma ("f, 1r-24v") or one another
+        while notes and FOLIO_RANGE.match(notes[0]):
+            folios.append(notes.pop(0))
+    remarks = []
+    fields = []
+    for text in (", ".join(shelfmark), ", ".join(folios)):
+        # Remarks in brackets closing the shelfmark or folios are notes too
+        if remark := REMARK.search(text):
+            remarks.append(remark.group(1))
+            text = text[: remark.start()]
+        fields.append(text or None)
+    return fields[0], fields[1], ", ".join(remarks + notes) or None
+
+
+def shelfmark_key(collection: str | None, shelfmark: str | None) -> str | None:
+    """Canonical form of a shelfmark, collection included, for exact lookups.
+
+    Examples:
+        >>> shelfmark_key("Royal", "20. D. XI")
+        'royal 20 d xi'
+        >>> shelfmark_key(None, "fr. 1553")
+        'fr 1553'
+
+    Args:
+        collection (str | None): The witness's collection.
+        shelfmark (str | None): The shelfmark part of its idno.
+
+    Returns:
+        str | None: The key, None if there is neither.
+    """
+
+    return normalise(" ".join(part for part in (collection, shelfmark) if part))
+
+
+def parse_witness(li: etree._Element, page: str) -> WitnessRecord | None:
+    """Extract all of a witness's fields, reading its <li> only once.
+
+    Examples:
+        >>> record = parse_witness(html.fragment_fromstring(example.strip()), page="")
+        >>> record.settlement, record.repository
+        ('London', 'British Library')
+        >>> record.collection, record.idno
+        ('Royal', '20. D. XI, f. 77rc-79ra')
+
+    Args:
+        li (etree._Element): The witness's <li>.
+        page (str): Link of the page listing the witness.
+
+    Returns:
+        WitnessRecord | None: The witness's row, or None if the <li> has no
+            link.
+    """
+
+    a = next(li.iter("a"), None)
+    if a is None:
+        return
+    a_link_text = text_of(a)
+    settlement, repository = split_link_text(a_link_text)
+    collection, idno = split_residual(residual_text(text_of(li), a_link_text))
+    shelfmark, folios, notes = split_idno(idno)
+    return WitnessRecord(
+        page,
+        a.get("href"),
+        settlement,
+        repository,
+        collection,
+        idno,
+        shelfmark_key(collection, shelfmark),
+        folios,
+        notes,
+    )
+
+
+def parse_witnesses(ol: etree._Element, page: str) -> list[WitnessRecord]:
+    """Extract the rows of all the witnesses in a manuscripts list.
+
+    Args:
+        ol (etree._Element): The manuscripts <ol>.
+        page (str): Link of the page listing the witnesses.
+
+    Returns:
+        list[WitnessRecord]: The witnesses' rows, skipping items with no link.
+    """
+
+    records = []
+    for li in ol.iter("li"):
+        record = parse_witness(li, page)
+        if record:
+            records.append(record)
+    return records
+
+
+def yield_witnesses(page: Page) -> Generator[WitnessRecord, None, None]:
+    if page.mss is not None:
+        yield from parse_witnesses(page.mss, page.link)
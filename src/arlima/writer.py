@@ -0,0 +1,102 @@
+from typing import Sequence
+
+import duckdb
+import pyarrow as pa
+
+BATCH_SIZE = 5000
+
+ARROW_TYPES = {
+    "VARCHAR": pa.string(),
+    "BIGINT": pa.int64(),
+    "INTEGER": pa.int32(),
+    "DOUBLE": pa.float64(),
+    "BOOLEAN": pa.bool_(),
+    "TIMESTAMP": pa.timestamp("us"),
+}
+
+
+def arrow_schema(conn: duckdb.DuckDBPyConnection, table: str) -> pa.Schema:
+    """Arrow schema matching the columns of a DuckDB table.
+
+    Examples:
+        >>> conn = duckdb.connect()
+        >>> _ = conn.execute("CREATE TABLE t (link VARCHAR, year BIGINT)")
+        >>> arrow_schema(conn, "t")
+        link: string
+        year: int64
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+        table (str): Name of the table.
+
+    Returns:
+        pa.Schema: The table's schema.
+    """
+
+    columns = conn.execute("DESCRIBE {}".format(table)).fetchall()
+    return pa.schema([(name, ARROW_TYPES[type_]) for name, type_, *_ in columns])
+
+
+class TableWriter:
+    """Buffer rows column by column and append them to a table, as an Arrow
+    record batch, every `batch_size` rows.
+
+    Rows are sequences, such as the records of `arlima.records`, holding the
+    values of the table's columns in order. The columns are typed after the
+    table, so nothing is left for DuckDB to guess.
+
+    Examples:
+        >>> conn = duckdb.connect()
+        >>> _ = conn.execute("CREATE TABLE t (link VARCHAR, year BIGINT)")
+        >>> with TableWriter(conn, "t") as writer:
+        ...     writer.append(("https://www.arlima.net/a.html", 1400))
+        >>> conn.execute("SELECT * FROM t").fetchall()
+        [('https://www.arlima.net/a.html', 1400)]
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+        table (str): Name of the table to append to.
+        batch_size (int, optional): Rows buffered before each append.
+            Defaults to BATCH_SIZE.
+    """
+
+    def __init__(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        table: str,
+        batch_size: int = BATCH_SIZE,
+    ) -> None:
+        self.conn = conn
+        self.table = table
+        self.batch_size = batch_size
+        self.schema = arrow_schema(conn, table)
+        self.columns = [[] for _ in self.schema]
+        self.rows = 0
+
+    def append(self, row: Sequence) -> None:
+        for column, value in zip(self.columns, row):
+            column.append(value)
+        self.rows += 1
+        if self.rows >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.rows:
+            return
+        batch = pa.Table.from_arrays(
+            [
+                pa.array(column, type=field.type)
+                for column, field in zip(self.columns, self.schema)
+            ],
+            schema=self.schema,
+        )
+        self.conn.from_arrow(batch).insert_into(self.table)
+        self.columns = [[] for _ in self.schema]
+        self.rows = 0
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.flush()
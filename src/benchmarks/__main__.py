@@ -0,0 +1,67 @@
+import json
+import sys
+from pathlib import Path
+
+import click
+
+from benchmarks.suite import BENCHMARKS, regressions, run_suite
+
+
+@click.command()
+@click.option(
+    "--only",
+    multiple=True,
+    type=click.Choice(list(BENCHMARKS)),
+    help="Benchmark to run, repeatable. [default: all]",
+)
+@click.option("--rounds", type=int, default=5, show_default=True)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="JSON file of the results. [default: standard output]",
+)
+@click.option(
+    "--compare",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="JSON results of a previous run; exit with 1 on regressions.",
+)
+@click.option(
+    "--threshold",
+    type=float,
+    default=0.2,
+    show_default=True,
+    help="Slowdown, as a fraction of the previous best time, that counts as a regression.",
+)
+def main(
+    only: tuple[str],
+    rounds: int,
+    output: Path | None,
+    compare: Path | None,
+    threshold: float,
+):
+    """Time the parsing, loading and crawling code on the recorded Arlima
+    pages."""
+
+    results = run_suite(list(only), rounds=rounds)
+    text = json.dumps(results, indent=2)
+    if output:
+        output.write_text(text + "\n")
+    else:
+        print(text)
+    for name, result in results["benchmarks"].items():
+        print(
+            "{:<20} {:>12,.0f} items/s".format(name, result["items_per_second"]),
+            file=sys.stderr,
+        )
+    if compare:
+        slower = regressions(results, json.loads(compare.read_text()), threshold)
+        for line in slower:
+            print("Regression: " + line, file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
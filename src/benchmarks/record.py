@@ -0,0 +1,102 @@
+import bisect
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import click
+
+from arlima.archive import PageArchive
+from arlima.page import Page
+from arlima.witness import yield_witnesses
+
+CORPUS = Path(__file__).parent.joinpath("corpus")
+
+# The kinds of pages the benchmarks must cover, named like the test fixtures
+CATEGORIES = ("text", "author", "work", "no_bib_table", "odd_manuscripts")
+
+
+def file_name(link: str) -> str:
+    """The name under which a page is recorded.
+
+    Examples:
+        >>> file_name("https://www.arlima.net/il/jean_de_meun.html")
+        'il_jean_de_meun.html'
+        >>> file_name("https://www.arlima.net/no/120")
+        'no_120.html'
+    """
+
+    name = urlsplit(link).path.strip("/").replace("/", "_")
+    return name if name.endswith(".html") else name + ".html"
+
+
+def category(link: str, content: bytes) -> str:
+    """Which of the CATEGORIES a page belongs to.
+
+    Non-text pages with a biography or a list of works are authors' pages,
+    the others works'. Texts whose manuscripts list has a witness without a
+    settlement or a shelfmark count as odd.
+    """
+
+    page = Page(link=link, content=content)
+    if not page.is_text:
+        author = b'id="bio"' in content or b'id="oeu"' in content
+        return "author" if author else "work"
+    if not page.has_bib_table:
+        return "no_bib_table"
+    for witness in yield_witnesses(page):
+        if witness.settlement is None or witness.shelfmark is None:
+            return "odd_manuscripts"
+    return "text"
+
+
+def record_corpus(
+    archive: PageArchive, per_category: int = 10, path: Path = CORPUS
+) -> dict[str, int]:
+    """Replace the benchmark corpus with pages of a real crawl, as kept in the
+    archive, `per_category` of each of the CATEGORIES.
+
+    The pages of a category are those with the first links in alphabetical
+    order, so that recording again after a new crawl keeps the same pages
+    wherever they still exist.
+
+    Args:
+        archive (PageArchive): The archive of a crawl run with --archive.
+        per_category (int, optional): Pages recorded of each category.
+            Defaults to 10.
+        path (Path, optional): Directory of the corpus. Defaults to CORPUS.
+
+    Returns:
+        dict[str, int]: The number of pages recorded of each category.
+    """
+
+    chosen = {name: [] for name in CATEGORIES}
+    for link, content in archive.pages():
+        pages = chosen[category(link, content)]
+        if len(pages) < per_category or link < pages[-1][0]:
+            bisect.insort(pages, (link, content))
+            del pages[per_category:]
+    path.mkdir(parents=True, exist_ok=True)
+    for old in path.glob("*.html"):
+        old.unlink()
+    for name, pages in chosen.items():
+        for link, content in pages:
+            path.joinpath("{}_{}".format(name, file_name(link))).write_bytes(content)
+    return {name: len(pages) for name, pages in chosen.items()}
+
+
+@click.command()
+@click.option("--per-category", type=int, default=10, show_default=True)
+def main(per_category: int):
+    """Record archived Arlima pages of each kind as the benchmark corpus."""
+
+    archive = PageArchive()
+    if not archive.files():
+        raise click.UsageError("The archive is empty, crawl with --archive first.")
+    recorded = record_corpus(archive, per_category=per_category)
+    for name, count in recorded.items():
+        print("{:<16} {} pages".format(name, count))
+        if not count:
+            print("No {} page was archived, the corpus lacks them.".format(name))
+
+
+if __name__ == "__main__":
+    main()
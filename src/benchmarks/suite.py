@@ -0,0 +1,301 @@
+import platform
+import statistics
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Generator
+from urllib.parse import urlsplit
+
+import duckdb
+
+from arlima import VERSION
+from arlima.date_parser import DateParser
+from arlima.extract import extract_page
+from arlima.page import Page
+from arlima.request_pages import (
+    CrawlOptions,
+    parse_page,
+    scrape_pages,
+    setup_hashes_table,
+    setup_pages_table,
+    setup_witnesses_table,
+    write_results,
+)
+from arlima.witness import yield_witnesses
+from benchmarks.record import CORPUS
+
+# The test fixtures stand for the corpus until one is recorded
+FIXTURES = Path(__file__).parents[1].joinpath("tests", "fixtures")
+
+# Date descriptions as Arlima words them, besides those of the corpus
+DATES = [
+    "XIIIe siècle",
+    "Fin du XIIe siècle",
+    "Première moitié du XIVe siècle",
+    "Deuxième moitié du XVe siècle",
+    "Vers 1270",
+    "1342",
+    "Entre 1405 et 1410",
+    "XIVe-XVe siècle",
+    "Début du XVIe siècle",
+    "1200-1250",
+]
+
+BENCHMARKS = {}
+
+
+@dataclass
+class Result:
+    """Timings of a benchmark, in seconds per round of `items` items."""
+
+    name: str
+    items: int
+    rounds: int
+    best: float
+    median: float
+    mean: float
+    stdev: float
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.best if self.best else 0.0
+
+    def dict(self) -> dict:
+        return dict(asdict(self), items_per_second=self.items_per_second)
+
+
+def benchmark(name: str) -> Callable:
+    """Register a benchmark: a function of the corpus returning the callable
+    to time and the number of items it processes per call."""
+
+    def register(setup: Callable) -> Callable:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def load_corpus(path: Path = CORPUS) -> dict[str, bytes]:
+    """The Arlima pages recorded from a real crawl by `record_corpus` or,
+    before any was, the saved fixtures: a text, an author, a work, a text
+    without bibliography table and one with an odd manuscripts list."""
+
+    pages = sorted(path.glob("*.html")) or sorted(FIXTURES.glob("*.html"))
+    return {page.name: page.read_bytes() for page in pages}
+
+
+@contextmanager
+def serve(corpus: dict[str, bytes]) -> Generator[Callable[[str], str], None, None]:
+    """Serve the corpus on a local port, each page under its name whatever
+    the query string, and yield the function giving a page's URL."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = corpus.get(urlsplit(self.path).path.lstrip("/"))
+            self.send_response(404 if body is None else 200)
+            body = body or b""
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        yield lambda name: "http://127.0.0.1:{}/{}".format(httpd.server_port, name)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def measure(name: str, fn: Callable, items: int, rounds: int) -> Result:
+    fn()  # Warm up imports and caches
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return Result(
+        name=name,
+        items=items,
+        rounds=rounds,
+        best=min(times),
+        median=statistics.median(times),
+        mean=statistics.fmean(times),
+        stdev=statistics.stdev(times) if len(times) > 1 else 0.0,
+    )
+
+
+@benchmark("page_construction")
+def page_construction(corpus: dict[str, bytes]) -> tuple[Callable, int]:
+    def run():
+        for name, content in corpus.items():
+            Page(link=name, content=content)
+
+    return run, len(corpus)
+
+
+@benchmark("is_text")
+def is_text(corpus: dict[str, bytes]) -> tuple[Callable, int]:
+    def run():
+        for content in corpus.values():
+            extract_page(content).is_text
+
+    return run, len(corpus)
+
+
+@benchmark("yield_witnesses")
+def witnesses(corpus: dict[str, bytes]) -> tuple[Callable, int]:
+    pages = [Page(link=name, content=content) for name, content in corpus.items()]
+    pages = [page for page in pages if page.mss is not None]
+
+    def run():
+        for page in pages:
+            list(yield_witnesses(page))
+
+    return run, len(pages)
+
+
+@benchmark("date_parser_cold")
+def date_parser_cold(corpus: dict[str, bytes]) -> tuple[Callable, int]:
+    dates = DATES + [
+        page.date_description
+        for page in (Page(link=n, content=c) for n, c in corpus.items())
+        if page.is_text and page.date_description
+    ]
+
+    def run():
+        parser = DateParser(maxsize=0)
+        for date in dates:
+            parser.bounds(date)
+
+    return run, len(dates)
+
+
+@benchmark("date_parser_cached")
+def date_parser_cached(corpus: dict[str, bytes]) -> tuple[Callable, int]:
+    # A crawl's worth of descriptions, most of them repeated
+    dates = DATES * 100
+    parser = DateParser()
+
+    def run():
+        for date in dates:
+            parser.bounds(date)
+
+    return run, len(dates)
+
+
+@benchmark("duckdb_load")
+def duckdb_load(corpus: dict[str, bytes]) -> tuple[Callable, int]:
+    parsed = [
+        (name, name, parse_page(name, content)) for name, content in corpus.items()
+    ]
+    # Enough pages for several batches of the table writers
+    results = [
+        ("{}?copy={}".format(link, copy), digest, result)
+        for copy in range(2000)
+        for link, digest, result in parsed
+    ]
+
+    def run():
+        conn = duckdb.connect()
+        setup_pages_table(conn)
+        setup_witnesses_table(conn)
+        setup_hashes_table(conn)
+        write_results(conn, iter(results))
+        conn.close()
+
+    return run, len(results)
+
+
+def crawl(engine: str, copies: int = 40) -> Callable:
+    def setup(corpus: dict[str, bytes]) -> tuple[Callable, int]:
+        options = CrawlOptions(fetch_workers=8, parse_workers=2, engine=engine)
+
+        def run():
+            with serve(corpus) as url:
+                links = [
+                    url("{}?copy={}".format(name, copy))
+                    for copy in range(copies)
+                    for name in corpus
+                ]
+                conn = duckdb.connect()
+                setup_pages_table(conn)
+                setup_witnesses_table(conn)
+                setup_hashes_table(conn)
+                write_results(conn, scrape_pages(links, options))
+                conn.close()
+
+        return run, copies * len(corpus)
+
+    return setup
+
+
+benchmark("crawl_threads")(crawl("threads"))
+benchmark("crawl_async")(crawl("async"))
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "arlima": VERSION,
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "duckdb": duckdb.__version__,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def run_suite(names: list[str] | None = None, rounds: int = 5) -> dict:
+    """Run the benchmarks, all of them by default.
+
+    Returns:
+        dict: The environment and each benchmark's `Result`, ready for JSON.
+    """
+
+    corpus = load_corpus()
+    results = {}
+    for name in names or BENCHMARKS:
+        fn, items = BENCHMARKS[name](corpus)
+        results[name] = measure(name, fn, items, rounds).dict()
+    return {"environment": environment(), "benchmarks": results}
+
+
+def regressions(current: dict, baseline: dict, threshold: float = 0.2) -> list[str]:
+    """Benchmarks whose best time grew by more than `threshold` since the
+    baseline.
+
+    Examples:
+        >>> old = {"benchmarks": {"is_text": {"best": 1.0}}}
+        >>> regressions({"benchmarks": {"is_text": {"best": 1.5}}}, old)
+        ['is_text: 1.0000s -> 1.5000s (+50%)']
+        >>> regressions({"benchmarks": {"is_text": {"best": 1.1}}}, old)
+        []
+    """
+
+    slower = []
+    for name, result in current["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            continue
+        change = result["best"] / before["best"] - 1
+        if change > threshold:
+            slower.append(
+                "{}: {:.4f}s -> {:.4f}s ({:+.0%})".format(
+                    name, before["best"], result["best"], change
+                )
+            )
+    return slower
@@ -0,0 +1,238 @@
+import resource
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Generator, Sequence
+
+import duckdb
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from arlima.normalise import normalise
+from arlima.schema import TARGETS
+from arlima.writer import TableWriter
+
+# Memory given to each block of the score matrix
+BLOCK_BYTES = 64 * 2**20
+
+
+@dataclass
+class BatchReport:
+    """Size and cost of a batch matching job."""
+
+    queries: int = 0
+    targets: int = 0
+    matches: int = 0
+    seconds: float = 0.0
+    peak_memory: int = 0
+
+    @property
+    def pairs(self) -> int:
+        return self.queries * self.targets
+
+    @property
+    def pairs_per_second(self) -> float:
+        return self.pairs / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (
+            "Scored {:,} pairs ({:,} queries x {:,} targets) in {:.2f}s, "
+            "{:,.0f} pairs/s, {:,} matches kept, peak memory {:.0f} MiB".format(
+                self.pairs,
+                self.queries,
+                self.targets,
+                self.seconds,
+                self.pairs_per_second,
+                self.matches,
+                self.peak_memory / 2**20,
+            )
+        )
+
+
+def peak_memory() -> int:
+    """Largest resident set size of the process so far, in bytes."""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux counts kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def block_rows(targets: int, block_bytes: int = BLOCK_BYTES) -> int:
+    """Queries scored at once so that their float32 scores fit in
+    `block_bytes`.
+
+    Examples:
+        >>> block_rows(targets=50_000, block_bytes=64 * 2**20)
+        335
+        >>> block_rows(targets=10**9)
+        1
+    """
+
+    return max(1, block_bytes // (4 * max(targets, 1)))
+
+
+def top_matches(
+    queries: Sequence[str],
+    targets: Sequence[str],
+    top_k: int = 5,
+    cutoff: float = 80,
+    workers: int = -1,
+    block_bytes: int = BLOCK_BYTES,
+    scorer: Callable = fuzz.token_sort_ratio,
+) -> Generator[tuple[int, int, float, int], None, None]:
+    """Score every query against every target, a block of queries at a time,
+    and yield the `top_k` targets of each query that reach the cutoff.
+
+    Only one block of the score matrix exists at once, computed by rapidfuzz's
+    `cdist` on `workers` threads.
+
+    Examples:
+        >>> list(top_matches(["rose", "renart"], ["renard", "rose", "roses"], top_k=2))
+        [(0, 1, 100.0, 1), (0, 2, 88.88888549804688, 2), (1, 0, 83.33333587646484, 1)]
+
+    Args:
+        queries (Sequence[str]): The strings sought, already normalised.
+        targets (Sequence[str]): The strings to find them among.
+        top_k (int, optional): Targets kept per query. Defaults to 5.
+        cutoff (float, optional): Lowest score kept, from 0 to 100. Defaults
+            to 80.
+        workers (int, optional): Scoring threads, -1 for all cores. Defaults
+            to -1.
+        block_bytes (int, optional): Memory of a block of scores. Defaults to
+            BLOCK_BYTES.
+        scorer (Callable, optional): The rapidfuzz scorer. Defaults to
+            fuzz.token_sort_ratio.
+
+    Yields:
+        tuple[int, int, float, int]: Indexes of the query and target, score
+            and rank of the target among the query's matches.
+    """
+
+    if not len(targets):
+        return
+    k = min(top_k, len(targets))
+    rows = block_rows(len(targets), block_bytes)
+    for start in range(0, len(queries), rows):
+        scores = process.cdist(
+            queries[start : start + rows],
+            targets,
+            scorer=scorer,
+            score_cutoff=cutoff,
+            dtype=np.float32,
+            workers=workers,
+        )
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        for row, (targets_, scores_) in enumerate(
+            zip(best.tolist(), best_scores.tolist())
+        ):
+            rank = 0
+            for target, score in zip(targets_, scores_):
+                if score < cutoff or not score:
+                    break
+                rank += 1
+                yield start + row, target, score, rank
+
+
+def load_queries(
+    conn: duckdb.DuckDBPyConnection, source: Path, column: str = "query"
+) -> list[str]:
+    """Read queries from a text file, one per line, or from a column of a CSV
+    or Parquet file."""
+
+    source = Path(source)
+    if source.suffix.lower() == ".txt":
+        lines = source.read_text().splitlines()
+        return [line.strip() for line in lines if line.strip()]
+    if source.suffix.lower() == ".parquet":
+        relation = conn.read_parquet(str(source))
+    else:
+        relation = conn.read_csv(str(source), header=True, all_varchar=True)
+    if column not in relation.columns:
+        raise ValueError("{} lacks the column {}.".format(source, column))
+    rows = relation.project('"{}"'.format(column)).fetchall()
+    return [row[0] for row in rows if row[0]]
+
+
+def batch_match(
+    conn: duckdb.DuckDBPyConnection,
+    queries: Sequence[str],
+    target: str = "simple_titles",
+    table: str = "batch_matches",
+    top_k: int = 5,
+    cutoff: float = 80,
+    workers: int = -1,
+    block_bytes: int = BLOCK_BYTES,
+) -> BatchReport:
+    """Match queries against one of the TARGETS columns and stream the matches
+    to `table`.
+
+    Examples:
+        >>> conn = duckdb.connect()
+        >>> _ = conn.execute(
+        ...     "CREATE TABLE pages AS SELECT * FROM (VALUES "
+        ...     "('a.html', 'Roman de la Rose'), ('b.html', 'Roman de Renart')"
+        ...     ") t(link, simple_title)"
+        ... )
+        >>> report = batch_match(conn, ["Le roman de la rose"], top_k=1)
+        >>> report.pairs, report.matches
+        (2, 1)
+        >>> conn.execute("SELECT target_key, rank FROM batch_matches").fetchall()
+        [('a.html', 1)]
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+        queries (Sequence[str]): The strings sought.
+        target (str, optional): Key of TARGETS. Defaults to "simple_titles".
+        table (str, optional): Table replaced by the matches. Defaults to
+            "batch_matches".
+        top_k (int, optional): Matches kept per query. Defaults to 5.
+        cutoff (float, optional): Lowest score kept. Defaults to 80.
+        workers (int, optional): Scoring threads, -1 for all cores. Defaults
+            to -1.
+        block_bytes (int, optional): Memory of a block of scores. Defaults to
+            BLOCK_BYTES.
+
+    Returns:
+        BatchReport: Sizes, throughput and peak memory of the job.
+    """
+
+    start = time.perf_counter()
+    source, key_column, column = TARGETS[target]
+    keys, values = [], []
+    for key, value in conn.execute(
+        "SELECT {}, {} FROM {} WHERE {} IS NOT NULL".format(
+            key_column, column, source, column
+        )
+    ).fetchall():
+        if folded := normalise(value):
+            keys.append(key)
+            values.append((value, folded))
+    targets = [folded for _, folded in values]
+    folded_queries = [normalise(query) or "" for query in queries]
+
+    conn.execute(
+        "CREATE OR REPLACE TABLE {} (query VARCHAR, target_key VARCHAR,"
+        " target VARCHAR, score DOUBLE, rank INTEGER)".format(table)
+    )
+    report = BatchReport(queries=len(queries), targets=len(targets))
+    with TableWriter(conn, table) as writer:
+        for query, target_, score, rank in top_matches(
+            folded_queries,
+            targets,
+            top_k=top_k,
+            cutoff=cutoff,
+            workers=workers,
+            block_bytes=block_bytes,
+        ):
+            writer.append(
+                (queries[query], keys[target_], values[target_][0], score, rank)
+            )
+            report.matches += 1
+    report.seconds = time.perf_counter() - start
+    report.peak_memory = peak_memory()
+    return report
@@ -0,0 +1,231 @@
+import os
+import tempfile
+from pathlib import Path
+from typing import Generator, Sequence
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from arlima.fm import DATES, modified
+
+# Candidate pairs of ranges and pages checked at once
+BLOCK_ROWS = 2**22
+
+
+class DateIndex:
+    """Find the pages whose years overlap a date range without scanning the
+    pages table.
+
+    Each dated page is an interval from its earliest to its latest year, a
+    single year when it has no latest. The intervals are grouped by span, the
+    power of two their length rounds up to, and sorted by start within each
+    group. Among intervals at most `width` years long, those overlapping
+    [start, end] all start between `start - width` and `end`: two binary
+    searches per span, then a filter on the ends in between. Since the
+    intervals of a span are at least half as long as its widest, the rows
+    filtered out stay few, however wide a handful of intervals are. Batches
+    of ranges are joined at once, with NumPy, which makes date windows a
+    cheap blocking key for record linkage.
+
+    Examples:
+        >>> conn = duckdb.connect()
+        >>> _ = conn.execute(
+        ...     "CREATE TABLE pages AS SELECT * FROM (VALUES "
+        ...     "('a.html', 1400, 1500), ('b.html', 1170, 1190), "
+        ...     "('c.html', 1342, NULL), ('d.html', NULL, NULL)"
+        ...     ") t(link, year_earliest, year_latest)"
+        ... )
+        >>> index = DateIndex.from_db(conn)
+        >>> index.overlapping(1350, 1420)
+        ['a.html']
+        >>> index.stabbing(1342)
+        ['c.html']
+        >>> queries, rows = index.join([1180, 1300], [1180, 1450])
+        >>> [(int(q), index.links[r]) for q, r in zip(queries, rows)]
+        [(0, 'b.html'), (1, 'c.html'), (1, 'a.html')]
+
+    Args:
+        table (pa.Table): The `link`, `start`, `end` and `span` of each dated
+            page, sorted by `span`, `start` then `link`.
+    """
+
+    def __init__(self, table: pa.Table) -> None:
+        self.table = table
+        self.links = table.column("link").to_pylist()
+        self.starts = table.column("start").to_numpy()
+        self.ends = table.column("end").to_numpy()
+        # Where the intervals of each span start, and the longest of them
+        _, bounds = np.unique(table.column("span").to_numpy(), return_index=True)
+        self.bounds = np.append(bounds, len(self.starts))
+        self.widths = (
+            np.maximum.reduceat(self.ends - self.starts, bounds)
+            if len(bounds)
+            else self.starts
+        )
+
+    @classmethod
+    def from_db(
+        cls, conn: duckdb.DuckDBPyConnection, table: str = "pages"
+    ) -> "DateIndex":
+        return cls(conn.execute("""
+            SELECT
+                link,
+                year_earliest AS start,
+                greatest(year_earliest, coalesce(year_latest, year_earliest)) AS "end",
+                ceil(log2("end" - start + 1))::INTEGER AS span
+            FROM {}
+            WHERE year_earliest IS NOT NULL
+            ORDER BY span, start, link
+            """.format(table)).arrow())
+
+    def save(self, path: Path = DATES) -> None:
+        # Write then rename, so a reader never loads a partial index
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        os.close(fd)
+        pq.write_table(self.table, tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path = DATES) -> "DateIndex":
+        return cls(pq.read_table(path, memory_map=True))
+
+    def join_blocks(
+        self,
+        starts: Sequence[int] | np.ndarray,
+        ends: Sequence[int] | np.ndarray,
+        slack: int = 0,
+        block_rows: int = BLOCK_ROWS,
+    ) -> Generator[tuple[np.ndarray, np.ndarray], None, None]:
+        """Pair each of a batch of year ranges with the pages it overlaps, a
+        block of consecutive ranges at a time.
+
+        Args:
+            starts (Sequence[int] | np.ndarray): The first year of each range.
+            ends (Sequence[int] | np.ndarray): The last year of each range.
+            slack (int, optional): Years by which each range is widened on
+                both sides, for dates known only roughly. Defaults to 0.
+            block_rows (int, optional): Candidate pairs checked at once.
+                Defaults to BLOCK_ROWS.
+
+        Yields:
+            tuple[np.ndarray, np.ndarray]: The position of the range and the
+                row of the page, for each overlapping pair of a block, ranges
+                in order and pages by span then start.
+        """
+
+        starts = np.asarray(starts, dtype=np.int64) - slack
+        ends = np.asarray(ends, dtype=np.int64) + slack
+        # The rows to check of each range in each span, ranges in order
+        first = np.empty((len(starts), len(self.widths)), dtype=np.int64)
+        last = np.empty_like(first)
+        for span, width in enumerate(self.widths.tolist()):
+            lower, upper = self.bounds[span], self.bounds[span + 1]
+            rows = self.starts[lower:upper]
+            first[:, span] = lower + np.searchsorted(rows, starts - width, side="left")
+            last[:, span] = lower + np.searchsorted(rows, ends, side="right")
+        owners = np.repeat(np.arange(len(starts)), len(self.widths))
+        first = first.ravel()
+        counts = np.maximum(last.ravel() - first, 0)
+        totals = np.cumsum(counts)
+        position = 0
+        while position < len(first):
+            done = totals[position] - counts[position]
+            stop = max(
+                int(np.searchsorted(totals, done + block_rows, side="right")),
+                position + 1,
+            )
+            block = slice(position, stop)
+            # Every row between its range's bounds, without a Python loop
+            queries = np.repeat(owners[block], counts[block])
+            offsets = totals[block] - counts[block] - done
+            rows = np.arange(totals[stop - 1] - done) - np.repeat(
+                offsets - first[block], counts[block]
+            )
+            keep = self.ends[rows] >= starts[queries]
+            yield queries[keep], rows[keep]
+            position = stop
+
+    def join(
+        self,
+        starts: Sequence[int] | np.ndarray,
+        ends: Sequence[int] | np.ndarray,
+        slack: int = 0,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """All the pairs of `join_blocks` at once."""
+
+        blocks = list(self.join_blocks(starts, ends, slack=slack))
+        if not blocks:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        queries, rows = zip(*blocks)
+        return np.concatenate(queries), np.concatenate(rows)
+
+    def overlapping(self, start: int, end: int) -> list[str]:
+        """The pages dated, at least in part, between `start` and `end`."""
+
+        _, rows = self.join([start], [end])
+        return [self.links[row] for row in rows.tolist()]
+
+    def stabbing(self, year: int) -> list[str]:
+        """The pages whose dates include `year`."""
+
+        return self.overlapping(year, year)
+
+    def block(
+        self,
+        ids: pa.Array | Sequence[str],
+        starts: pa.Array | Sequence[int | None],
+        ends: pa.Array | Sequence[int | None],
+        slack: int = 0,
+    ) -> pa.Table:
+        """The candidate pairs of dated external records and pages, as a table
+        to register in DuckDB and join like any other block.
+
+        Records without a start are left out. Those without an end only cover
+        their start year.
+
+        Args:
+            ids (pa.Array | Sequence[str]): The records' identifiers.
+            starts (pa.Array | Sequence[int | None]): Their first years.
+            ends (pa.Array | Sequence[int | None]): Their last years.
+            slack (int, optional): Years by which each record's range is
+                widened on both sides. Defaults to 0.
+
+        Returns:
+            pa.Table: The `id` of the record and `link` of the page of each
+                pair.
+        """
+
+        ids = pa.array(ids, type=pa.string())
+        starts = pa.array(starts, type=pa.int64())
+        ends = pc.coalesce(pa.array(ends, type=pa.int64()), starts)
+        dated = pc.is_valid(starts)
+        ids, starts, ends = (pc.filter(array, dated) for array in (ids, starts, ends))
+        links = self.table.column("link").combine_chunks()
+        schema = pa.schema([("id", pa.string()), ("link", pa.string())])
+        return pa.Table.from_batches(
+            [
+                pa.RecordBatch.from_arrays(
+                    [ids.take(pa.array(queries)), links.take(rows)], schema=schema
+                )
+                for queries, rows in self.join_blocks(
+                    starts.to_numpy(), ends.to_numpy(), slack=slack
+                )
+            ],
+            schema=schema,
+        )
+
+
+def date_index(
+    conn: duckdb.DuckDBPyConnection, db: Path, path: Path = DATES
+) -> DateIndex:
+    """Load the persisted index, first rebuilding it if the database changed
+    since it was saved."""
+
+    if not path.exists() or path.stat().st_mtime < modified(db):
+        index = DateIndex.from_db(conn)
+        index.save(path)
+        return index
+    return DateIndex.load(path)
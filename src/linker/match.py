@@ -0,0 +1,382 @@
+import tempfile
+from pathlib import Path
+
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+import splink.duckdb.comparison_library as cl
+from duckdb.typing import DOUBLE, VARCHAR
+from rapidfuzz import fuzz, process
+from splink.duckdb.linker import DuckDBLinker
+
+from arlima.normalise import register_normalise
+
+# Working tables, local to the connection
+EXTERNAL = "link_external"
+ARLIMA = "link_arlima"
+CANDIDATES = "link_candidates"
+PREDICTIONS = "link_predictions"
+
+# Columns an external witness list must have; `collection` and `id` are optional
+REQUIRED_COLUMNS = ("settlement", "repository", "idno")
+
+# Pairs worth scoring, as splink blocking rules. None of them pairs a whole
+# library, or a whole collection, with itself: each also asks for the same
+# first digits of the shelfmark number, the same number or the same shelfmark.
+BLOCKING_RULES = [
+    "l.settlement_norm = r.settlement_norm"
+    " AND l.repository_norm = r.repository_norm"
+    " AND l.collection_norm = r.collection_norm"
+    " AND l.idno_prefix = r.idno_prefix",
+    "l.settlement_norm = r.settlement_norm"
+    " AND l.repository_norm = r.repository_norm"
+    " AND l.idno_number = r.idno_number",
+    "l.settlement_norm = r.settlement_norm AND l.idno_norm = r.idno_norm",
+]
+
+# Blocks on which splink's m probabilities are estimated, each leaving free
+# the comparisons it does not fix
+TRAINING_RULES = [
+    "l.settlement_norm = r.settlement_norm AND l.idno_number = r.idno_number",
+    "l.settlement_norm = r.settlement_norm"
+    " AND l.repository_norm = r.repository_norm"
+    " AND l.collection_norm = r.collection_norm",
+]
+
+# Both sides of the linkage share these columns, normalised by `stage_table`
+STAGED_COLUMNS = """
+    settlement,
+    repository,
+    collection,
+    idno,
+    arlima_normalise(settlement) AS settlement_norm,
+    arlima_normalise(repository) AS repository_norm,
+    arlima_normalise(collection) AS collection_norm,
+    arlima_normalise(idno) AS idno_norm,
+    nullif(regexp_extract(arlima_normalise(idno), '\\d+'), '') AS idno_number,
+    nullif(left(regexp_extract(arlima_normalise(idno), '\\d+'), 2), '') AS idno_prefix
+"""
+
+
+def idno_scores(
+    left: pa.Array | pa.ChunkedArray, right: pa.Array | pa.ChunkedArray
+) -> pa.Array:
+    """Similarity, from 0 to 100, of each pair of shelfmarks in two columns.
+
+    Examples:
+        >>> idno_scores(
+        ...     pa.array(["royal 20 d xi", "fr 1555", None]),
+        ...     pa.array(["royal 20 d xi", "fr 1556", "fr 1555"]),
+        ... ).to_pylist()
+        [100.0, 85.71428680419922, None]
+
+    Args:
+        left (pa.Array | pa.ChunkedArray): The first shelfmarks.
+        right (pa.Array | pa.ChunkedArray): The shelfmarks to compare them to.
+
+    Returns:
+        pa.Array: The scores, null where either shelfmark is.
+    """
+
+    if isinstance(left, pa.ChunkedArray):
+        left = left.combine_chunks()
+    if isinstance(right, pa.ChunkedArray):
+        right = right.combine_chunks()
+    missing = pc.or_(left.is_null(), right.is_null()).to_numpy(zero_copy_only=False)
+    scores = process.cpdist(
+        left.fill_null("").to_pylist(),
+        right.fill_null("").to_pylist(),
+        scorer=fuzz.token_set_ratio,
+        workers=-1,
+    )
+    return pa.array(scores, type=pa.float64(), mask=missing)
+
+
+def register_idno_score(conn: duckdb.DuckDBPyConnection) -> None:
+    """Register `arlima_idno_score(VARCHAR, VARCHAR)`, which scores each vector
+    of candidate pairs with `idno_scores`.
+
+    Examples:
+        >>> conn = duckdb.connect()
+        >>> register_idno_score(conn)
+        >>> conn.execute("SELECT arlima_idno_score('fr 1555', 'fr 1555')").fetchone()
+        (100.0,)
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+    """
+
+    conn.create_function(
+        "arlima_idno_score", idno_scores, [VARCHAR, VARCHAR], DOUBLE, type="arrow"
+    )
+
+
+def load_source(
+    conn: duckdb.DuckDBPyConnection, source: Path
+) -> duckdb.DuckDBPyRelation:
+    """Open an external witness list, a Parquet file or else a CSV file.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+        source (Path): The witness list.
+
+    Raises:
+        ValueError: The list lacks one of the REQUIRED_COLUMNS.
+
+    Returns:
+        duckdb.DuckDBPyRelation: The list's rows.
+    """
+
+    source = Path(source)
+    if source.suffix.lower() == ".parquet":
+        relation = conn.read_parquet(str(source))
+    else:
+        relation = conn.read_csv(str(source), header=True, all_varchar=True)
+    missing = [name for name in REQUIRED_COLUMNS if name not in relation.columns]
+    if missing:
+        raise ValueError(
+            "{} lacks the column(s) {}.".format(source, ", ".join(missing))
+        )
+    return relation
+
+
+def stage_tables(conn: duckdb.DuckDBPyConnection, source: Path) -> None:
+    """Copy the external witnesses and Arlima's manuscripts into the two
+    temporary tables of the linkage, with the same normalised columns.
+
+    External witnesses keep their `id`, if they have one, and are otherwise
+    numbered in order; manuscripts are numbered in order of page.
+    """
+
+    register_normalise(conn)
+    relation = load_source(conn, source)
+    if "id" in relation.columns:
+        unique_id = "CAST(id AS VARCHAR)"
+    else:
+        unique_id = "CAST(row_number() OVER () AS VARCHAR)"
+    if "collection" not in relation.columns:
+        relation = relation.project("*, NULL::VARCHAR AS collection")
+    relation.create_view("link_source")
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE {table} AS
+        SELECT
+            {unique_id} AS unique_id,
+            {columns},
+            -- Splink wants the same columns on both sides
+            NULL::VARCHAR AS page,
+            NULL::VARCHAR AS archive_href
+        FROM (
+            SELECT * REPLACE (
+                CAST(settlement AS VARCHAR) AS settlement,
+                CAST(repository AS VARCHAR) AS repository,
+                CAST(collection AS VARCHAR) AS collection,
+                CAST(idno AS VARCHAR) AS idno
+            )
+            FROM link_source
+        )
+        """.format(table=EXTERNAL, unique_id=unique_id, columns=STAGED_COLUMNS))
+    conn.execute("DROP VIEW link_source")
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE {table} AS
+        SELECT
+            CAST(row_number() OVER (ORDER BY page, idno) AS VARCHAR) AS unique_id,
+            {columns},
+            page,
+            archive_href
+        FROM manuscripts
+        """.format(table=ARLIMA, columns=STAGED_COLUMNS))
+
+
+def block_candidates(
+    conn: duckdb.DuckDBPyConnection, rules: list[str] = BLOCKING_RULES
+) -> int:
+    """Pair the external witnesses with the manuscripts that satisfy any of
+    the blocking rules, and score each pair's shelfmarks.
+
+    Each rule is an equi-join, so DuckDB only ever builds the pairs inside the
+    blocks, never the full cross product.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+        rules (list[str], optional): Join conditions between `l`, the external
+            witness, and `r`, the manuscript. Defaults to BLOCKING_RULES.
+
+    Returns:
+        int: Number of candidate pairs.
+    """
+
+    register_idno_score(conn)
+    blocks = "\n        UNION\n".join(
+        """
+        SELECT l.unique_id AS external_id, r.unique_id AS arlima_id
+        FROM {external} l JOIN {arlima} r ON {rule}""".format(
+            external=EXTERNAL, arlima=ARLIMA, rule=rule
+        )
+        for rule in rules
+    )
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE {table} AS
+        SELECT
+            p.external_id,
+            p.arlima_id,
+            arlima_idno_score(l.idno_norm, r.idno_norm) AS idno_score
+        FROM ({blocks}
+        ) p
+        JOIN {external} l ON l.unique_id = p.external_id
+        JOIN {arlima} r ON r.unique_id = p.arlima_id
+        """.format(table=CANDIDATES, blocks=blocks, external=EXTERNAL, arlima=ARLIMA))
+    return conn.execute("SELECT count(*) FROM {}".format(CANDIDATES)).fetchone()[0]
+
+
+def predict_matches(conn: duckdb.DuckDBPyConnection, max_pairs: float = 1e6) -> None:
+    """Train a splink model on the staged tables and store the probability
+    that each blocked pair is a match.
+
+    The u probabilities are estimated on `max_pairs` random pairs, the m
+    probabilities by expectation maximisation on the TRAINING_RULES blocks.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection.
+        max_pairs (float, optional): Random pairs sampled to estimate the u
+            probabilities. Defaults to 1e6.
+    """
+
+    manuscripts = conn.execute("SELECT count(*) FROM {}".format(ARLIMA)).fetchone()[0]
+    settings = {
+        "link_type": "link_only",
+        "unique_id_column_name": "unique_id",
+        "blocking_rules_to_generate_predictions": BLOCKING_RULES,
+        "comparisons": [
+            cl.exact_match("repository_norm"),
+            cl.exact_match("collection_norm"),
+            cl.jaro_winkler_at_thresholds("idno_norm", [0.95, 0.85]),
+        ],
+        "probability_two_random_records_match": 1 / max(manuscripts, 1),
+        "retain_matching_columns": False,
+        "retain_intermediate_calculation_columns": False,
+    }
+    linker = DuckDBLinker(
+        [EXTERNAL, ARLIMA],
+        settings,
+        connection=conn,
+        input_table_aliases=["external", "arlima"],
+    )
+    linker.estimate_u_using_random_sampling(max_pairs=max_pairs)
+    for rule in TRAINING_RULES:
+        linker.estimate_parameters_using_expectation_maximisation(rule)
+    predictions = linker.predict().physical_name
+    # Splink orders each pair by dataset, so put the external witness first
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE {table} AS
+        SELECT
+            CASE WHEN source_dataset_l = 'external'
+                THEN unique_id_l ELSE unique_id_r END AS external_id,
+            CASE WHEN source_dataset_l = 'external'
+                THEN unique_id_r ELSE unique_id_l END AS arlima_id,
+            match_probability
+        FROM {predictions}
+        """.format(table=PREDICTIONS, predictions=predictions))
+
+
+def rank_matches(
+    conn: duckdb.DuckDBPyConnection, top_k: int = 5, table: str = "matches"
+) -> int:
+    """Write each external witness's `top_k` best candidates to `table`,
+    ranked by match probability, then by shelfmark score.
+
+    Returns:
+        int: Number of rows written.
+    """
+
+    tables = [row[0] for row in conn.execute("SHOW TABLES").fetchall()]
+    if PREDICTIONS in tables:
+        predictions = PREDICTIONS
+    else:
+        predictions = (
+            "(SELECT NULL::VARCHAR AS external_id, NULL::VARCHAR AS arlima_id,"
+            " NULL::DOUBLE AS match_probability WHERE false)"
+        )
+    conn.execute(
+        """
+        CREATE OR REPLACE TABLE {table} AS
+        SELECT
+            c.external_id,
+            a.page,
+            a.archive_href,
+            a.settlement,
+            a.repository,
+            a.collection,
+            a.idno,
+            c.idno_score,
+            p.match_probability,
+            row_number() OVER (
+                PARTITION BY c.external_id
+                ORDER BY p.match_probability DESC NULLS LAST,
+                    c.idno_score DESC NULLS LAST,
+                    a.unique_id
+            ) AS rank
+        FROM {candidates} c
+        JOIN {arlima} a ON a.unique_id = c.arlima_id
+        LEFT JOIN {predictions} p
+            ON p.external_id = c.external_id AND p.arlima_id = c.arlima_id
+        QUALIFY rank <= {top_k}
+        ORDER BY c.external_id, rank
+        """.format(
+            table=table,
+            candidates=CANDIDATES,
+            arlima=ARLIMA,
+            predictions=predictions,
+            top_k=int(top_k),
+        )
+    )
+    return conn.execute("SELECT count(*) FROM {}".format(table)).fetchone()[0]
+
+
+def match_witnesses(
+    conn: duckdb.DuckDBPyConnection,
+    source: Path,
+    top_k: int = 5,
+    use_splink: bool = True,
+    max_pairs: float = 1e6,
+) -> int:
+    """Link an external list of witnesses to the manuscripts table and write
+    the ranked candidates to the `matches` table.
+
+    Examples:
+        >>> conn = duckdb.connect()
+        >>> _ = conn.execute(
+        ...     "CREATE TABLE manuscripts AS SELECT * FROM (VALUES "
+        ...     "('p1', NULL, 'London', 'British Library', 'Royal', '20. D. XI'),"
+        ...     "('p2', NULL, 'London', 'British Library', 'Royal', '20. C. IV')"
+        ...     ") t(page, archive_href, settlement, repository, collection, idno)"
+        ... )
+        >>> source = Path(tempfile.mkdtemp()).joinpath("witnesses.csv")
+        >>> _ = source.write_text(
+        ...     "id,settlement,repository,collection,idno\\n"
+        ...     "w1,london,British library,royal,20 D XI\\n"
+        ... )
+        >>> match_witnesses(conn, source, use_splink=False)
+        2
+        >>> conn.execute("SELECT external_id, page, rank FROM matches").fetchall()
+        [('w1', 'p1', 1), ('w1', 'p2', 2)]
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): The database connection, with a
+            manuscripts table.
+        source (Path): CSV or Parquet file with `settlement`, `repository` and
+            `idno` columns, and optionally `collection` and `id`.
+        top_k (int, optional): Candidates kept per witness. Defaults to 5.
+        use_splink (bool, optional): Rank the candidates with a splink model's
+            match probability, not only by shelfmark score. Defaults to True.
+        max_pairs (float, optional): Random pairs sampled to train the splink
+            model. Defaults to 1e6.
+
+    Returns:
+        int: Number of rows in the matches table.
+    """
+
+    conn.execute("DROP TABLE IF EXISTS {}".format(PREDICTIONS))
+    stage_tables(conn, source)
+    if block_candidates(conn) and use_splink:
+        predict_matches(conn, max_pairs=max_pairs)
+    return rank_matches(conn, top_k=top_k)
@@ -0,0 +1,264 @@
+import shutil
+import tempfile
+from pathlib import Path
+from typing import NamedTuple
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from rapidfuzz import fuzz
+
+from arlima.fm import SHELFMARKS, modified
+from arlima.normalise import ngrams, normalise
+
+# Columns of the manuscripts table kept in the index
+COLUMNS = ("page", "settlement", "repository", "collection", "idno", "shelfmark")
+
+# Arrays of a saved index, each in its own .npy file
+ARRAYS = (
+    "keys",
+    "settlements",
+    "repositories",
+    "order",
+    "places",
+    "libraries",
+    "grams",
+    "offsets",
+    "postings",
+)
+
+
+class ShelfmarkMatch(NamedTuple):
+    page: str
+    settlement: str | None
+    repository: str | None
+    collection: str | None
+    idno: str | None
+    score: float
+
+
+class ShelfmarkIndex:
+    """Find the witnesses of a manuscript without scanning the manuscripts
+    table.
+
+    Each witness keeps its settlement, repository and shelfmark folded with
+    `normalise`, as arrays in the order of the witnesses. Witnesses are looked
+    up by exact shelfmark key with a binary search in the keys' sorted order,
+    then kept if in the settlement and repository sought. When none matches,
+    they are looked up by the n-grams their key shares with the one sought,
+    the best few being scored with rapidfuzz. The n-grams are stored as a
+    sorted vocabulary, offsets and postings arrays, like those of the
+    TitleIndex, so that a saved index is memory-mapped rather than rebuilt on
+    load.
+
+    Examples:
+        >>> conn = duckdb.connect()
+        >>> _ = conn.execute(
+        ...     "CREATE TABLE manuscripts AS SELECT * FROM (VALUES "
+        ...     "('a.html', 'Paris', 'Bibliothèque nationale de France',"
+        ...     " NULL, 'fr. 1553, f. 1r-4v', 'fr 1553'),"
+        ...     "('b.html', 'Paris', 'Bibliothèque nationale de France',"
+        ...     " NULL, 'fr. 1555', 'fr 1555')"
+        ...     ") t(page, settlement, repository, collection, idno, shelfmark)"
+        ... )
+        >>> index = ShelfmarkIndex.from_db(conn)
+        >>> [m.page for m in index.lookup("fr. 1553", settlement="Paris")]
+        ['a.html']
+        >>> [(m.page, m.score) for m in index.lookup("fr 1533", cutoff=70)]
+        [('a.html', 85.71428571428572), ('b.html', 71.42857142857143)]
+
+    Args:
+        witnesses (pa.Table): The indexed witnesses, with the COLUMNS.
+        arrays (dict[str, np.ndarray]): The ARRAYS of the index: the folded
+            `keys`, `settlements` and `repositories` of the witnesses, the
+            `order` sorting the keys, the sorted `places`, each a settlement
+            and repository joined by a tab, the sorted `libraries`, and the
+            n-grams' `grams` vocabulary, `offsets` and `postings`.
+    """
+
+    def __init__(self, witnesses: pa.Table, arrays: dict[str, np.ndarray]) -> None:
+        self.witnesses = witnesses
+        self.keys = arrays["keys"]
+        self.settlements = arrays["settlements"]
+        self.repositories = arrays["repositories"]
+        self.order = arrays["order"]
+        self.places = arrays["places"]
+        self.libraries = arrays["libraries"]
+        self.grams = arrays["grams"]
+        self.offsets = arrays["offsets"]
+        self.postings = arrays["postings"]
+
+    @classmethod
+    def build(cls, table: pa.Table) -> "ShelfmarkIndex":
+        """Index witnesses, given as a table with the COLUMNS."""
+
+        keys, settlements, repositories = (
+            np.array(
+                [normalise(value) or "" for value in table.column(column).to_pylist()],
+                dtype=str,
+            )
+            for column in ("shelfmark", "settlement", "repository")
+        )
+        postings = {}
+        for row_id, key in enumerate(keys.tolist()):
+            for gram in ngrams(key):
+                postings.setdefault(gram, []).append(row_id)
+        grams = sorted(postings)
+        sizes = [len(postings[gram]) for gram in grams]
+        arrays = {
+            "keys": keys,
+            "settlements": settlements,
+            "repositories": repositories,
+            "order": np.argsort(keys, kind="stable").astype(np.int32),
+            "places": np.unique(
+                np.char.add(np.char.add(settlements, "\t"), repositories)
+            ),
+            "libraries": np.unique(repositories),
+            "grams": np.array(grams, dtype="U3"),
+            "offsets": np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64),
+            "postings": np.array(
+                [i for gram in grams for i in postings[gram]], dtype=np.int32
+            ),
+        }
+        return cls(table, arrays)
+
+    @classmethod
+    def from_db(
+        cls, conn: duckdb.DuckDBPyConnection, table: str = "manuscripts"
+    ) -> "ShelfmarkIndex":
+        query = "SELECT {} FROM {} ORDER BY page".format(", ".join(COLUMNS), table)
+        return cls.build(conn.execute(query).arrow())
+
+    def save(self, path: Path = SHELFMARKS) -> None:
+        # Write into a new directory, then swap it for the old one
+        tmp = Path(tempfile.mkdtemp(dir=path.parent))
+        pq.write_table(self.witnesses, tmp.joinpath("witnesses.parquet"))
+        for name in ARRAYS:
+            np.save(tmp.joinpath(name + ".npy"), getattr(self, name))
+        if path.exists():
+            shutil.rmtree(path)
+        tmp.rename(path)
+
+    @classmethod
+    def load(cls, path: Path = SHELFMARKS) -> "ShelfmarkIndex":
+        return cls(
+            pq.read_table(path.joinpath("witnesses.parquet"), memory_map=True),
+            {
+                name: np.load(path.joinpath(name + ".npy"), mmap_mode="r")
+                for name in ARRAYS
+            },
+        )
+
+    def scope(
+        self, settlement: str | None = None, repository: str | None = None
+    ) -> tuple[str | None, str | None]:
+        """The folded settlement and repository to search, None for any.
+
+        An unknown repository widens the search to its whole settlement, as
+        catalogues name libraries differently; an unknown settlement finds
+        nothing.
+        """
+
+        if settlement is not None:
+            settlement = normalise(settlement) or ""
+        if repository is not None:
+            repository = normalise(repository) or ""
+            if settlement is None:
+                known = contains(self.libraries, repository)
+            else:
+                known = contains(self.places, settlement + "\t" + repository)
+            if not known:
+                repository = None
+        return settlement, repository
+
+    def within(
+        self, rows: np.ndarray, scope: tuple[str | None, str | None]
+    ) -> np.ndarray:
+        """The rows of witnesses in the settlement and repository of a scope."""
+
+        settlement, repository = scope
+        if settlement is not None:
+            rows = rows[self.settlements[rows] == settlement]
+        if repository is not None:
+            rows = rows[self.repositories[rows] == repository]
+        return rows
+
+    def candidates(self, key: str) -> np.ndarray:
+        """How many n-grams each witness shares with a key."""
+
+        shared = np.zeros(len(self.keys), dtype=np.int64)
+        if not len(self.grams):
+            return shared
+        grams = np.array(sorted(ngrams(key)), dtype="U3")
+        positions = np.searchsorted(self.grams, grams).clip(max=len(self.grams) - 1)
+        for i in positions[self.grams[positions] == grams]:
+            shared[self.postings[self.offsets[i] : self.offsets[i + 1]]] += 1
+        return shared
+
+    def lookup(
+        self,
+        shelfmark: str,
+        settlement: str | None = None,
+        repository: str | None = None,
+        limit: int = 10,
+        cutoff: float = 80,
+    ) -> list[ShelfmarkMatch]:
+        """Witnesses of a manuscript, best first.
+
+        Args:
+            shelfmark (str): The shelfmark, with its collection, e.g. "fr. 1553".
+            settlement (str | None, optional): The manuscript's city.
+            repository (str | None, optional): Its library.
+            limit (int, optional): Fuzzy matches returned at most. Defaults to
+                10.
+            cutoff (float, optional): Lowest score of a fuzzy match, from 0 to
+                100. Defaults to 80.
+
+        Returns:
+            list[ShelfmarkMatch]: Every witness with the same shelfmark key,
+                scoring 100, or else the closest ones.
+        """
+
+        key = normalise(shelfmark) or ""
+        scope = self.scope(settlement, repository)
+        first = np.searchsorted(self.keys, key, side="left", sorter=self.order)
+        last = np.searchsorted(self.keys, key, side="right", sorter=self.order)
+        exact = self.within(np.sort(self.order[first:last]), scope)
+        if len(exact):
+            return [self.match(row_id, 100.0) for row_id in exact.tolist()]
+
+        shared = self.candidates(key)
+        rows = self.within(np.flatnonzero(shared), scope)
+        # Only score the witnesses sharing the most n-grams
+        shortlist = rows[np.argsort(-shared[rows], kind="stable")[: limit * 5]]
+        scored = []
+        for row_id in shortlist.tolist():
+            score = fuzz.ratio(key, str(self.keys[row_id]), score_cutoff=cutoff)
+            if score:
+                scored.append((-score, row_id))
+        return [self.match(row_id, -score) for score, row_id in sorted(scored)[:limit]]
+
+    def match(self, row_id: int, score: float) -> ShelfmarkMatch:
+        row = self.witnesses.slice(row_id, 1).select(COLUMNS[:-1]).to_pylist()[0]
+        return ShelfmarkMatch(**row, score=score)
+
+
+def contains(values: np.ndarray, value: str) -> bool:
+    """Whether a sorted array holds a value."""
+
+    position = np.searchsorted(values, value)
+    return bool(position < len(values) and values[position] == value)
+
+
+def shelfmark_index(
+    conn: duckdb.DuckDBPyConnection, db: Path, path: Path = SHELFMARKS
+) -> ShelfmarkIndex:
+    """Load the saved index, first rebuilding it if the database changed since
+    it was saved."""
+
+    if not path.exists() or path.stat().st_mtime < modified(db):
+        index = ShelfmarkIndex.from_db(conn)
+        index.save(path)
+        return index
+    return ShelfmarkIndex.load(path)
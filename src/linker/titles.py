@@ -0,0 +1,219 @@
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Iterable, NamedTuple
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from rapidfuzz import fuzz, process
+
+from arlima.fm import TITLES, modified
+from arlima.normalise import ngrams, normalise
+
+
+class TitleMatch(NamedTuple):
+    link: str
+    title: str
+    score: float
+
+
+class TitleIndex:
+    """Find pages by approximate title, among both their simple and canonic
+    titles.
+
+    Each distinct title of a page is a variant, folded with `normalise`. An
+    inverted index maps each trigram to the variants containing it, stored as
+    a sorted vocabulary, offsets and postings arrays. A saved index, arrays
+    and variants, is memory-mapped rather than read on load, and a query only
+    reads and scores the variants sharing the most trigrams with it, all the
+    queries of a batch at once.
+
+    Examples:
+        >>> index = TitleIndex.build(
+        ...     [
+        ...         ("rose.html", "Roman de la Rose"),
+        ...         ("rose.html", "Le Roman de la Rose"),
+        ...         ("renart.html", "Roman de Renart"),
+        ...     ]
+        ... )
+        >>> [(m.link, round(m.score)) for m in index.search(["roman de la roze"])[0]]
+        [('rose.html', 94), ('renart.html', 65)]
+
+    Args:
+        variants (pa.Table): The `link`, `title` and folded `key` of each
+            variant.
+        grams (np.ndarray): The sorted trigram vocabulary.
+        offsets (np.ndarray): Where each trigram's postings start, and end.
+        postings (np.ndarray): The variants of each trigram, in order.
+    """
+
+    def __init__(
+        self,
+        variants: pa.Table,
+        grams: np.ndarray,
+        offsets: np.ndarray,
+        postings: np.ndarray,
+    ) -> None:
+        self.variants = variants
+        self.grams = grams
+        self.offsets = offsets
+        self.postings = postings
+
+    @classmethod
+    def build(cls, titles: Iterable[tuple[str, str | None]]) -> "TitleIndex":
+        """Index (link, title) pairs, skipping empty and repeated ones."""
+
+        links, variants, keys, seen = [], [], [], set()
+        postings = {}
+        for link, title in titles:
+            key = normalise(title)
+            if key is None or (link, key) in seen:
+                continue
+            seen.add((link, key))
+            for gram in ngrams(key):
+                postings.setdefault(gram, []).append(len(keys))
+            links.append(link)
+            variants.append(title)
+            keys.append(key)
+        grams = sorted(postings)
+        sizes = [len(postings[gram]) for gram in grams]
+        return cls(
+            variants=pa.table(
+                {"link": links, "title": variants, "key": keys},
+                schema=pa.schema(
+                    [
+                        ("link", pa.string()),
+                        ("title", pa.string()),
+                        ("key", pa.string()),
+                    ]
+                ),
+            ),
+            grams=np.array(grams, dtype="U3"),
+            offsets=np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64),
+            postings=np.array(
+                [i for gram in grams for i in postings[gram]], dtype=np.int32
+            ),
+        )
+
+    @classmethod
+    def from_db(
+        cls, conn: duckdb.DuckDBPyConnection, table: str = "pages"
+    ) -> "TitleIndex":
+        rows = conn.execute("""
+            SELECT link, unnest([simple_title, canonic_title])
+            FROM {}
+            ORDER BY link
+            """.format(table)).fetchall()
+        return cls.build(rows)
+
+    def save(self, path: Path = TITLES) -> None:
+        # Write into a new directory, then swap it for the old one
+        tmp = Path(tempfile.mkdtemp(dir=path.parent))
+        pq.write_table(self.variants, tmp.joinpath("variants.parquet"))
+        for name in ("grams", "offsets", "postings"):
+            np.save(tmp.joinpath(name + ".npy"), getattr(self, name))
+        if path.exists():
+            shutil.rmtree(path)
+        tmp.rename(path)
+
+    @classmethod
+    def load(cls, path: Path = TITLES) -> "TitleIndex":
+        return cls(
+            variants=pq.read_table(path.joinpath("variants.parquet"), memory_map=True),
+            **{
+                name: np.load(path.joinpath(name + ".npy"), mmap_mode="r")
+                for name in ("grams", "offsets", "postings")
+            },
+        )
+
+    def candidates(self, key: str, shortlist: int) -> np.ndarray:
+        """The `shortlist` variants sharing the most trigrams with a key."""
+
+        if not len(self.grams):
+            return np.empty(0, dtype=np.int32)
+        grams = np.array(sorted(ngrams(key)), dtype="U3")
+        positions = np.searchsorted(self.grams, grams).clip(max=len(self.grams) - 1)
+        found = positions[self.grams[positions] == grams]
+        if not len(found):
+            return np.empty(0, dtype=np.int32)
+        shared = np.bincount(
+            np.concatenate(
+                [self.postings[self.offsets[i] : self.offsets[i + 1]] for i in found]
+            ),
+            minlength=self.variants.num_rows,
+        )
+        if np.count_nonzero(shared) > shortlist:
+            ids = np.argpartition(-shared, shortlist)[:shortlist]
+        else:
+            ids = np.flatnonzero(shared)
+        return ids
+
+    def search(
+        self,
+        queries: list[str],
+        k: int = 5,
+        cutoff: float = 50,
+        shortlist: int = 64,
+        workers: int = -1,
+    ) -> list[list[TitleMatch]]:
+        """The `k` pages whose titles are closest to each query.
+
+        Args:
+            queries (list[str]): The titles sought.
+            k (int, optional): Pages returned per query. Defaults to 5.
+            cutoff (float, optional): Lowest score returned, from 0 to 100.
+                Defaults to 50.
+            shortlist (int, optional): Variants scored per query. Defaults to
+                64.
+            workers (int, optional): Threads scoring the pairs, -1 for all
+                cores. Defaults to -1.
+
+        Returns:
+            list[list[TitleMatch]]: For each query, its best pages, best first.
+        """
+
+        keys = [normalise(query) or "" for query in queries]
+        owners, ids = [], []
+        for position, key in enumerate(keys):
+            found = self.candidates(key, shortlist)
+            owners.extend([position] * len(found))
+            ids.extend(found.tolist())
+        # Only the shortlisted variants are read from the, maybe memory-mapped,
+        # table
+        rows = self.variants.take(pa.array(ids, type=pa.int64()))
+        links, titles, variants = (
+            rows.column(name).to_pylist() for name in ("link", "title", "key")
+        )
+        # Score the shortlists of all the queries in one call
+        scores = process.cpdist(
+            [keys[position] for position in owners],
+            variants,
+            scorer=fuzz.token_sort_ratio,
+            workers=workers,
+        )
+        results = [{} for _ in queries]
+        for position, link, title, score in zip(owners, links, titles, scores.tolist()):
+            if score < cutoff:
+                continue
+            best = results[position].get(link)
+            if best is None or score > best.score:
+                results[position][link] = TitleMatch(link, title, score)
+        return [
+            sorted(matches.values(), key=lambda m: (-m.score, m.link))[:k]
+            for matches in results
+        ]
+
+
+def title_index(
+    conn: duckdb.DuckDBPyConnection, db: Path, path: Path = TITLES
+) -> TitleIndex:
+    """Load the saved index, first rebuilding it if the database changed since
+    it was saved."""
+
+    if not path.exists() or path.stat().st_mtime < modified(db):
+        index = TitleIndex.from_db(conn)
+        index.save(path)
+        return index
+    return TitleIndex.load(path)
@@ -3,6 +3,7 @@ from pathlib import Path
 
 TESTS_DIR = Path(__file__).parent
 SRC_DIR = TESTS_DIR.parent
+FIXTURES = TESTS_DIR.joinpath("fixtures")
 
 
 STEMMATA = SRC_DIR.parent.joinpath("data").joinpath("openstemmata-data")
@@ -0,0 +1,96 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from tests import FIXTURES
+
+
+class FixtureServer:
+    """A local stand-in for arlima.net serving the saved fixture pages.
+
+    `/<name>.html` returns the fixture of that name, whatever the query
+    string, with an ETag, or a 304 to a matching If-None-Match. Paths listed in `flaky` answer 503 that many
+    times before succeeding, and every response is delayed by `latency`
+    seconds to imitate the network.
+
+    Examples:
+        >>> with FixtureServer() as server:
+        ...     server.url("text.html").startswith("http://127.0.0.1:")
+        True
+    """
+
+    def __init__(
+        self,
+        directory: Path = FIXTURES,
+        latency: float = 0,
+        flaky: dict | None = None,
+    ) -> None:
+        self.directory = directory
+        self.latency = latency
+        self.flaky = Counter(flaky or {})
+        self.hits = Counter()
+        self.not_modified = Counter()
+        self.times = []
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.httpd.daemon_threads = True
+
+    def handler(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                # Query strings let one fixture stand for many pages
+                name = urlsplit(self.path).path.lstrip("/")
+                with server.lock:
+                    server.hits[name] += 1
+                    server.times.append(time.monotonic())
+                    fail = server.flaky[name] > 0
+                    if fail:
+                        server.flaky[name] -= 1
+                if server.latency:
+                    time.sleep(server.latency)
+                path = server.directory.joinpath(name)
+                if fail:
+                    self.send_response(503)
+                    self.send_header("Retry-After", "0")
+                    body = b""
+                elif path.is_file():
+                    body = path.read_bytes()
+                    etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+                    if self.headers.get("If-None-Match") == etag:
+                        with server.lock:
+                            server.not_modified[name] += 1
+                        self.send_response(304)
+                        body = b""
+                    else:
+                        self.send_response(200)
+                        self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("ETag", etag)
+                else:
+                    self.send_response(404)
+                    body = b""
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def url(self, name: str) -> str:
+        return "http://127.0.0.1:{}/{}".format(self.httpd.server_port, name)
+
+    def __enter__(self) -> "FixtureServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,108 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import duckdb
+
+from arlima.archive import PageArchive
+from arlima.reparse import reparse_pages
+from arlima.request_pages import (
+    CrawlOptions,
+    scrape_pages,
+    setup_hashes_table,
+    setup_pages_table,
+    setup_witnesses_table,
+    write_results,
+)
+from arlima.schema import migrate
+from tests import FIXTURES
+from tests.server import FixtureServer
+
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.archive = PageArchive(Path(tempfile.mkdtemp()))
+        self.names = sorted(path.name for path in FIXTURES.glob("*.html"))
+
+    def crawl(self, engine: str) -> duckdb.DuckDBPyConnection:
+        conn = duckdb.connect()
+        setup_pages_table(conn)
+        setup_witnesses_table(conn)
+        setup_hashes_table(conn)
+        options = CrawlOptions(
+            fetch_workers=2, parse_workers=2, engine=engine, archive=self.archive
+        )
+        with FixtureServer() as server:
+            links = [server.url(name) for name in self.names]
+            links.append(server.url("gone.html"))
+            write_results(conn, scrape_pages(links, options))
+        return conn
+
+    def rows(self, conn: duckdb.DuckDBPyConnection) -> dict:
+        return {
+            table: sorted(conn.table(table).fetchall())
+            for table in ("pages", "manuscripts")
+        }
+
+    def test_archive(self):
+        conn = self.crawl("threads")
+        rows = conn.execute(
+            "SELECT status, count(*) FROM read_parquet(?) GROUP BY ALL ORDER BY 1",
+            [self.archive.files()],
+        ).fetchall()
+        self.assertEqual(rows, [(200, len(self.names)), (404, 1)])
+        self.assertEqual(self.archive.count(), len(self.names))
+
+    def test_failed_crawl(self):
+        # A crawl that fails midway leaves neither its file nor a partial one
+        with self.assertRaises(KeyboardInterrupt):
+            with self.archive.writer("failed") as writer:
+                writer.add("a.html", 200, b"<html>a</html>")
+                raise KeyboardInterrupt
+        self.assertEqual(list(self.archive.root.iterdir()), [])
+        self.assertEqual(self.archive.count(), 0)
+
+    def test_reparse(self):
+        crawled = self.rows(self.crawl("async"))
+        conn = duckdb.connect()
+        parsed = reparse_pages(conn, self.archive, CrawlOptions(parse_workers=2))
+        self.assertEqual(parsed, len(self.names))
+        self.assertEqual(self.rows(conn), crawled)
+        # The parse problems of the archived pages are logged again
+        self.assertGreater(conn.table("scrape_errors").count("*").fetchone()[0], 0)
+
+    def test_reparse_state(self):
+        conn = self.crawl("threads")
+        links = [link for link, _ in self.archive.pages()]
+        missing = "https://www.arlima.net/never_archived.html"
+        migrate(conn)
+        conn.execute(
+            "INSERT INTO arlima_index SELECT NULL, unnest(?::VARCHAR[]), NULL",
+            [links + [missing]],
+        )
+        reparse_pages(conn, self.archive, CrawlOptions(parse_workers=2))
+        # The checkpoints match the rebuilt pages, the page never archived
+        # being left for a resumed crawl
+        self.assertEqual(
+            dict(conn.execute("SELECT link, status FROM crawl_state").fetchall()),
+            {**dict.fromkeys(links, "done"), missing: "pending"},
+        )
+
+    def test_interrupted_reparse(self):
+        conn = self.crawl("threads")
+        crawled = self.rows(conn)
+        pages = list(self.archive.pages())
+
+        def interrupted():
+            yield from pages[:2]
+            raise KeyboardInterrupt
+
+        self.archive.pages = interrupted
+        with self.assertRaises(KeyboardInterrupt):
+            reparse_pages(conn, self.archive, CrawlOptions(parse_workers=2))
+        # The previous tables are left whole
+        self.assertEqual(self.rows(conn), crawled)
+
+
+if __name__ == "__main__":
+    unittest.main()
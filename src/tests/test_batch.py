@@ -0,0 +1,42 @@
+import random
+import unittest
+
+from rapidfuzz import fuzz
+
+from linker.batch import top_matches
+
+
+class TopMatchesTest(unittest.TestCase):
+    def test_blocks_match_brute_force(self):
+        rng = random.Random(0)
+        words = ["roman", "rose", "renart", "dit", "lai", "conte", "graal", "vie"]
+        targets = [
+            " ".join(rng.choice(words) for _ in range(rng.randint(1, 4)))
+            for _ in range(200)
+        ]
+        queries = [" ".join(rng.sample(words, 2)) for _ in range(50)]
+
+        # Blocks of a single query, then of all the queries at once
+        small = list(top_matches(queries, targets, top_k=3, cutoff=60, block_bytes=1))
+        large = list(top_matches(queries, targets, top_k=3, cutoff=60))
+        self.assertEqual(
+            [(q, score, rank) for q, _, score, rank in small],
+            [(q, score, rank) for q, _, score, rank in large],
+        )
+
+        for query, target, score, rank in small:
+            scores = sorted(
+                (fuzz.token_sort_ratio(queries[query], t) for t in targets),
+                reverse=True,
+            )
+            self.assertAlmostEqual(score, scores[rank - 1], places=4)
+            self.assertGreaterEqual(score, 60)
+        ranks = {}
+        for query, _, _, rank in small:
+            ranks.setdefault(query, []).append(rank)
+        self.assertTrue(all(r == list(range(1, len(r) + 1)) for r in ranks.values()))
+        self.assertTrue(all(len(r) <= 3 for r in ranks.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
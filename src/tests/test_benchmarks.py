@@ -0,0 +1,41 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from arlima.archive import PageArchive
+from benchmarks.record import CATEGORIES, record_corpus
+from benchmarks.suite import BENCHMARKS, load_corpus, measure
+from tests import FIXTURES
+
+
+class RecordTest(unittest.TestCase):
+    def test_record_corpus(self):
+        # The fixtures, each archived twice under different links
+        archive = PageArchive(Path(tempfile.mkdtemp()))
+        with archive.writer("crawl") as writer:
+            for path in FIXTURES.glob("*.html"):
+                for folder in ("a", "b"):
+                    link = "https://www.arlima.net/{}/{}".format(folder, path.name)
+                    writer.add(link, 200, path.read_bytes())
+        corpus = Path(tempfile.mkdtemp()).joinpath("corpus")
+        # Before any recording, the fixtures stand for the corpus
+        self.assertEqual(
+            sorted(load_corpus(corpus)),
+            sorted(path.name for path in FIXTURES.glob("*.html")),
+        )
+
+        recorded = record_corpus(archive, per_category=1, path=corpus)
+        self.assertEqual(recorded, dict.fromkeys(CATEGORIES, 1))
+        self.assertEqual(
+            sorted(load_corpus(corpus)),
+            sorted("{0}_a_{0}.html".format(name) for name in CATEGORIES),
+        )
+
+    def test_crawl_benchmark(self):
+        # The crawl serves the corpus itself, without the tests' server
+        run, items = BENCHMARKS["crawl_threads"](load_corpus())
+        self.assertEqual(measure("crawl_threads", run, items, rounds=1).items, items)
+
+
+if __name__ == "__main__":
+    unittest.main()
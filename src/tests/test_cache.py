@@ -0,0 +1,60 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from arlima.cache import ResponseCache
+from arlima.crawler import AsyncScraper
+from arlima.request_pages import Scraper
+from tests import FIXTURES
+from tests.server import FixtureServer
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.root = Path(tempfile.mkdtemp())
+        self.content = FIXTURES.joinpath("text.html").read_bytes()
+
+    def test_conditional_get(self):
+        with FixtureServer() as server:
+            link = server.url("text.html")
+            scraper = Scraper(cache=ResponseCache(root=self.root))
+            self.assertEqual(scraper.fetch(link), self.content)
+            self.assertEqual(scraper.fetch(link), self.content)
+        self.assertEqual(server.hits["text.html"], 2)
+        self.assertEqual(server.not_modified["text.html"], 1)
+
+    def test_async_conditional_get(self):
+        with FixtureServer() as server:
+            link = server.url("text.html")
+            scraper = AsyncScraper(cache=ResponseCache(root=self.root))
+            self.assertEqual(dict(scraper([link]))[link], self.content)
+            self.assertEqual(dict(scraper([link]))[link], self.content)
+        self.assertEqual(server.not_modified["text.html"], 1)
+
+    def test_max_age(self):
+        with FixtureServer() as server:
+            link = server.url("text.html")
+            Scraper(cache=ResponseCache(root=self.root)).fetch(link)
+            scraper = Scraper(cache=ResponseCache(root=self.root, max_age=3600))
+            self.assertEqual(scraper.fetch(link), self.content)
+        self.assertEqual(server.hits["text.html"], 1)
+
+    def test_offline(self):
+        with FixtureServer() as server:
+            link = server.url("text.html")
+            Scraper(cache=ResponseCache(root=self.root)).fetch(link)
+            cache = ResponseCache(root=self.root, offline=True)
+            self.assertEqual(Scraper(cache=cache).fetch(link), self.content)
+            self.assertIsNone(Scraper(cache=cache).fetch(server.url("work.html")))
+        self.assertEqual(server.hits["text.html"], 1)
+        self.assertEqual(server.hits["work.html"], 0)
+
+    def test_identical_content_stored_once(self):
+        cache = ResponseCache(root=self.root)
+        cache.put("https://www.arlima.net/a.html", self.content, {})
+        cache.put("https://www.arlima.net/b.html", self.content, {})
+        self.assertEqual(len(list(self.root.joinpath("objects").glob("*/*.gz"))), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
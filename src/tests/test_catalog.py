@@ -0,0 +1,108 @@
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import duckdb
+
+from arlima.catalog import ArlimaCatalog
+from arlima.schema import migrate
+
+
+class CatalogTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Path(self.tmp.name).joinpath("arlima.db")
+        conn = duckdb.connect(str(self.db))
+        migrate(conn)
+        conn.execute("""
+            INSERT INTO pages (link, simple_title, arlima_permalink, year_earliest, year_latest)
+            VALUES
+                ('a.html', 'Abuzé en court', 'https://arlima.net/no/1', 1400, 1500),
+                ('b.html', 'Bataille Loquifer', 'https://arlima.net/no/2', 1170, 1190),
+                ('c.html', 'Chevalier au cygne', NULL, 1190, NULL)
+            """)
+        conn.execute("""
+            INSERT INTO manuscripts (page, settlement, repository, idno)
+            VALUES
+                ('a.html', 'Paris', 'Bibliothèque de l''Arsenal', '3521'),
+                ('a.html', 'Paris', 'BnF', 'fr. 1553'),
+                ('b.html', 'Paris', 'BnF', 'fr. 24369'),
+                ('c.html', 'London', 'BnF', 'Royal 15 E VI')
+            """)
+        conn.close()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_lookups(self):
+        catalog = ArlimaCatalog(db=self.db, pool_size=2)
+        self.assertEqual(catalog.page("a.html").date_latest, 1500)
+        self.assertIsNone(catalog.page("z.html"))
+        self.assertEqual(
+            catalog.page_by_permalink("https://arlima.net/no/2").link, "b.html"
+        )
+        self.assertEqual(
+            [w.idno for w in catalog.witnesses("a.html")], ["3521", "fr. 1553"]
+        )
+        self.assertEqual(
+            [p.link for p in catalog.repository_pages("Bibliothèque de l'Arsenal")],
+            ["a.html"],
+        )
+        self.assertEqual(
+            [p.link for p in catalog.repository_pages("BnF", "Paris")],
+            ["a.html", "b.html"],
+        )
+        self.assertEqual(
+            [p.link for p in catalog.works_between(1180, 1195)], ["b.html", "c.html"]
+        )
+
+        # Lookups from many threads share the pool and the cache
+        with ThreadPoolExecutor(8) as executor:
+            titles = list(
+                executor.map(
+                    lambda link: catalog.page(link).simple_title, ["a.html"] * 50
+                )
+            )
+        self.assertEqual(set(titles), {"Abuzé en court"})
+        self.assertLessEqual(catalog.opened, 2)
+        self.assertGreater(catalog.hits, 0)
+        catalog.close()
+
+    def test_refresh_invalidates(self):
+        # A catalogue on the connection that refreshes the database
+        conn = duckdb.connect(str(self.db))
+        catalog = ArlimaCatalog(conn=conn)
+        self.assertEqual(catalog.page("a.html").simple_title, "Abuzé en court")
+        self.assertEqual(catalog.page("a.html").simple_title, "Abuzé en court")
+        self.assertEqual((catalog.hits, catalog.misses), (1, 1))
+
+        conn.execute(
+            "UPDATE pages SET simple_title = 'Abusé en court' WHERE link = 'a.html'"
+        )
+        self.assertEqual(catalog.page("a.html").simple_title, "Abusé en court")
+        self.assertEqual((catalog.hits, catalog.misses), (1, 2))
+        catalog.close()
+        conn.close()
+
+    def test_reopen(self):
+        catalog = ArlimaCatalog(db=self.db)
+        self.assertEqual(catalog.page("a.html").simple_title, "Abuzé en court")
+        # Closing releases the database to another writer
+        catalog.close()
+        self.assertEqual(catalog.page("a.html").simple_title, "Abuzé en court")
+        self.assertEqual((catalog.hits, catalog.misses), (1, 1))
+        catalog.close()
+        conn = duckdb.connect(str(self.db))
+        conn.execute(
+            "UPDATE pages SET simple_title = 'Abusé en court' WHERE link = 'a.html'"
+        )
+        conn.close()
+        # The next lookup reopens the pool and misses the emptied cache
+        self.assertEqual(catalog.page("a.html").simple_title, "Abusé en court")
+        self.assertEqual((catalog.hits, catalog.misses), (1, 2))
+        catalog.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
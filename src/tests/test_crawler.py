@@ -0,0 +1,62 @@
+import unittest
+
+from arlima.crawler import AsyncScraper
+from arlima.request_pages import CrawlOptions, Scraper, download_pages
+from tests import FIXTURES
+from tests.server import FixtureServer
+
+
+class AsyncCrawlerTest(unittest.TestCase):
+    names = sorted(path.name for path in FIXTURES.glob("*.html"))
+
+    def test_downloads_every_page(self):
+        with FixtureServer() as server:
+            links = [server.url(name) for name in self.names]
+            results = dict(AsyncScraper(concurrency=4)(links))
+        self.assertEqual(sorted(results), sorted(links))
+        for name in self.names:
+            self.assertEqual(
+                results[server.url(name)], FIXTURES.joinpath(name).read_bytes()
+            )
+
+    def test_retries_server_errors(self):
+        with FixtureServer(flaky={"text.html": 2}) as server:
+            link = server.url("text.html")
+            results = dict(AsyncScraper(backoff=0)([link]))
+        self.assertEqual(server.hits["text.html"], 3)
+        self.assertEqual(results[link], FIXTURES.joinpath("text.html").read_bytes())
+
+    def test_error_pages(self):
+        # Both engines give up on a page still failing after the retries, or
+        # missing, rather than returning the error page
+        with FixtureServer(flaky={"text.html": 10}) as server:
+            links = [server.url("text.html"), server.url("missing.html")]
+            results = dict(AsyncScraper(retries=1, backoff=0)(links))
+            self.assertEqual(results, dict.fromkeys(links))
+            scraper = Scraper(backoff=0)
+            self.assertEqual([scraper.fetch(link) for link in links], [None, None])
+
+    def test_rate_limit(self):
+        with FixtureServer() as server:
+            links = [server.url(name) for name in self.names * 4]
+            list(AsyncScraper(concurrency=20, rate=10)(links))
+        # The bucket lets a burst of 10 requests through, then one every 0.1s
+        elapsed = server.times[-1] - server.times[0]
+        self.assertGreaterEqual(elapsed, (len(links) - 10) / 10 - 0.05)
+
+    def test_thread_engine(self):
+        with FixtureServer() as server:
+            links = [server.url(name) for name in self.names]
+            results = dict(download_pages(links, CrawlOptions(fetch_workers=2)))
+        self.assertEqual(sorted(results), sorted(links))
+
+        # The pooled, retrying adapter also serves plain http links
+        with FixtureServer(flaky={"text.html": 2}) as server:
+            link = server.url("text.html")
+            results = dict(download_pages([link], CrawlOptions(fetch_workers=1)))
+        self.assertEqual(server.hits["text.html"], 3)
+        self.assertEqual(results[link], FIXTURES.joinpath("text.html").read_bytes())
+
+
+if __name__ == "__main__":
+    unittest.main()
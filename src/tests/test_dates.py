@@ -0,0 +1,124 @@
+import os
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+import duckdb
+import numpy as np
+
+from arlima.schema import migrate
+from linker.dates import DateIndex, date_index
+
+
+class DateIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        rng = random.Random(0)
+        self.conn = duckdb.connect()
+        migrate(self.conn)
+        rows = []
+        for n in range(2000):
+            earliest = rng.randint(1100, 1550)
+            latest = rng.choice([None, earliest, earliest + rng.randint(1, 150)])
+            rows.append(("{}.html".format(n), earliest, latest))
+        rows.append(("undated.html", None, None))
+        self.conn.executemany(
+            "INSERT INTO pages (link, year_earliest, year_latest) VALUES (?, ?, ?)",
+            rows,
+        )
+        self.index = DateIndex.from_db(self.conn)
+
+    def scan(self, start: int, end: int) -> set[str]:
+        return {
+            row[0]
+            for row in self.conn.execute(
+                "SELECT link FROM pages WHERE year_earliest <= ? "
+                "AND coalesce(year_latest, year_earliest) >= ?",
+                [end, start],
+            ).fetchall()
+        }
+
+    def test_overlapping(self):
+        rng = random.Random(1)
+        ranges = []
+        for _ in range(200):
+            start = rng.randint(1050, 1600)
+            ranges.append((start, start + rng.choice([0, 5, 20, 100])))
+        for start, end in ranges:
+            self.assertEqual(
+                set(self.index.overlapping(start, end)), self.scan(start, end)
+            )
+        self.assertEqual(set(self.index.stabbing(1300)), self.scan(1300, 1300))
+        self.assertEqual(self.index.overlapping(1000, 1050), [])
+
+        # The batched join finds the same pairs, however many are checked at once
+        queries, rows = self.index.join(*zip(*ranges))
+        blocks = list(self.index.join_blocks(*zip(*ranges), block_rows=100))
+        self.assertGreater(len(blocks), 1)
+        self.assertEqual(
+            np.concatenate([q for q, _ in blocks]).tolist(), queries.tolist()
+        )
+        self.assertEqual(np.concatenate([r for _, r in blocks]).tolist(), rows.tolist())
+        self.assertTrue(np.all(np.diff(queries) >= 0))
+        pairs = {(int(q), self.index.links[r]) for q, r in zip(queries, rows)}
+        self.assertEqual(
+            pairs,
+            {(q, link) for q, r in enumerate(ranges) for link in self.scan(*r)},
+        )
+
+    def test_wide_interval(self):
+        # One early and very wide interval only widens the search of its span
+        self.conn.execute(
+            "INSERT INTO pages (link, year_earliest, year_latest) "
+            "VALUES ('wide.html', 900, 1600)"
+        )
+        index = DateIndex.from_db(self.conn)
+        self.assertEqual(index.widths.max(), 700)
+        self.assertLessEqual(index.widths[index.widths < 700].max(), 150)
+        for start, end in [(950, 960), (1300, 1300), (1420, 1500)]:
+            self.assertEqual(set(index.overlapping(start, end)), self.scan(start, end))
+        self.assertIn("wide.html", index.stabbing(1300))
+
+    def test_block(self):
+        block = self.index.block(
+            ["w1", "w2", "w3"], [1320, None, 1410], [None, 1400, 1420], slack=10
+        )
+        self.assertEqual(block.column_names, ["id", "link"])
+        self.assertEqual(
+            {(row["id"], row["link"]) for row in block.to_pylist()},
+            {("w1", link) for link in self.scan(1310, 1330)}
+            | {("w3", link) for link in self.scan(1400, 1430)},
+        )
+        # A block joins in DuckDB like any other
+        self.conn.register("date_block", block)
+        (pairs,) = self.conn.execute(
+            "SELECT count(*) FROM date_block JOIN pages USING (link)"
+        ).fetchone()
+        self.assertEqual(pairs, block.num_rows)
+
+    def test_saved_index(self):
+        path = Path(tempfile.mkdtemp()).joinpath("dates.parquet")
+        db = path.with_name("arlima.db")
+        db.touch()
+        index = date_index(self.conn, db, path)
+        self.assertTrue(path.exists())
+        loaded = date_index(self.conn, db, path)
+        self.assertEqual(loaded.links, index.links)
+        self.assertEqual(loaded.overlapping(1350, 1420), index.overlapping(1350, 1420))
+
+        # Writes still in the write-ahead log count as changes too
+        self.conn.execute(
+            "INSERT INTO pages (link, year_earliest) VALUES ('new.html', 1000)"
+        )
+        wal = db.with_name("arlima.db.wal")
+        wal.touch()
+        later = path.stat().st_mtime + 10
+        os.utime(wal, (later, later))
+        self.assertEqual(date_index(self.conn, db, path).stabbing(1000), ["new.html"])
+
+        empty = DateIndex.from_db(self.conn, "(SELECT * FROM pages LIMIT 0)")
+        self.assertEqual(empty.join([1300], [1400])[0].tolist(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+from arlima.error_log import collect_errors
+from arlima.extract import extract_page
+from arlima.page import Page
+from tests import FIXTURES
+
+
+class ExtractTest(unittest.TestCase):
+    def read(self, name: str) -> bytes:
+        return FIXTURES.joinpath(name).read_bytes()
+
+    def test_text_page(self):
+        data = extract_page(self.read("text.html"))
+        self.assertTrue(data.is_text)
+        self.assertTrue(data.has_bib_table)
+        self.assertEqual(data.title, "Abuzé en court")
+        self.assertEqual(
+            data.permalinks,
+            [
+                "https://arlima.net/no/1553",
+                "https://jonas.irht.cnrs.fr/oeuvre/4012",
+            ],
+        )
+        self.assertEqual(
+            sorted(data.cells), ["date", "forme", "genre", "langue", "titre"]
+        )
+        self.assertEqual(data.cells["date"], "Seconde moitié du XVe siècle")
+        self.assertEqual(len(list(data.mss.iter("li"))), 4)
+
+    def test_author_page(self):
+        self.assertFalse(extract_page(self.read("author.html")).is_text)
+
+    def test_work_page(self):
+        self.assertFalse(extract_page(self.read("work.html")).is_text)
+
+    def test_page_without_bib_table(self):
+        data = extract_page(self.read("no_bib_table.html"))
+        self.assertTrue(data.is_text)
+        self.assertFalse(data.has_bib_table)
+        self.assertEqual(data.cells, {})
+        self.assertEqual(len(list(data.mss.iter("li"))), 1)
+
+    def test_mss_list_after_bold_marker(self):
+        data = extract_page(self.read("odd_manuscripts.html"))
+        self.assertTrue(data.has_bib_table)
+        self.assertEqual(len(list(data.mss.iter("li"))), 4)
+
+    def test_page_dict(self):
+        page = Page(link="text", content=self.read("text.html"))
+        row = page.dict()
+        self.assertEqual(list(row), Page.fields())
+        self.assertEqual(
+            row["jonas_permalink"], "https://jonas.irht.cnrs.fr/oeuvre/4012"
+        )
+        self.assertEqual(row["date_earliest"], 1450)
+        self.assertEqual(row["date_latest"], 1500)
+
+    def test_unparsed_date(self):
+        # A description without any year is logged, and both years are empty
+        content = self.read("text.html").replace(
+            "Seconde moitié du XVe siècle".encode(), "Sans date".encode()
+        )
+        page = Page(link="text", content=content)
+        with collect_errors() as errors:
+            row = page.dict()
+        self.assertEqual((row["date_earliest"], row["date_latest"]), (None, None))
+        self.assertEqual(
+            [(e.stage, e.entry) for e in errors], [("date_parsing", "Sans date")]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
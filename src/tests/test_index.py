@@ -0,0 +1,75 @@
+import tempfile
+import unittest
+from pathlib import Path
+from string import ascii_lowercase
+
+import duckdb
+
+from arlima.request_index import request_index
+from tests import FIXTURES
+from tests.server import FixtureServer
+
+# An index page of one letter, to fill with its letter and links
+INDEX = FIXTURES.joinpath("index.tmpl").read_text()
+
+
+class RequestIndexTest(unittest.TestCase):
+    def test_request_index(self):
+        site = Path(tempfile.mkdtemp())
+        for letter in ascii_lowercase:
+            # One page per letter, and one listed under every letter
+            links = '<a href="/{0}.html">{0}</a>\n<a href="/shared.html">{0}</a>'
+            site.joinpath("{}.html".format(letter)).write_text(
+                INDEX.format(letter=letter.upper(), links=links.format(letter))
+            )
+        site.joinpath("q.html").unlink()
+        site.joinpath("x.html").write_text("<html><body></body></html>")
+
+        conn = duckdb.connect()
+        with FixtureServer(directory=site) as server:
+            api = server.url("{}.html")
+            failed = request_index(conn, api=api, workers=4)
+            prefix = server.url("")
+            self.assertEqual(failed, ["q", "x"])
+            rows = conn.execute("SELECT title, link FROM arlima_index").fetchall()
+            self.assertEqual(len(rows), 24 + 1)
+            self.assertIn(("a", prefix + "shared.html"), rows)
+            self.assertIn(("z", prefix + "z.html"), rows)
+
+            # A letter that fails keeps its previous links, one that is
+            # crawled again loses the links it no longer lists
+            site.joinpath("b.html").unlink()
+            site.joinpath("c.html").write_text(INDEX.format(letter="C", links=""))
+            self.assertEqual(request_index(conn, api=api, workers=4), ["b", "q", "x"])
+            links = {
+                row[0]
+                for row in conn.execute("SELECT link FROM arlima_index").fetchall()
+            }
+            self.assertIn(prefix + "b.html", links)
+            self.assertNotIn(prefix + "c.html", links)
+            self.assertEqual(len(links), 24)
+
+            # Entries without a letter, from before the column, are only kept
+            # while some letter fails
+            conn.execute(
+                "INSERT INTO arlima_index VALUES ('old', ?, NULL)",
+                [prefix + "old.html"],
+            )
+            request_index(conn, api=api, workers=4)
+            self.assertIn(
+                (prefix + "old.html",),
+                conn.table("arlima_index").project("link").fetchall(),
+            )
+            for letter in "bqx":
+                site.joinpath("{}.html".format(letter)).write_text(
+                    INDEX.format(letter=letter.upper(), links="")
+                )
+            self.assertEqual(request_index(conn, api=api, workers=4), [])
+            self.assertNotIn(
+                (prefix + "old.html",),
+                conn.table("arlima_index").project("link").fetchall(),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
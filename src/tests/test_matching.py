@@ -0,0 +1,91 @@
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+import duckdb
+
+from linker.match import match_witnesses
+
+LIBRARIES = [
+    ("Paris", "Bibliothèque nationale de France", ["fr.", "nouv. acq. fr."]),
+    ("London", "British Library", ["Royal", "Harley", "Additional"]),
+    ("Bruxelles", "Bibliothèque royale", [None]),
+    ("Oxford", "Bodleian Library", ["Douce", "Digby"]),
+]
+
+
+class MatchingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        rng = random.Random(0)
+        self.conn = duckdb.connect()
+        self.conn.execute("""
+            CREATE TABLE manuscripts (
+                page VARCHAR, archive_href VARCHAR, settlement VARCHAR,
+                repository VARCHAR, collection VARCHAR, idno VARCHAR
+            )""")
+        manuscripts, witnesses = [], []
+        numbers = rng.sample(range(1, 3000), 400)
+        for n, number in enumerate(numbers):
+            settlement, repository, collections = rng.choice(LIBRARIES)
+            collection = rng.choice(collections)
+            idno = "{}, f. {}r-{}v".format(
+                number, rng.randint(1, 50), rng.randint(51, 99)
+            )
+            page = "https://www.arlima.net/{}.html".format(n)
+            manuscripts.append((page, None, settlement, repository, collection, idno))
+            if n % 4 == 0:
+                # The same shelfmark, as another catalogue spells it
+                witnesses.append(
+                    (
+                        page,
+                        settlement.upper(),
+                        repository.replace("è", "e").lower(),
+                        collection and collection.rstrip("."),
+                        idno.split(",")[0],
+                    )
+                )
+        self.conn.executemany(
+            "INSERT INTO manuscripts VALUES (?, ?, ?, ?, ?, ?)", manuscripts
+        )
+        self.conn.execute("""
+            CREATE TEMP TABLE witnesses (
+                id VARCHAR, settlement VARCHAR, repository VARCHAR,
+                collection VARCHAR, idno VARCHAR
+            )""")
+        self.conn.executemany("INSERT INTO witnesses VALUES (?, ?, ?, ?, ?)", witnesses)
+        self.source = Path(tempfile.mkdtemp()).joinpath("witnesses.parquet")
+        self.conn.execute("COPY witnesses TO '{}' (FORMAT PARQUET)".format(self.source))
+        self.witnesses = len(witnesses)
+
+    def best(self) -> list:
+        return self.conn.execute(
+            "SELECT external_id, page FROM matches WHERE rank = 1"
+        ).fetchall()
+
+    def test_blocking_without_splink(self):
+        rows = match_witnesses(self.conn, self.source, top_k=3, use_splink=False)
+        self.assertLessEqual(rows, 3 * self.witnesses)
+        best = self.best()
+        self.assertEqual(len(best), self.witnesses)
+        self.assertTrue(all(witness == page for witness, page in best))
+        # Far fewer pairs were scored than the cross product, or than all
+        # the manuscripts of each witness's collection
+        candidates = self.conn.execute(
+            "SELECT count(*) FROM link_candidates"
+        ).fetchone()[0]
+        self.assertLess(candidates, self.witnesses * 3)
+
+    def test_splink(self):
+        match_witnesses(self.conn, self.source, top_k=3, max_pairs=1e4)
+        best = self.best()
+        self.assertEqual(len(best), self.witnesses)
+        self.assertTrue(all(witness == page for witness, page in best))
+        unscored = self.conn.execute(
+            "SELECT count(*) FROM matches WHERE match_probability IS NULL"
+        ).fetchone()[0]
+        self.assertEqual(unscored, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
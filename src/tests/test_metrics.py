@@ -0,0 +1,87 @@
+import unittest
+
+import duckdb
+
+from arlima.error_log import setup_errors_table
+from arlima.metrics import CrawlMetrics
+from arlima.request_pages import (
+    CrawlOptions,
+    scrape_pages,
+    setup_hashes_table,
+    setup_pages_table,
+    setup_witnesses_table,
+    write_results,
+)
+from tests import FIXTURES
+from tests.server import FixtureServer
+
+
+class CrawlMetricsTest(unittest.TestCase):
+    def crawl(self, engine: str) -> CrawlMetrics:
+        conn = duckdb.connect()
+        setup_pages_table(conn)
+        setup_witnesses_table(conn)
+        setup_hashes_table(conn)
+        setup_errors_table(conn)
+        metrics = CrawlMetrics()
+        options = CrawlOptions(
+            fetch_workers=2,
+            parse_workers=2,
+            engine=engine,
+            metrics=metrics,
+            run_id="test",
+        )
+        names = sorted(path.name for path in FIXTURES.glob("*.html"))
+        with FixtureServer() as server:
+            links = [server.url(name) for name in names] + [server.url("gone.html")]
+            write_results(
+                conn,
+                scrape_pages(links, options),
+                metrics=metrics,
+                errors="scrape_errors",
+                run_id=options.run_id,
+            )
+        metrics.write(conn, run_id=options.run_id)
+        self.rows = dict(
+            conn.execute(
+                "SELECT name, count FROM crawl_metrics WHERE run_id = 'test'"
+            ).fetchall()
+        )
+        self.errors = conn.execute("""
+            SELECT error, stage, count(*)
+            FROM scrape_errors
+            WHERE run_id = 'test'
+            GROUP BY ALL
+            """).fetchall()
+        return metrics
+
+    def check(self, metrics: CrawlMetrics) -> None:
+        size = sum(path.stat().st_size for path in FIXTURES.glob("*.html"))
+        self.assertEqual(metrics.counters["bytes_downloaded"], size)
+        self.assertEqual(metrics.counters["text_pages"], 3)
+        self.assertEqual(metrics.counters["non_text_pages"], 2)
+        # The missing page's 404 is a failed download, not parsed
+        self.assertEqual(metrics.counters["failed_downloads"], 1)
+        self.assertEqual(metrics.counters["error:DownloadException"], 1)
+        self.assertEqual(metrics.counters["witnesses"], 7)
+        self.assertEqual(metrics.histograms["download"].count, 6)
+        self.assertEqual(metrics.histograms["parse"].count, 5)
+        self.assertEqual(metrics.histograms["insert"].count, 6)
+        # The page without bibliography table logs why it lacks a date
+        self.assertGreater(metrics.counters["error:BiblioException"], 0)
+        self.assertEqual(self.rows["text_pages"], 3)
+        self.assertEqual(self.rows["download"], 6)
+        # Every error counted is stored with its stage
+        for error, stage, count in self.errors:
+            self.assertEqual(metrics.counters["error:" + error], count)
+        self.assertIn(("DownloadException", "download", 1), self.errors)
+
+    def test_threads(self):
+        self.check(self.crawl("threads"))
+
+    def test_async(self):
+        self.check(self.crawl("async"))
+
+
+if __name__ == "__main__":
+    unittest.main()
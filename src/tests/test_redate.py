@@ -0,0 +1,46 @@
+import unittest
+
+import duckdb
+import pyarrow as pa
+
+from arlima.date_parser import DateParser
+from arlima.redate import redate_pages, year_bounds
+from arlima.schema import migrate
+
+
+class UnparsableDateTest(unittest.TestCase):
+    def test_century_without_year(self):
+        # XX is missing from CenturyMap: the description gets no years, and
+        # is counted and logged rather than aborting the batch
+        parser = DateParser()
+        with self.assertLogs("arlima.date_parser", "WARNING") as logs:
+            self.assertEqual(parser.bounds("XXe siècle"), (None, None))
+            self.assertEqual(parser.parse_or_skip("Avant le XXe"), ())
+            earliest, latest = year_bounds(
+                parser, pa.array(["Première moitié du XXe siècle", "1462"])
+            )
+        self.assertEqual(parser.failures, 3)
+        self.assertEqual(len(logs.records), 3)
+        self.assertEqual(
+            (earliest.to_pylist(), latest.to_pylist()), ([None, 1462], [None, None])
+        )
+
+    def test_redate(self):
+        conn = duckdb.connect()
+        migrate(conn)
+        conn.execute(
+            "INSERT INTO pages (link, date_description) "
+            "VALUES ('a.html', 'XIVe siècle'), ('b.html', 'Première moitié du XXe siècle')"
+        )
+        with self.assertLogs("arlima.date_parser", "WARNING"):
+            self.assertEqual(redate_pages(conn), 1)
+        self.assertEqual(
+            conn.execute(
+                "SELECT link, year_earliest FROM pages ORDER BY link"
+            ).fetchall(),
+            [("a.html", 1300), ("b.html", None)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
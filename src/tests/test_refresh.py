@@ -0,0 +1,107 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from string import ascii_lowercase
+
+import duckdb
+
+from arlima.refresh import refresh_pages
+from arlima.request_index import request_index
+from arlima.request_pages import CrawlOptions, request_pages
+from tests import FIXTURES
+from tests.server import FixtureServer
+
+# An index page of one letter, to fill with its letter and links
+INDEX = FIXTURES.joinpath("index.tmpl").read_text()
+
+
+class RefreshTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.site = Path(tempfile.mkdtemp())
+        for page in FIXTURES.glob("*.html"):
+            shutil.copy(page, self.site.joinpath(page.name))
+        self.options = CrawlOptions(fetch_workers=2, parse_workers=2)
+        self.conn = duckdb.connect()
+
+    def write_index(self, index: dict) -> None:
+        for letter in ascii_lowercase:
+            links = "\n".join(
+                '<a href="/{}">{}</a>'.format(name, name)
+                for name in index.get(letter, ["author.html"])
+            )
+            self.site.joinpath("{}.html".format(letter)).write_text(
+                INDEX.format(letter=letter.upper(), links=links)
+            )
+
+    def titles(self) -> dict:
+        rows = self.conn.execute("SELECT link, simple_title FROM pages").fetchall()
+        return {link.rsplit("/", 1)[-1]: title for link, title in rows}
+
+    def test_refresh(self):
+        self.write_index({"a": ["text.html", "odd_manuscripts.html"]})
+        with FixtureServer(directory=self.site) as server:
+            api = server.url("{}.html")
+            request_index(self.conn, api=api)
+            request_pages(self.conn, self.options)
+            self.assertEqual(
+                sorted(self.titles()), ["odd_manuscripts.html", "text.html"]
+            )
+
+            # Drop one text, add another and edit the remaining one
+            self.write_index({"a": ["text.html"], "d": ["no_bib_table.html"]})
+            text = self.site.joinpath("text.html")
+            text.write_text(text.read_text().replace("Abuzé en court", "Abuzé"))
+            server.hits.clear()
+            refresh_pages(self.conn, self.options, api=api)
+
+        self.assertEqual(
+            self.titles(),
+            {
+                "text.html": "Abuzé",
+                "no_bib_table.html": "Dit des trois morts et des trois vifs",
+            },
+        )
+        manuscripts = self.conn.execute(
+            "SELECT count(*) FROM manuscripts GROUP BY page ORDER BY page"
+        ).fetchall()
+        self.assertEqual(manuscripts, [(1,), (3,)])
+        # The unchanged author page was downloaded but not stored twice
+        hashes = self.conn.execute(
+            "SELECT link, count(*) FROM page_hashes GROUP BY link HAVING count(*) > 1"
+        ).fetchall()
+        self.assertEqual(hashes, [])
+
+    def test_failures(self):
+        self.write_index(
+            {"a": ["text.html", "odd_manuscripts.html"], "d": ["no_bib_table.html"]}
+        )
+        with FixtureServer(directory=self.site) as server:
+            api = server.url("{}.html")
+            request_index(self.conn, api=api)
+            request_pages(self.conn, self.options)
+            titles = self.titles()
+            digests = dict(
+                self.conn.execute("SELECT link, digest FROM page_hashes").fetchall()
+            )
+
+            # The index page of d fails, a text is dropped from a, and the
+            # other one can no longer be parsed
+            self.write_index({"a": ["text.html"]})
+            self.site.joinpath("d.html").unlink()
+            self.site.joinpath("text.html").write_bytes(b"")
+            refresh_pages(self.conn, self.options, api=api)
+
+        del titles["odd_manuscripts.html"]
+        self.assertEqual(self.titles(), titles)
+        self.assertEqual(
+            self.conn.execute(
+                "SELECT digest FROM page_hashes WHERE link = ?",
+                [server.url("text.html")],
+            ).fetchall(),
+            [(digests[server.url("text.html")],)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
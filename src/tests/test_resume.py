@@ -0,0 +1,127 @@
+import unittest
+
+import duckdb
+
+from arlima.error_log import setup_errors_table
+from arlima.request_pages import (
+    CrawlOptions,
+    parse_pages,
+    pending_links,
+    request_pages,
+    scrape_pages,
+    setup_hashes_table,
+    setup_pages_table,
+    setup_state_table,
+    setup_witnesses_table,
+    write_results,
+)
+from tests import FIXTURES
+from tests.server import FixtureServer
+
+
+def crash_after(results, n: int):
+    for i, result in enumerate(results):
+        if i == n:
+            raise KeyboardInterrupt
+        yield result
+
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.options = CrawlOptions(fetch_workers=2, parse_workers=2)
+        self.names = sorted(path.name for path in FIXTURES.glob("*.html"))
+
+    def index(self, conn: duckdb.DuckDBPyConnection, server: FixtureServer) -> None:
+        conn.execute("CREATE TABLE arlima_index (title VARCHAR, link VARCHAR)")
+        conn.executemany(
+            "INSERT INTO arlima_index VALUES (?, ?)",
+            [(name, server.url(name)) for name in self.names],
+        )
+
+    def rows(self, conn: duckdb.DuckDBPyConnection) -> dict:
+        return {
+            table: sorted(conn.table(table).fetchall())
+            for table in ("pages", "manuscripts", "page_hashes")
+        }
+
+    def test_resume(self):
+        with FixtureServer() as server:
+            conn = duckdb.connect()
+            self.index(conn, server)
+            request_pages(conn, self.options)
+            expected = self.rows(conn)
+
+            # Interrupt a crawl after three pages, two of them checkpointed
+            conn = duckdb.connect()
+            self.index(conn, server)
+            setup_pages_table(conn)
+            setup_witnesses_table(conn)
+            setup_hashes_table(conn)
+            setup_state_table(conn)
+            links = [server.url(name) for name in self.names]
+            with self.assertRaises(KeyboardInterrupt):
+                write_results(
+                    conn,
+                    crash_after(scrape_pages(links, self.options), 3),
+                    state="crawl_state",
+                    checkpoint=2,
+                )
+            statuses = dict(
+                conn.execute(
+                    "SELECT status, count(*) FROM crawl_state GROUP BY ALL"
+                ).fetchall()
+            )
+            self.assertEqual(statuses, {"done": 2, "pending": len(self.names) - 2})
+            self.assertEqual(conn.table("page_hashes").count("*").fetchone()[0], 2)
+
+            server.hits.clear()
+            request_pages(conn, self.options, resume=True)
+            self.assertEqual(sum(server.hits.values()), len(self.names) - 2)
+        self.assertEqual(self.rows(conn), expected)
+        self.assertEqual(
+            conn.execute("SELECT DISTINCT status FROM crawl_state").fetchall(),
+            [("done",)],
+        )
+
+    def test_failed_downloads(self):
+        conn = duckdb.connect()
+        conn.execute("CREATE TABLE arlima_index (title VARCHAR, link VARCHAR)")
+        conn.execute(
+            "INSERT INTO arlima_index VALUES ('Text', 'text.html'), ('Gone', 'gone.html')"
+        )
+        setup_pages_table(conn)
+        setup_witnesses_table(conn)
+        setup_hashes_table(conn)
+        setup_state_table(conn)
+        setup_errors_table(conn)
+        contents = [
+            ("gone.html", None),
+            ("text.html", FIXTURES.joinpath("text.html").read_bytes()),
+        ]
+        links = write_results(
+            conn,
+            parse_pages(iter(contents), self.options),
+            errors="scrape_errors",
+            run_id="run",
+            state="crawl_state",
+        )
+        self.assertEqual(links, ["text.html"])
+        self.assertEqual(
+            conn.execute(
+                "SELECT link, status FROM crawl_state ORDER BY link"
+            ).fetchall(),
+            [("gone.html", "failed"), ("text.html", "done")],
+        )
+        self.assertEqual(
+            conn.execute("SELECT link FROM page_hashes").fetchall(), [("text.html",)]
+        )
+        self.assertIn(
+            ("gone.html", "download", "DownloadException"),
+            conn.execute("SELECT link, stage, error FROM scrape_errors").fetchall(),
+        )
+        # Resuming tries the failed page again
+        self.assertEqual(pending_links(conn), ["gone.html"])
+
+
+if __name__ == "__main__":
+    unittest.main()
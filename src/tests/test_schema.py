@@ -0,0 +1,60 @@
+import unittest
+
+import duckdb
+
+from arlima.schema import MIGRATIONS, migrate, reset_tables
+
+
+class MigrateTest(unittest.TestCase):
+    def test_legacy_database(self):
+        # Tables as the scraper made them before keys and the shelfmark columns
+        conn = duckdb.connect()
+        conn.execute("CREATE TABLE arlima_index (title VARCHAR, link VARCHAR)")
+        conn.execute(
+            "INSERT INTO arlima_index VALUES ('B', 'b.html'), ('A', 'a.html'), ('B', 'b.html')"
+        )
+        conn.execute(
+            "CREATE TABLE manuscripts (page VARCHAR, archive_href VARCHAR, settlement VARCHAR, repository VARCHAR, collection VARCHAR, idno VARCHAR)"
+        )
+        conn.execute(
+            "INSERT INTO manuscripts VALUES ('b.html', NULL, 'Paris', 'BnF', 'fr.', '1553')"
+        )
+
+        self.assertEqual(migrate(conn), MIGRATIONS[-1].version)
+        self.assertEqual(
+            conn.execute("SELECT link FROM arlima_index").fetchall(),
+            [("a.html",), ("b.html",)],
+        )
+        self.assertEqual(
+            conn.execute("SELECT idno, shelfmark FROM manuscripts").fetchall(),
+            [("1553", None)],
+        )
+        with self.assertRaises(duckdb.ConstraintException):
+            conn.execute("INSERT INTO arlima_index VALUES ('A', 'a.html', 'a')")
+        indexes = conn.execute(
+            "SELECT index_name FROM duckdb_indexes() ORDER BY 1"
+        ).fetchall()
+        self.assertEqual(indexes, [("manuscripts_page",), ("manuscripts_place",)])
+
+        # Nothing is left to apply the second time
+        versions = conn.execute("SELECT count(*) FROM schema_version").fetchone()
+        self.assertEqual(migrate(conn), MIGRATIONS[-1].version)
+        self.assertEqual(
+            conn.execute("SELECT count(*) FROM schema_version").fetchone(), versions
+        )
+
+    def test_reset_tables(self):
+        conn = duckdb.connect()
+        migrate(conn)
+        conn.execute("INSERT INTO pages (link) VALUES ('a.html')")
+        conn.execute("INSERT INTO crawl_state VALUES ('a.html', 'done', NULL, NULL)")
+        # A table that cannot be emptied leaves the others as they were
+        with self.assertRaises(duckdb.CatalogException):
+            reset_tables(conn, "pages", "crawl_state", "missing")
+        self.assertEqual(conn.table("pages").count("*").fetchone(), (1,))
+        reset_tables(conn, "pages", "crawl_state")
+        self.assertEqual(conn.table("crawl_state").count("*").fetchone(), (0,))
+
+
+if __name__ == "__main__":
+    unittest.main()
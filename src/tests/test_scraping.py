@@ -21,8 +21,8 @@ class ScrapingTest(unittest.TestCase):
         page = self.scraper(link=link)
         # Problem: This page's "éditions anciennes" are being mistaken for manuscripts
         # and due to the miscategorization, the parsing of information is faulty.
-        for li in page.mss.find_all("li"):
-            if li.find("a"):
+        for li in page.mss.iter("li"):
+            if next(li.iter("a"), None) is not None:
                 print("")
                 print(li)
                 pprint(Witness(li=li, page="").__dict__())
@@ -0,0 +1,146 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import duckdb
+
+from arlima.error_log import setup_errors_table
+from arlima.request_index import request_index
+from arlima.request_pages import CrawlOptions, request_pages
+from arlima.shards import merge_shards, shard_path
+from tests import FIXTURES, SRC_DIR
+from tests.server import FixtureServer
+
+# One shard's crawl, as `arlima.main --shard i/N` runs it on its machine
+SHARD = """
+import sys
+from pathlib import Path
+
+import duckdb
+
+from arlima.request_index import request_index
+from arlima.request_pages import CrawlOptions, request_pages
+from arlima.shards import shard_path
+
+api, root, index, count = sys.argv[1], Path(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])
+conn = duckdb.connect(str(shard_path(index, count, root)))
+request_index(conn, api=api)
+request_pages(conn, CrawlOptions(fetch_workers=2, parse_workers=1), shard=(index, count))
+"""
+
+INDEX = "<html><body><div><h3>{}</h3>{}</div></body></html>"
+
+
+class ShardTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.site = Path(tempfile.mkdtemp())
+        # A quote in the path must not break the shards' ATTACH
+        self.root = Path(tempfile.mkdtemp(suffix="'s"))
+        names = sorted(path.name for path in FIXTURES.glob("*.html"))
+        for name in names:
+            # Enough copies of each fixture for every shard to get some
+            for copy in range(4):
+                self.site.joinpath("{}-{}".format(copy, name)).write_bytes(
+                    FIXTURES.joinpath(name).read_bytes()
+                )
+        links = "".join(
+            '<a href="/{0}-{1}">{1}</a>'.format(copy, name)
+            for copy in range(4)
+            for name in names
+        )
+        for letter in "abcdefghijklmnopqrstuvwxyz":
+            self.site.joinpath("{}.html".format(letter)).write_text(
+                INDEX.format(letter.upper(), links)
+            )
+
+    def rows(self, conn: duckdb.DuckDBPyConnection) -> dict:
+        return {
+            table: sorted(conn.table(table).fetchall())
+            for table in ("pages", "manuscripts", "page_hashes")
+        }
+
+    def test_merge(self):
+        count = 3
+        env = dict(os.environ, PYTHONPATH=str(SRC_DIR))
+        with FixtureServer(directory=self.site) as server:
+            api = server.url("{}.html")
+            shards = [
+                subprocess.Popen(
+                    [
+                        sys.executable,
+                        "-c",
+                        SHARD,
+                        api,
+                        str(self.root),
+                        str(i),
+                        str(count),
+                    ],
+                    env=env,
+                    stdout=subprocess.DEVNULL,
+                )
+                for i in range(count)
+            ]
+            for shard in shards:
+                self.assertEqual(shard.wait(timeout=120), 0)
+
+            whole = duckdb.connect()
+            request_index(whole, api=api)
+            request_pages(whole, CrawlOptions(fetch_workers=2, parse_workers=2))
+
+        paths = [shard_path(i, count, self.root) for i in range(count)]
+        sizes = []
+        for path in paths:
+            shard = duckdb.connect(str(path), read_only=True)
+            sizes.append(shard.table("crawl_state").count("*").fetchone()[0])
+            shard.close()
+        self.assertEqual(sum(sizes), 20)
+        self.assertTrue(all(sizes))
+
+        conn = duckdb.connect()
+        setup_errors_table(conn)
+        conn.execute(
+            "INSERT INTO scrape_errors VALUES ('earlier', 'a.html', 'parse', NULL, NULL, 'X')"
+        )
+        self.assertEqual(merge_shards(conn, paths), 12)
+        self.assertEqual(self.rows(conn), self.rows(whole))
+        errors = conn.table("scrape_errors").count("*").fetchone()[0]
+        self.assertEqual(
+            errors, whole.table("scrape_errors").count("*").fetchone()[0] + 1
+        )
+        # Merging again replaces the rows rather than adding to them, and
+        # keeps the errors of earlier runs
+        self.assertEqual(merge_shards(conn, paths), 12)
+        self.assertEqual(self.rows(conn), self.rows(whole))
+        self.assertEqual(conn.table("scrape_errors").count("*").fetchone()[0], errors)
+
+        # A link that failed does not hold up the merge, one still pending does
+        shard = duckdb.connect(str(paths[1]))
+        link = shard.execute("SELECT min(link) FROM crawl_state").fetchone()[0]
+        shard.execute("UPDATE crawl_state SET status = 'failed' WHERE link = ?", [link])
+        shard.close()
+        conn = duckdb.connect()
+        merge_shards(conn, paths)
+        self.assertEqual(
+            conn.execute(
+                "SELECT link FROM crawl_state WHERE status = 'failed'"
+            ).fetchall(),
+            [(link,)],
+        )
+        shard = duckdb.connect(str(paths[1]))
+        shard.execute(
+            "UPDATE crawl_state SET status = 'pending' WHERE link = ?", [link]
+        )
+        shard.close()
+        with self.assertRaisesRegex(ValueError, "1 are still pending"):
+            merge_shards(duckdb.connect(), paths)
+
+        # A missing shard is refused
+        with self.assertRaisesRegex(ValueError, "missing \\[1\\]"):
+            merge_shards(duckdb.connect(), [paths[0], paths[2]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import duckdb
+
+from arlima.page import Page
+from arlima.request_pages import setup_witnesses_table
+from arlima.witness import parse_witnesses
+from linker.shelfmarks import ShelfmarkIndex
+from tests import FIXTURES
+
+
+class ShelfmarkIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.conn = duckdb.connect()
+        setup_witnesses_table(self.conn)
+        for name in ("text.html", "odd_manuscripts.html", "no_bib_table.html"):
+            page = Page(link=name, content=FIXTURES.joinpath(name).read_bytes())
+            self.conn.executemany(
+                "INSERT INTO manuscripts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                parse_witnesses(page.mss, page.link),
+            )
+        self.witnesses = self.conn.execute(
+            "SELECT page, settlement, repository, collection, idno, shelfmark"
+            " FROM manuscripts WHERE shelfmark IS NOT NULL"
+        ).fetchall()
+
+    def test_exact_lookup(self):
+        index = ShelfmarkIndex.from_db(self.conn)
+        # Shelfmarks as a catalogue would cite them
+        for shelfmark, settlement, repository, idno in [
+            ("fr. 1553", "Paris", "BnF", "fr., 1553, f. 1r-10v"),
+            ("Royal 20 D. XI", "London", "British Library", "20. D. XI, f. 77rc-79ra"),
+            ("9176-9177", "Bruxelles", None, "9176-9177, f, 1r-24v, XV, XIV"),
+            ("A.I.32", "LIEGE", None, "A. I. 32, f. 163r, 2/2 XV"),
+        ]:
+            matches = index.lookup(
+                shelfmark, settlement=settlement, repository=repository
+            )
+            self.assertEqual([(m.idno, m.score) for m in matches], [(idno, 100)])
+
+    def test_unknown_repository_widens_to_settlement(self):
+        index = ShelfmarkIndex.from_db(self.conn)
+        page, settlement, repository, collection, idno, shelfmark = self.witnesses[0]
+        matches = index.lookup(shelfmark, settlement=settlement, repository="?")
+        self.assertIn(page, [m.page for m in matches])
+        # A known repository is enough without its settlement
+        matches = index.lookup(shelfmark, repository=repository)
+        self.assertIn(page, [m.page for m in matches])
+        self.assertEqual(index.lookup(shelfmark, settlement="Nowhere"), [])
+
+    def test_saved_index(self):
+        path = Path(tempfile.mkdtemp()).joinpath("shelfmarks")
+        ShelfmarkIndex.from_db(self.conn).save(path)
+        index = ShelfmarkIndex.load(path)
+        shelfmark = self.witnesses[0][5]
+        # One character off still finds the manuscript, through its n-grams
+        fuzzy = index.lookup(shelfmark + "x", cutoff=70)
+        self.assertEqual(fuzzy[0].page, self.witnesses[0][0])
+        self.assertLess(fuzzy[0].score, 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
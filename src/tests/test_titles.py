@@ -0,0 +1,47 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import duckdb
+import numpy as np
+
+from arlima.page import Page
+from arlima.request_pages import setup_pages_table
+from linker.titles import TitleIndex
+from tests import FIXTURES
+
+
+class TitleIndexTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.conn = duckdb.connect()
+        setup_pages_table(self.conn)
+        for name in ("text.html", "odd_manuscripts.html", "no_bib_table.html"):
+            page = Page(link=name, content=FIXTURES.joinpath(name).read_bytes())
+            self.conn.execute(
+                "INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                page.record(),
+            )
+
+    def test_search(self):
+        index = TitleIndex.from_db(self.conn)
+        queries = ["Abuse en cour", "dit des .III. mors et des .III. vis", "zzz"]
+        results = index.search(queries, k=1)
+        self.assertEqual(
+            [[match.link for match in matches] for matches in results],
+            [["text.html"], ["no_bib_table.html"], []],
+        )
+
+    def test_saved_index(self):
+        path = Path(tempfile.mkdtemp()).joinpath("titles")
+        index = TitleIndex.from_db(self.conn)
+        index.save(path)
+        # Saving again replaces the index
+        index.save(path)
+        loaded = TitleIndex.load(path)
+        self.assertIsInstance(loaded.postings, np.memmap)
+        queries = ["abuzé en court", "Dit des trois mors"]
+        self.assertEqual(loaded.search(queries), index.search(queries))
+
+
+if __name__ == "__main__":
+    unittest.main()